@@ -0,0 +1,173 @@
+"""
+Generate a synthetic repository of encrypted secrets for benchmarking.
+
+    $ python benchmarks/generate.py /tmp/secrets --secrets 500 --depth 4
+    $ python benchmarks/generate.py /tmp/secrets --directories 0.5 --armour 0
+
+A throwaway key is created in a new GNUPGHOME (`<directory>/gnupg` unless
+--homedir is given) and every secret is encrypted to it. The repository is
+written to `<directory>/repository` with a .gitignore covering every
+decrypted path. The layout is chosen by a seeded random generator, so the
+same options always produce the same shape.
+"""
+
+import argparse
+import pathlib
+import random
+import string
+import subprocess
+import typing
+
+import attr
+
+from fidelius.gpg import GPG
+from fidelius.utils import concurrently
+
+RECIPIENT = 'benchmark@fidelius.invalid'
+ALPHABET = string.ascii_letters + string.digits + '\n'
+
+
+@attr.s(frozen=True)
+class Shape:
+    """The shape of a generated repository."""
+
+    secrets: int = attr.ib(default=100)
+    directories: float = attr.ib(default=0.25)
+    depth: int = attr.ib(default=3)
+    width: int = attr.ib(default=4)
+    size: int = attr.ib(default=256)
+    armour: float = attr.ib(default=0.5)
+    noise: int = attr.ib(default=100)
+    seed: int = attr.ib(default=0)
+
+
+@attr.s(frozen=True)
+class Generated:
+    """A generated repository and the keyring that can decrypt it."""
+
+    repository: pathlib.Path = attr.ib()
+    home: pathlib.Path = attr.ib()
+    recipient: str = attr.ib(default=RECIPIENT)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add options describing a `Shape` to a parser."""
+    defaults = Shape()
+    group = parser.add_argument_group('repository shape')
+    group.add_argument('--secrets', type=int, default=defaults.secrets,
+                       help="number of encrypted secrets")
+    group.add_argument('--directories', type=float, default=defaults.directories,
+                       help="fraction of secrets in '.encrypted' directories")
+    group.add_argument('--depth', type=int, default=defaults.depth,
+                       help="maximum nesting depth of secrets")
+    group.add_argument('--width', type=int, default=defaults.width,
+                       help="subdirectories at each level")
+    group.add_argument('--size', type=int, default=defaults.size,
+                       help="maximum plaintext size in bytes")
+    group.add_argument('--armour', type=float, default=defaults.armour,
+                       help="fraction of secrets using '.asc' rather than '.gpg'")
+    group.add_argument('--noise', type=int, default=defaults.noise,
+                       help="number of unrelated files to scatter through the tree")
+    group.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def shape_from_arguments(args: argparse.Namespace) -> Shape:
+    return Shape(**{a.name: getattr(args, a.name) for a in attr.fields(Shape)})
+
+
+def generate_key(home: pathlib.Path) -> GPG:
+    """Create a keyring containing a single key without a passphrase."""
+    home.mkdir(mode=0o700, parents=True, exist_ok=True)
+    subprocess.run(
+        ('gpg', '--batch', '--homedir', home.as_posix(),
+         '--pinentry-mode', 'loopback', '--passphrase', '',
+         '--quick-generate-key', f'Fidelius Benchmark <{RECIPIENT}>',
+         'future-default', 'default', 'never'),
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return GPG(home=home)
+
+
+def stop_agent(home: pathlib.Path) -> None:
+    """Stop the gpg-agent started for a keyring."""
+    subprocess.run(('gpgconf', '--homedir', home.as_posix(), '--kill', 'all'))
+
+
+def layout(shape: Shape) -> typing.Tuple[typing.List[typing.Tuple[pathlib.PurePosixPath, str]],
+                                         typing.List[pathlib.PurePosixPath],
+                                         typing.List[str]]:
+    """
+    Choose paths for every secret and noise file.
+
+    Returns the encrypted paths with their plaintext, the noise paths, and
+    the lines of a .gitignore file that excludes every decrypted path.
+    """
+    rng = random.Random(shape.seed)
+
+    def parent() -> pathlib.PurePosixPath:
+        depth = rng.randint(0, shape.depth)
+        return pathlib.PurePosixPath(
+            *(f'level{level}-{rng.randrange(shape.width)}' for level in range(depth)))
+
+    secrets = []
+    ignore = {'*.decrypted.*'}
+    for index in range(shape.secrets):
+        suffix = '.asc' if rng.random() < shape.armour else '.gpg'
+        text = ''.join(rng.choices(ALPHABET, k=rng.randint(1, shape.size)))
+        directory = parent()
+        if rng.random() < shape.directories:
+            group = directory / f'group{rng.randrange(shape.width)}'
+            ignore.add(f'/{group}/')
+            path = directory / f'{group.name}.encrypted' / f'secret{index}.txt{suffix}'
+        else:
+            path = directory / f'secret{index}.encrypted.txt{suffix}'
+        secrets.append((path, text))
+
+    noise = [parent() / f'file{index}.txt' for index in range(shape.noise)]
+    return secrets, noise, sorted(ignore)
+
+
+def generate(
+        directory: pathlib.Path,
+        shape: Shape,
+        home: typing.Optional[pathlib.Path] = None,
+        jobs: typing.Optional[int] = None) -> Generated:
+    """Generate a repository of secrets with the given shape in a directory."""
+    home = home or directory / 'gnupg'
+    repository = directory / 'repository'
+    gpg = generate_key(home)
+
+    repository.mkdir(parents=True)
+    subprocess.run(('git', 'init', '-q', repository.as_posix()), check=True)
+
+    secrets, noise, ignore = layout(shape)
+    (repository / '.gitignore').write_text(''.join(f'{line}\n' for line in ignore))
+    for path in noise:
+        (repository / path).parent.mkdir(parents=True, exist_ok=True)
+        (repository / path).write_text(f'{path}\n')
+
+    def encrypt(secret: typing.Tuple[pathlib.PurePosixPath, str]) -> None:
+        path, text = secret
+        (repository / path).parent.mkdir(parents=True, exist_ok=True)
+        gpg.encrypt_text(repository / path, text, path.suffix == '.asc', [RECIPIENT])
+
+    for _ in concurrently(encrypt, secrets, jobs):
+        pass
+
+    return Generated(repository=repository, home=home)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory', type=pathlib.Path)
+    parser.add_argument('--homedir', type=pathlib.Path)
+    parser.add_argument('--jobs', type=int)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    generated = generate(args.directory, shape_from_arguments(args), args.homedir, args.jobs)
+    print(f"Generated {args.secrets} secrets in {generated.repository}")
+    print(f"Use GNUPGHOME={generated.home} to decrypt them")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Measure how long the fidelius command takes to start.
+
+    $ python benchmarks/startup.py --runs 20 -- version
+    $ python benchmarks/startup.py --output startup.json -- -p tests ls
+
+Results are written as JSON so they can be compared between versions.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import typing
+
+
+def measure(arguments: typing.Sequence[str], runs: int) -> typing.List[float]:
+    command = (sys.executable, '-m', 'fidelius', *arguments)
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)  # Warm up.
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarise(timings: typing.Sequence[float]) -> typing.Dict[str, float]:
+    return {
+        'runs': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('arguments', nargs='*', default=['version'])
+    args = parser.parse_args()
+
+    timings = measure(args.arguments, args.runs)
+    json.dump({
+        'benchmark': 'startup',
+        'arguments': args.arguments,
+        **summarise(timings),
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
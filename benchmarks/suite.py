@@ -0,0 +1,175 @@
+"""
+Time fidelius against a synthetic repository of secrets.
+
+    $ python benchmarks/suite.py --secrets 1000 --output results.json
+    $ python benchmarks/suite.py --only decrypt --only encrypt-unchanged
+
+A repository is generated in a temporary directory (see generate.py for the
+options describing its shape) and each benchmark is timed several times.
+Results are written as JSON so they can be compared between versions.
+"""
+
+import argparse
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import typing
+
+import attr
+
+import fidelius
+from fidelius.gpg import GPG
+from fidelius.incantations import Fidelius
+from fidelius.secrets import SecretKeeper
+
+import generate
+import startup
+
+
+@attr.s(frozen=True)
+class Suite:
+    """Benchmarks that run against a generated repository."""
+
+    generated: generate.Generated = attr.ib()
+    jobs: typing.Optional[int] = attr.ib(default=None)
+
+    @property
+    def repository(self) -> pathlib.Path:
+        return self.generated.repository
+
+    @property
+    def state(self) -> pathlib.Path:
+        return self.repository / '.git' / 'fidelius'
+
+    def secret_keeper(self) -> SecretKeeper:
+        return Fidelius(self.repository).cast(gpg=GPG(home=self.generated.home))
+
+    def forget(self, name: str) -> None:
+        """Remove one of the files fidelius keeps in the git directory."""
+        if (self.state / name).exists():
+            (self.state / name).unlink()
+
+    def decrypted(self) -> SecretKeeper:
+        """Make sure every secret has been decrypted."""
+        secret_keeper = self.secret_keeper()
+        secret_keeper.decrypt(jobs=self.jobs)
+        return secret_keeper
+
+    def without(self, name: str) -> SecretKeeper:
+        """Decrypt every secret, then forget a state file before searching again."""
+        self.decrypted()
+        self.forget(name)
+        return self.secret_keeper()
+
+    def benchmarks(self) -> typing.Dict[str, typing.Tuple[typing.Callable, typing.Callable]]:
+        """
+        Map each benchmark's name to a function that prepares it and one that runs it.
+
+        The result of preparing a benchmark is passed to the function that runs
+        it, so that only the operation being measured is timed.
+        """
+        recipients = [self.generated.recipient]
+        return {
+            'discovery-filesystem': (
+                lambda: Fidelius(self.repository),
+                lambda incantation: incantation.search()),
+            'discovery-cached': (
+                lambda: Fidelius(self.repository, cache=True),
+                lambda incantation: incantation.search()),
+            'discovery-git': (
+                lambda: Fidelius(self.repository, discovery='git'),
+                lambda incantation: incantation.search()),
+            'gitignore-cold': (
+                lambda: self.without('gitignore.json'),
+                lambda secret_keeper: secret_keeper.run_gitignore_check()),
+            'gitignore-warm': (
+                self.secret_keeper,
+                lambda secret_keeper: secret_keeper.run_gitignore_check()),
+            'lookup': (
+                self.secret_keeper,
+                lambda secret_keeper: [secret_keeper[s.encrypted] for s in secret_keeper]),
+            'select-glob': (
+                self.secret_keeper,
+                lambda secret_keeper: secret_keeper.select([self.repository / '**' / '*.asc'])),
+            'decrypt': (
+                self.secret_keeper,
+                lambda secret_keeper: secret_keeper.decrypt(jobs=self.jobs, force=True)),
+            'decrypt-streamed': (
+                lambda: Fidelius(self.repository).cast_lazily(gpg=GPG(home=self.generated.home)),
+                lambda secret_keeper: list(secret_keeper.decrypt_each(jobs=self.jobs, force=True))),
+            'decrypt-unchanged': (
+                self.decrypted,
+                lambda secret_keeper: secret_keeper.decrypt(jobs=self.jobs)),
+            'encrypt-unchanged': (
+                self.decrypted,
+                lambda secret_keeper: list(secret_keeper.encrypt_each(recipients, jobs=self.jobs))),
+            'encrypt-unchanged-without-manifest': (
+                lambda: self.without('manifest.json'),
+                lambda secret_keeper: list(secret_keeper.encrypt_each(recipients, jobs=self.jobs))),
+        }
+
+    def measure(self, name: str, runs: int) -> typing.List[float]:
+        prepare, run = self.benchmarks()[name]
+        run(prepare())  # Warm up.
+
+        timings = []
+        for _ in range(runs):
+            prepared = prepare()
+            start = time.perf_counter()
+            run(prepared)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def startup(self, runs: int) -> typing.List[float]:
+        return startup.measure((
+            '-p', self.repository.as_posix(),
+            '--homedir', self.generated.home.as_posix(),
+            'ls'), runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--jobs', type=int)
+    parser.add_argument('--only', action='append', metavar='BENCHMARK',
+                        help="only run the named benchmarks (including 'startup')")
+    parser.add_argument('--keep', type=pathlib.Path,
+                        help="generate the repository here and keep it afterwards")
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    generate.add_arguments(parser)
+    args = parser.parse_args()
+    shape = generate.shape_from_arguments(args)
+
+    with tempfile.TemporaryDirectory(prefix='fidelius-') as temporary:
+        directory = args.keep or pathlib.Path(temporary)
+        suite = Suite(generate.generate(directory, shape, jobs=args.jobs), jobs=args.jobs)
+
+        results = {}
+        for name in (*suite.benchmarks(), 'startup'):
+            if args.only and name not in args.only:
+                continue
+            print(f"Running {name}", file=sys.stderr)
+            if name == 'startup':
+                timings = suite.startup(args.runs)
+            else:
+                timings = suite.measure(name, args.runs)
+            results[name] = startup.summarise(timings)
+
+        generate.stop_agent(suite.generated.home)
+
+    json.dump({
+        'benchmark': 'suite',
+        'fidelius': fidelius.__version__,
+        'python': platform.python_version(),
+        'shape': attr.asdict(shape),
+        'jobs': args.jobs,
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Asynchronous access to secrets for programs using asyncio.
+
+AsyncGPG runs gpg with asyncio subprocesses, so decrypting secrets does not
+block the event loop. Other backends are run in the event loop's executor.
+Both have the same methods as Backend, as coroutines (or an asynchronous
+iterator, for `stream`).
+"""
+
+import asyncio
+import functools
+import logging
+import pathlib
+import subprocess
+import tempfile
+import typing
+
+import attr
+
+from .gpg import CHUNK_SIZE, GPG, Backend, Pair, Results
+
+log = logging.getLogger(__name__)
+
+
+async def in_executor(function: typing.Callable, *args) -> typing.Any:
+    """Call a function in the event loop's executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args))
+
+
+async def stop(process: asyncio.subprocess.Process) -> None:
+    """Kill a process that is no longer wanted, and wait for it to exit."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+@attr.s(frozen=True)
+class AsyncGPG:
+    """An asyncio twin of GPG, sharing its options and command line."""
+
+    gpg: GPG = attr.ib(factory=GPG)
+
+    async def run(
+            self,
+            arguments: typing.Sequence[str],
+            armour: bool,
+            stdin: typing.Optional[str] = None,
+            path: typing.Optional[pathlib.Path] = None) -> str:
+        """
+        Run gpg, returning its output and logging its STDERR output if it fails.
+
+        If the task is cancelled, gpg is killed before the cancellation is raised.
+        """
+        command = self.gpg.command(arguments, armour)
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        try:
+            stdout, stderr = await process.communicate(
+                None if stdin is None else stdin.encode('utf-8'))
+        except asyncio.CancelledError:
+            await stop(process)
+            raise
+
+        if process.returncode:
+            for line in stderr.decode('utf-8', errors='replace').splitlines():
+                log.error(f"{path}: {line}" if path else line)
+            raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+        return stdout.decode('utf-8')
+
+    async def decrypt(
+            self,
+            encrypted: pathlib.Path,
+            decrypted: pathlib.Path,
+            armour: bool) -> None:
+        log.debug(f"Decrypting {encrypted} to {decrypted}")
+        self.gpg.ensure_parent(decrypted)
+        await self.run([
+            '--output', str(decrypted),
+            '--decrypt', str(encrypted)
+        ], armour=armour, path=encrypted)
+
+    async def decrypt_many(self, pairs: typing.Sequence[Pair]) -> Results:
+        return await in_executor(self.gpg.decrypt_many, pairs)
+
+    async def contents(self, path: pathlib.Path, armour: bool) -> str:
+        log.debug(f"Reading contents of {path}")
+        return await self.run(['--decrypt', str(path)], armour, path=path)
+
+    async def stream(self, path: pathlib.Path, armour: bool) -> typing.AsyncIterator[bytes]:
+        """Decrypt a file, yielding plaintext as gpg writes it."""
+        log.debug(f"Streaming contents of {path}")
+        command = self.gpg.command(['--decrypt', str(path)], armour)
+        with tempfile.TemporaryFile() as stderr:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr)
+            try:
+                while True:
+                    chunk = await process.stdout.read(CHUNK_SIZE)  # type: ignore
+                    if not chunk:
+                        break
+                    yield chunk
+                returncode = await process.wait()
+            finally:
+                await stop(process)
+
+            if returncode:
+                stderr.seek(0)
+                for line in stderr.read().decode('utf-8', errors='replace').splitlines():
+                    log.error(f"{path}: {line}")
+                raise subprocess.CalledProcessError(returncode, command)
+
+    async def encrypt_text(
+            self,
+            path: pathlib.Path,
+            text: str,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        log.debug(f"Encrypting {path}")
+        args: typing.List[str] = []
+        for recipient in recipients:
+            args += ['--recipient', recipient]
+        args += ['--output', str(path), '--encrypt']
+        await self.run(args, armour=armour, stdin=text, path=path)
+
+    async def encrypt_file(
+            self,
+            output: pathlib.Path,
+            encrypt: pathlib.Path,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        log.debug(f"Encrypting {encrypt} to {output}")
+        args: typing.List[str] = []
+        for recipient in recipients:
+            args += ['--recipient', recipient]
+        args += ['--output', str(output), '--encrypt', str(encrypt)]
+        await self.run(args, armour, path=encrypt)
+
+    async def encrypt_stream(
+            self,
+            path: pathlib.Path,
+            chunks: typing.Iterable[bytes],
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        await in_executor(self.gpg.encrypt_stream, path, chunks, armour, list(recipients))
+
+    async def encryption_keys(self, recipient: str) -> typing.FrozenSet[str]:
+        return await in_executor(self.gpg.encryption_keys, recipient)
+
+
+@attr.s(frozen=True)
+class ExecutorBackend:
+    """Run a synchronous backend's operations in the event loop's executor."""
+
+    backend: Backend = attr.ib()
+
+    async def decrypt(
+            self,
+            encrypted: pathlib.Path,
+            decrypted: pathlib.Path,
+            armour: bool) -> None:
+        await in_executor(self.backend.decrypt, encrypted, decrypted, armour)
+
+    async def decrypt_many(self, pairs: typing.Sequence[Pair]) -> Results:
+        return await in_executor(self.backend.decrypt_many, pairs)
+
+    async def contents(self, path: pathlib.Path, armour: bool) -> str:
+        return await in_executor(self.backend.contents, path, armour)
+
+    async def stream(self, path: pathlib.Path, armour: bool) -> typing.AsyncIterator[bytes]:
+        """Yield chunks of plaintext, reading each one in the executor."""
+        chunks = self.backend.stream(path, armour)
+        try:
+            while True:
+                chunk = await in_executor(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            await in_executor(getattr(chunks, 'close', lambda: None))
+
+    async def encrypt_text(
+            self,
+            path: pathlib.Path,
+            text: str,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        await in_executor(self.backend.encrypt_text, path, text, armour, list(recipients))
+
+    async def encrypt_file(
+            self,
+            output: pathlib.Path,
+            encrypt: pathlib.Path,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        await in_executor(self.backend.encrypt_file, output, encrypt, armour, list(recipients))
+
+    async def encrypt_stream(
+            self,
+            path: pathlib.Path,
+            chunks: typing.Iterable[bytes],
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        await in_executor(self.backend.encrypt_stream, path, chunks, armour, list(recipients))
+
+    async def encryption_keys(self, recipient: str) -> typing.FrozenSet[str]:
+        return await in_executor(self.backend.encryption_keys, recipient)
+
+
+AsyncBackend = typing.Union[AsyncGPG, ExecutorBackend]
+
+
+def asynchronous(backend: Backend) -> AsyncBackend:
+    """Find an asynchronous equivalent for a backend."""
+    if isinstance(backend, GPG):
+        return AsyncGPG(backend)
+    return ExecutorBackend(backend)
@@ -0,0 +1,110 @@
+"""
+Check who secrets are encrypted for without decrypting them.
+
+Each secret's packets are inspected to find the keys it is encrypted to and to
+detect truncated or corrupt files. Inspections are cached inside the git
+directory by the digest of the ciphertext, so repeated audits only read the
+packets of secrets that have changed.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import threading
+import typing
+
+import attr
+
+from . import packets
+from .manifest import ciphertext_digest
+from .utils import find_work_tree, git_directory
+
+if typing.TYPE_CHECKING:
+    from .secrets import Secret
+
+log = logging.getLogger(__name__)
+
+
+@attr.s(frozen=True)
+class Report:
+    """
+    The result of auditing a single secret.
+
+    `missing` lists expected recipients that have none of their keys in the
+    secret, and `unexpected` lists key IDs that don't belong to any of them.
+    """
+
+    secret: 'Secret' = attr.ib()
+    key_ids: typing.FrozenSet[str] = attr.ib()
+    problem: typing.Optional[str] = attr.ib(default=None)
+    missing: typing.Tuple[str, ...] = attr.ib(default=())
+    unexpected: typing.FrozenSet[str] = attr.ib(default=frozenset())
+
+    @property
+    def ok(self) -> bool:
+        return self.problem is None and not self.missing and not self.unexpected
+
+
+@attr.s
+class AuditCache:
+    """
+    Inspections of encrypted files, keyed by the digest of their contents.
+
+    Only entries used by the most recent audit are saved, so the cache doesn't
+    grow as secrets change. A cache without a path is never saved.
+    """
+
+    path: typing.Optional[pathlib.Path] = attr.ib(default=None)
+    previous: typing.Dict[str, packets.Inspection] = attr.ib(factory=dict, repr=False)
+    current: typing.Dict[str, packets.Inspection] = attr.ib(factory=dict, repr=False)
+    lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False, cmp=False)
+
+    @classmethod
+    def load(cls, directory: pathlib.Path) -> 'AuditCache':
+        work_tree = find_work_tree(directory)
+        if work_tree is None:
+            return cls()
+
+        path = git_directory(work_tree) / 'fidelius' / 'audit.json'
+        try:
+            data = json.loads(path.read_text())
+            return cls(path=path, previous={
+                digest: packets.Inspection(frozenset(key_ids), problem)
+                for digest, (key_ids, problem) in data.items()})
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as error:
+            log.warning(f"Ignoring unreadable audit cache {path}: {error}")
+        return cls(path=path)
+
+    def inspect(self, path: pathlib.Path) -> packets.Inspection:
+        try:
+            digest = ciphertext_digest(path)
+        except OSError as error:
+            return packets.Inspection(frozenset(), f"Unreadable: {error}")
+
+        with self.lock:
+            inspection = self.current.get(digest) or self.previous.get(digest)
+        if inspection is None:
+            log.debug(f"Inspecting packets in {path}")
+            inspection = packets.inspect(path)
+
+        with self.lock:
+            self.current[digest] = inspection
+        return inspection
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+
+        with self.lock:
+            data = {
+                digest: [sorted(inspection.key_ids), inspection.problem]
+                for digest, inspection in sorted(self.current.items())
+            }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f'.{self.path.name}.{os.getpid()}')
+        temporary.write_text(json.dumps(data, separators=(',', ':')))
+        os.replace(temporary, self.path)
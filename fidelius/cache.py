@@ -0,0 +1,187 @@
+"""
+An in-memory cache of decrypted secrets for long-running processes.
+
+Entries are keyed by the digest of the ciphertext they were decrypted from, so
+a secret is decrypted again whenever its encrypted file changes. The cache is
+bounded by the total size of the plaintext it holds, evicting the least
+recently used entries first, and entries expire after a fixed time.
+"""
+
+import collections
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import typing
+
+import attr
+
+from .gpg import Backend
+from .manifest import ciphertext_digest
+from .utils import FideliusException
+
+if typing.TYPE_CHECKING:
+    from .secrets import Secret
+
+log = logging.getLogger(__name__)
+
+#: Marks an entry that has not been parsed yet (None is a valid parse result).
+UNPARSED = object()
+
+
+def load_yaml(text: str) -> typing.Any:
+    try:
+        import yaml
+    except ImportError:
+        raise FideliusException("Parsing YAML secrets needs PyYAML (pip install pyyaml)")
+    return yaml.safe_load(text)
+
+
+#: Parsers for structured secrets, selected by the decrypted file's suffix.
+PARSERS: typing.Dict[str, typing.Callable[[str], typing.Any]] = {
+    '.json': json.loads,
+    '.yaml': load_yaml,
+    '.yml': load_yaml,
+}
+
+
+def parser(secret: 'Secret') -> typing.Callable[[str], typing.Any]:
+    """Find the parser for a JSON or YAML secret, from its decrypted path."""
+    parse = PARSERS.get(secret.decrypted.suffix)
+    if parse is None:
+        raise FideliusException(f"I don't know how to parse {secret.decrypted.name}")
+    return parse
+
+
+@attr.s
+class Entry:
+    buffer: bytearray = attr.ib(repr=False)
+    expires: float = attr.ib()
+    parsed: typing.Any = attr.ib(default=UNPARSED, repr=False)
+
+    def zero(self) -> None:
+        """Overwrite the plaintext. Copies given to callers are not affected."""
+        self.buffer[:] = bytes(len(self.buffer))
+        self.parsed = UNPARSED
+
+
+@attr.s
+class SecretCache:
+    """
+    Decrypted secrets kept in memory, keyed by the digest of their ciphertext.
+
+    Files are only hashed again when their size, inode or modification time
+    changes. Evicted and expired plaintext is overwritten with zeros on a
+    best-effort basis; copies returned to callers can't be cleared.
+    """
+
+    max_size: int = attr.ib(default=64 * 1024 * 1024)
+    ttl: typing.Optional[float] = attr.ib(default=300.0)
+    clock: typing.Callable[[], float] = attr.ib(default=time.monotonic, repr=False)
+
+    entries: 'collections.OrderedDict[str, Entry]' = attr.ib(
+        factory=collections.OrderedDict, init=False, repr=False)
+    digests: typing.Dict[pathlib.Path, typing.Tuple[tuple, str]] = attr.ib(
+        factory=dict, init=False, repr=False)
+    size: int = attr.ib(default=0, init=False)
+    lock: threading.RLock = attr.ib(factory=threading.RLock, init=False, repr=False)
+
+    def digest(self, path: pathlib.Path) -> str:
+        """Find the digest of a file, evicting entries for its old contents."""
+        st = os.stat(path)
+        key = (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+        with self.lock:
+            previous = self.digests.get(path)
+            if previous and previous[0] == key:
+                return previous[1]
+
+        digest = ciphertext_digest(path)
+        with self.lock:
+            self.digests[path] = (key, digest)
+            if previous and previous[1] != digest:
+                log.debug(f"Evicting cached plaintext for changed file {path}")
+                self.evict(previous[1])
+        return digest
+
+    def lookup(self, digest: str) -> typing.Optional[Entry]:
+        """Find an unexpired entry. Callers must hold the lock while using it."""
+        entry = self.entries.get(digest)
+        if entry is not None:
+            if entry.expires > self.clock():
+                self.entries.move_to_end(digest)
+                return entry
+            self.evict(digest)
+        return None
+
+    def store(self, digest: str, buffer: bytearray) -> typing.Optional[Entry]:
+        """Add an entry, evicting the least recently used entries to make space."""
+        if len(buffer) > self.max_size:
+            return None
+
+        expires = self.clock() + self.ttl if self.ttl is not None else float('inf')
+        entry = Entry(buffer=buffer, expires=expires)
+        self.evict(digest)
+        self.entries[digest] = entry
+        self.size += len(buffer)
+        while self.size > self.max_size:
+            self.evict(next(iter(self.entries)))
+        return entry
+
+    @staticmethod
+    def decrypt(secret: 'Secret', gpg: Backend) -> bytearray:
+        log.debug(f"Decrypting {secret.encrypted} into the cache")
+        buffer = bytearray()
+        for chunk in secret.stream(gpg):
+            buffer += chunk
+        return buffer
+
+    def read(self, secret: 'Secret', gpg: Backend) -> bytes:
+        digest = self.digest(secret.encrypted)
+        with self.lock:
+            entry = self.lookup(digest)
+            if entry is not None:
+                return bytes(entry.buffer)
+
+        buffer = self.decrypt(secret, gpg)
+        with self.lock:
+            plaintext = bytes(buffer)
+            self.store(digest, buffer)
+        return plaintext
+
+    def load(self, secret: 'Secret', gpg: Backend) -> typing.Any:
+        """
+        Parse a JSON or YAML secret, caching the result alongside the plaintext.
+
+        The same object is returned for each call, and should not be modified.
+        """
+        parse = parser(secret)
+        digest = self.digest(secret.encrypted)
+        with self.lock:
+            entry = self.lookup(digest)
+            if entry is not None:
+                if entry.parsed is UNPARSED:
+                    entry.parsed = parse(entry.buffer.decode('utf-8'))
+                return entry.parsed
+
+        buffer = self.decrypt(secret, gpg)
+        parsed = parse(buffer.decode('utf-8'))
+        with self.lock:
+            entry = self.store(digest, buffer)
+            if entry is not None:
+                entry.parsed = parsed
+        return parsed
+
+    def evict(self, digest: str) -> None:
+        with self.lock:
+            entry = self.entries.pop(digest, None)
+            if entry is not None:
+                self.size -= len(entry.buffer)
+                entry.zero()
+
+    def clear(self) -> None:
+        with self.lock:
+            for digest in list(self.entries):
+                self.evict(digest)
+            self.digests.clear()
@@ -1,17 +1,24 @@
+import codecs
+import collections
 import functools
+import itertools
 import logging
 import os.path
 import pathlib
+import sys
 import typing
 
 import click
-import click._termui_impl
 
 from . import __doc__, __version__
-from .gpg import GPG
-from .incantations import Fidelius
-from .secrets import Secret, SecretKeeper
-from .utils import find_git_directory
+from .utils import FideliusException, default_jobs, find_git_directory
+
+# Most modules are imported when a command first needs them, as fidelius is
+# often run many times in a row (e.g. as a git textconv driver).
+if typing.TYPE_CHECKING:
+    from .incantations import Fidelius
+    from .secrets import Secret, SecretKeeper
+    from .shards import Shard
 
 log = logging.getLogger(__name__)
 
@@ -26,21 +33,79 @@ def rel(path: pathlib.Path) -> str:
     return os.path.relpath(path.as_posix(), pathlib.Path.cwd().as_posix())
 
 
-def enc(secret: Secret, fg: typing.Optional[str] = 'green') -> str:
+def enc(secret: 'Secret', fg: typing.Optional[str] = 'green') -> str:
     """Style a path to a encrypted file."""
     return click.style(rel(secret.encrypted), fg=fg)
 
 
-def dec(secret: Secret, fg: typing.Optional[str] = 'red') -> str:
+def dec(secret: 'Secret', fg: typing.Optional[str] = 'red') -> str:
     """Style a path to a decrypted file."""
     return click.style(rel(secret.decrypted), fg=fg)
 
 
+def pass_secret_keeper(f=None, *, stream: bool = False):
+    """
+    Pass a SecretKeeper to a command, searching for secrets on first use.
+
+    With `stream` set, the search only happens as the command uses secrets,
+    so that it can start work before the search has finished, and decrypted
+    paths are checked against .gitignore a batch at a time. Otherwise every
+    decrypted path is checked before the command starts, so the command
+    either does everything or nothing.
+    """
+    if f is None:
+        return functools.partial(pass_secret_keeper, stream=stream)
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        return f(click.get_current_context().obj(stream=stream), *args, **kwargs)
+    return wrapper
+
+
+def selection(
+        sk: 'SecretKeeper',
+        secrets: typing.Sequence[pathlib.Path],
+        shard: typing.Optional['Shard'],
+        shard_by_size: bool) -> typing.Iterable['Secret']:
+    """Select secrets for a command, streaming them as they're found if possible."""
+    if secrets or shard_by_size:
+        return sk.select(secrets, shard=shard, weighted=shard_by_size)
+    return sk.stream(shard)
+
+
 class PathType(click.Path):
     def convert(self, value, param, ctx):
         return pathlib.Path(super().convert(value, param, ctx))
 
 
+class ShardType(click.ParamType):
+    name = 'shard'
+
+    def convert(self, value, param, ctx):
+        from .shards import Shard
+        if isinstance(value, Shard):
+            return value
+        try:
+            return Shard.parse(value)
+        except ValueError as error:
+            self.fail(str(error), param, ctx)
+
+
+class CommandAfterDashes(click.Command):
+    """A command that passes everything after `--` to its callback as `command`."""
+
+    def parse_args(self, ctx, args):
+        index = args.index('--') if '--' in args else len(args)
+        remaining = super().parse_args(ctx, args[:index])
+        ctx.params['command'] = tuple(args[index + 1:])
+        if not ctx.params['command']:
+            raise click.UsageError("Missing a command to run after '--'", ctx=ctx)
+        return remaining
+
+    def collect_usage_pieces(self, ctx):
+        return super().collect_usage_pieces(ctx) + ['--', 'COMMAND', '[ARGS]...']
+
+
 recipients_option = click.option(
     '-r', '--recipient', 'recipients',
     metavar='ID',
@@ -55,6 +120,30 @@ secret_path_options = click.argument(
     type=PathType(),
     required=True)
 
+jobs_option = click.option(
+    '-j', '--jobs',
+    metavar='N',
+    type=click.IntRange(min=1),
+    default=default_jobs,
+    help="Number of gpg processes to run at once. Defaults to the CPU count.")
+
+
+def shard_options(f):
+    """Options to only use one shard of the selected secrets."""
+    f = click.option(
+        '--shard-by-size',
+        default=False,
+        is_flag=True,
+        help="Balance shards by ciphertext size instead of hashing paths.")(f)
+    return click.option(
+        '--shard',
+        metavar='INDEX/COUNT',
+        envvar='FIDELIUS_SHARD',
+        type=ShardType(),
+        default=None,
+        help="Only use one of COUNT evenly sized groups of secrets (from 1).")(f)
+
+
 secrets_argument = click.argument(
     'secrets',
     type=PathType(),
@@ -72,6 +161,42 @@ secrets_argument = click.argument(
     default=find_git_directory,
     required=True,
     help="Defaults to the current git repository.")
+@click.option(
+    '--discovery',
+    type=click.Choice(['auto', 'filesystem', 'git']),
+    default='filesystem',
+    help="Find secrets by walking the filesystem or listing files known to git.")
+@click.option(
+    '--cache/--no-cache',
+    default=True,
+    help="Cache directory listings to speed up searching for secrets.")
+@click.option(
+    '--backend',
+    type=click.Choice(['gpg', 'gpgme']),
+    default='gpg',
+    help="Run the gpg command, or use the GPGME library in-process.")
+@click.option(
+    '--homedir',
+    type=PathType(file_okay=False, dir_okay=True, exists=True),
+    envvar='GNUPGHOME',
+    default=None,
+    help="Use a GnuPG home directory other than the default.")
+@click.option(
+    '--verify-gitignore',
+    default=False,
+    is_flag=True,
+    help="Check decrypted paths are ignored with git instead of in-process.")
+@click.option(
+    '--timings',
+    default=False,
+    is_flag=True,
+    help="Print how long each phase took when the command finishes.")
+@click.option(
+    '--trace',
+    type=PathType(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    metavar='FILE',
+    help="Write timings in the Chrome trace event format to a file.")
 @click.option(
     '-d', '--debug', 'debug',
     default=False,
@@ -87,10 +212,64 @@ def main(
         ctx,
         debug: bool,
         path: pathlib.Path,
+        discovery: str,
+        cache: bool,
+        backend: str,
+        homedir: typing.Optional[pathlib.Path],
+        verify_gitignore: bool,
+        timings: bool,
+        trace: typing.Optional[pathlib.Path],
         gpg_verbose: bool):
     logging.basicConfig(level=(logging.DEBUG if debug else logging.WARNING))
-    ctx.obj = Fidelius(path).cast(gpg=GPG(verbose=gpg_verbose))
-    ctx.obj.run_gitignore_check()
+
+    if timings or trace:
+        record_timings(ctx, timings, trace)
+
+    @functools.lru_cache()
+    def incantation() -> 'Fidelius':
+        from .incantations import Fidelius
+        return Fidelius(path, discovery=discovery, cache=cache)
+
+    @functools.lru_cache()
+    def secret_keeper(stream: bool = False) -> 'SecretKeeper':
+        from .gpg import GPG, Backend
+
+        gpg: Backend
+        if backend == 'gpgme':
+            from .gpgme import GPGME
+            gpg = GPGME(home=homedir)
+        else:
+            gpg = GPG(verbose=gpg_verbose, home=homedir)
+
+        fidelius = incantation()
+        if stream:
+            return fidelius.cast_lazily(gpg=gpg, verify_gitignore=verify_gitignore)
+        sk = fidelius.cast(gpg=gpg)
+        sk.run_gitignore_check(verify=verify_gitignore)
+        return sk
+
+    # Commands that find secrets themselves use the same search settings.
+    secret_keeper.incantation = incantation  # type: ignore
+    ctx.obj = secret_keeper
+
+
+def record_timings(ctx, summary: bool, trace: typing.Optional[pathlib.Path]):
+    """Record timings until the command finishes, then report them."""
+    from .timings import Recorder, ignore, listen
+
+    recorder = Recorder()
+    listen(recorder)
+
+    def report():
+        ignore(recorder)
+        if summary:
+            click.echo(recorder.format(), err=True)
+        if trace:
+            import json
+            with trace.open('w') as f:
+                json.dump(recorder.trace(), f, default=str)
+
+    ctx.call_on_close(report)
 
 
 @main.command()
@@ -100,46 +279,79 @@ def version():
 
 
 @main.command()
-@click.pass_obj
-def ls(sk: SecretKeeper):
+@shard_options
+@pass_secret_keeper(stream=True)
+def ls(sk: 'SecretKeeper', shard: typing.Optional['Shard'], shard_by_size: bool):
     """List all encrypted paths with their decrypted path."""
-    for secret in sk:
+    for secret in selection(sk, (), shard, shard_by_size):
         click.echo(f"{enc(secret)} -> {dec(secret)}")
 
 
 @main.command()
-@click.pass_obj
-def ls_encrypted(sk: SecretKeeper):
+@shard_options
+@pass_secret_keeper(stream=True)
+def ls_encrypted(sk: 'SecretKeeper', shard: typing.Optional['Shard'], shard_by_size: bool):
     """List all encrypted files."""
-    for secret in sk:
+    for secret in selection(sk, (), shard, shard_by_size):
         click.echo(enc(secret))
 
 
 @main.command()
-@click.pass_obj
-def ls_decrypted(sk: SecretKeeper):
+@shard_options
+@pass_secret_keeper(stream=True)
+def ls_decrypted(sk: 'SecretKeeper', shard: typing.Optional['Shard'], shard_by_size: bool):
     """List all decrypted files."""
-    for secret in sk:
+    for secret in selection(sk, (), shard, shard_by_size):
         click.echo(dec(secret))
 
 
 @main.command()
 @secrets_argument
-@click.pass_obj
-def decrypt(sk: SecretKeeper, secrets: typing.Sequence[pathlib.Path]):
+@click.option(
+    '--force/--no-force',
+    default=False,
+    help='Decrypt secrets when their plaintext is already up to date.')
+@jobs_option
+@shard_options
+@pass_secret_keeper(stream=True)
+def decrypt(
+        sk: 'SecretKeeper',
+        secrets: typing.Sequence[pathlib.Path],
+        force: bool,
+        jobs: int,
+        shard: typing.Optional['Shard'],
+        shard_by_size: bool):
     """
     Create decrypted plaintext from encrypted secrets.
 
-    If not paths are provides, decrypts all secrets.
+    If not paths are provides, decrypts all secrets. Plaintext that is
+    already up to date is not rewritten unless --force is used.
+
+    Secrets are decrypted while the search for more is still running, and
+    each batch of decrypted paths is checked against .gitignore before it is
+    used, so earlier secrets may already have been decrypted when a later
+    path fails the check.
     """
-    for secret in sk.select(secrets):
-        secret.decrypt(sk.gpg)
-        click.echo(f"Decrypted {enc(secret)} to {dec(secret)}")
+    failed = 0
+    for outcome in sk.decrypt_each(
+            selection(sk, secrets, shard, shard_by_size), jobs=jobs, force=force):
+        if outcome.status == 'skipped':
+            click.secho(
+                f"Skipping {rel(outcome.secret.encrypted)} as "
+                f"{rel(outcome.secret.decrypted)} is up to date", fg='bright_black')
+        elif outcome.failed:
+            failed += 1
+            click.secho(f"Failed to decrypt {rel(outcome.secret.encrypted)}", fg='red')
+        else:
+            click.echo(f"Decrypted {enc(outcome.secret)} to {dec(outcome.secret)}")
+
+    if failed:
+        raise FideliusException(f"Failed to decrypt {failed} secret(s)")
 
 
 @main.command()
-@click.pass_obj
-def clean(sk: SecretKeeper):
+@pass_secret_keeper
+def clean(sk: 'SecretKeeper'):
     """Delete all decrypted plaintext files."""
     for secret in sk:
         if secret.decrypted.exists():
@@ -149,11 +361,76 @@ def clean(sk: SecretKeeper):
 
 @main.command()
 @secrets_argument
-@click.pass_obj
-def cat(sk: SecretKeeper, secrets: typing.Sequence[pathlib.Path]):
+@pass_secret_keeper
+def cat(sk: 'SecretKeeper', secrets: typing.Sequence[pathlib.Path]):
     """Print the contents of an encrypted file."""
+    stdout = click.get_binary_stream('stdout')
     for secret in sk.select(secrets):
-        click.echo(secret.contents(sk.gpg), nl=False)
+        for chunk in secret.stream(sk.gpg):
+            stdout.write(chunk)
+    stdout.flush()
+
+
+@main.command(name='exec', cls=CommandAfterDashes)
+@secrets_argument
+@click.option(
+    '--memfd/--no-memfd',
+    default=False,
+    help="Hold plaintext in memory files that only the command's processes can open.")
+@click.option(
+    '--links/--no-links',
+    default=False,
+    help="Link each secret's decrypted path to its copy in memory.")
+@jobs_option
+@pass_secret_keeper
+@click.pass_context
+def exec_(
+        ctx,
+        sk: 'SecretKeeper',
+        secrets: typing.Sequence[pathlib.Path],
+        memfd: bool,
+        links: bool,
+        jobs: int,
+        command: typing.Sequence[str]):
+    """
+    Run a command with secrets decrypted into memory.
+
+    If no paths are provided, decrypts all secrets. Secrets are written to a
+    private directory on a memory-backed filesystem, mirroring their relative
+    decrypted paths. The directory is in $FIDELIUS_SECRETS, and each secret's
+    path is in a variable named after it (files/config.decrypted.json is
+    $FIDELIUS_FILES_CONFIG_JSON). Everything is removed when the command
+    exits, and its exit status is returned.
+
+    With --memfd, the plaintext only exists in memory files inherited by the
+    command, which can't outlive it, but processes that close inherited file
+    descriptors can't read them.
+    """
+    import signal
+    from .execute import Vault
+
+    # Exit normally on signals so that the secrets are removed. Once the
+    # command is running it receives interrupts, and the others are passed on.
+    def exit(signum, frame):
+        sys.exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, exit)
+    signal.signal(signal.SIGHUP, exit)
+    interrupt = signal.signal(signal.SIGINT, exit)
+
+    with Vault(sk, sk.select(secrets), memfd=memfd, links=links) as vault:
+        try:
+            outcomes = vault.open(jobs=jobs)
+        finally:
+            signal.signal(signal.SIGINT, interrupt)
+        failed = [o for o in outcomes if o.failed]
+        for outcome in failed:
+            click.secho(f"Failed to decrypt {rel(outcome.secret.encrypted)}", fg='red', err=True)
+        if failed:
+            raise FideliusException(f"Failed to decrypt {len(failed)} secret(s)")
+        returncode = vault.run(command)
+
+    ctx.exit(128 - returncode if returncode < 0 else returncode)
 
 
 @main.command()
@@ -161,22 +438,27 @@ def cat(sk: SecretKeeper, secrets: typing.Sequence[pathlib.Path]):
     'encrypted_secret',
     type=PathType(exists=True),
     required=True)
-@click.pass_obj
-def view(sk: SecretKeeper, encrypted_secret: pathlib.Path):
+@pass_secret_keeper
+def view(sk: 'SecretKeeper', encrypted_secret: pathlib.Path):
     """View the decrypted text of an encrypted file in your $PAGER."""
-    contents = sk[encrypted_secret].contents(sk.gpg)
+    chunks = sk[encrypted_secret].stream(sk.gpg)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    text = itertools.chain(
+        (decoder.decode(chunk) for chunk in chunks),
+        (decoder.decode(b'', final=True),))
 
     # Use the `click._termui_impl.pager()` method directly because
     # `click.echo_via_pager` appends a newline.
-    click._termui_impl.pager(contents)  # type: ignore
+    import click._termui_impl
+    click._termui_impl.pager(text)  # type: ignore
 
 
 @main.command()
 @recipients_option
 @secret_path_options
-@click.pass_obj
+@pass_secret_keeper
 def edit(
-        sk: SecretKeeper,
+        sk: 'SecretKeeper',
         path: pathlib.Path,
         recipients: typing.Iterable[str]):
     """
@@ -203,6 +485,8 @@ def edit(
         text=new_text,
         armour=secret.armour,
         recipients=recipients)
+    sk.manifest.record(secret.encrypted, sk.manifest.text_digest(new_text))
+    sk.manifest.save()
 
     if secret.decrypted.exists():
         click.secho(
@@ -218,31 +502,296 @@ def edit(
     '--force/--no-force',
     default=False,
     help='Re-encrypt secrets when their contents are unchanged.')
-@click.pass_obj
+@jobs_option
+@shard_options
+@pass_secret_keeper
 def encrypt(
-        sk: SecretKeeper,
+        sk: 'SecretKeeper',
         secrets: typing.Sequence[pathlib.Path],
         recipients: typing.Iterable[str],
-        force: bool):
+        force: bool,
+        jobs: int,
+        shard: typing.Optional['Shard'],
+        shard_by_size: bool):
     """
     Create encrypted secrets from decrypted plaintext.
 
     The $FIDELIUS_RECIPIENTS environment variable should be a whitespace
     separated list of recipients GPG will encrypt the new contents for.
     """
-    for secret in sk.select(secrets):
-        if not secret.decrypted.exists():
+    counts: typing.Counter[str] = collections.Counter()
+    selected = selection(sk, secrets, shard, shard_by_size)
+    for outcome in sk.encrypt_each(recipients, selected, force=force, jobs=jobs):
+        secret = outcome.secret
+        counts[outcome.status] += 1
+        if outcome.status == 'missing':
             click.echo(f"Plaintext for {enc(secret)} does not exist")
-            continue
-
-        if not force and secret.plaintext() == secret.contents(sk.gpg):
+        elif outcome.status == 'skipped':
             click.secho(
                 f"Skipping {rel(secret.encrypted)} as no changes have been "
                 f"made in {rel(secret.decrypted)}", fg='bright_black')
-            continue
+        elif outcome.status == 'failed':
+            click.secho(f"Failed to encrypt {rel(secret.encrypted)}", fg='red')
+        else:
+            click.echo(f"Encrypted {enc(secret)} from the plaintext in {dec(secret)}")
+
+    click.echo(
+        f"{counts['encrypted']} encrypted, {counts['skipped']} skipped, "
+        f"{counts['missing']} missing, {counts['failed']} failed")
+
+    if counts['failed']:
+        raise FideliusException(f"Failed to encrypt {counts['failed']} secret(s)")
+
+
+STATUS_COLOURS = {
+    'missing': 'bright_black',
+    'plaintext-modified': 'green',
+    'ciphertext-newer': 'yellow',
+    'conflict': 'red',
+    'failed': 'red',
+}
 
-        secret.re_encrypt(sk.gpg, recipients=recipients)
-        click.echo(f"Encrypted {enc(secret)} from the plaintext in {dec(secret)}")
+
+@main.command()
+@click.option(
+    '--all', 'show_all',
+    default=False,
+    is_flag=True,
+    help="Also list secrets that are in sync.")
+@click.option(
+    '--json', 'as_json',
+    default=False,
+    is_flag=True,
+    help="Print the status of every secret as JSON.")
+@jobs_option
+@shard_options
+@secrets_argument
+@pass_secret_keeper(stream=True)
+def status(
+        sk: 'SecretKeeper',
+        secrets: typing.Sequence[pathlib.Path],
+        show_all: bool,
+        as_json: bool,
+        jobs: int,
+        shard: typing.Optional['Shard'],
+        shard_by_size: bool):
+    """
+    Show which secrets need to be decrypted or encrypted.
+
+    Each secret is 'missing' (not decrypted), 'in-sync', 'plaintext-modified'
+    (run 'fidelius encrypt'), 'ciphertext-newer' (run 'fidelius decrypt') or
+    'conflict' (both files changed). Secrets are only decrypted when the
+    manifest can't tell if they have changed.
+    """
+    outcomes = list(sk.status_each(selection(sk, secrets, shard, shard_by_size), jobs=jobs))
+
+    if as_json:
+        import json
+        click.echo(json.dumps([{
+            'encrypted': rel(outcome.secret.encrypted),
+            'decrypted': rel(outcome.secret.decrypted),
+            'status': outcome.status,
+        } for outcome in outcomes], indent=2))
+    else:
+        for outcome in outcomes:
+            if outcome.status != 'in-sync' or show_all:
+                click.secho(
+                    f"{outcome.status + ':':<20} {rel(outcome.secret.decrypted)}",
+                    fg=STATUS_COLOURS.get(outcome.status))
+        counts = collections.Counter(outcome.status for outcome in outcomes)
+        click.echo(', '.join(
+            f"{counts[s]} {s}" for s in ('in-sync', *STATUS_COLOURS) if counts[s]) or "No secrets")
+
+    failed = [o for o in outcomes if o.failed]
+    if failed:
+        raise FideliusException(f"Failed to check {len(failed)} secret(s)")
+
+
+@main.command()
+@recipients_option
+@secrets_argument
+@click.option(
+    '--force/--no-force',
+    default=False,
+    help='Re-encrypt secrets that are already encrypted for these recipients.')
+@jobs_option
+@pass_secret_keeper
+def rekey(
+        sk: 'SecretKeeper',
+        secrets: typing.Sequence[pathlib.Path],
+        recipients: typing.Iterable[str],
+        force: bool,
+        jobs: int):
+    """
+    Re-encrypt secrets for a new set of recipients.
+
+    Each secret is decrypted and encrypted again in memory, so plaintext is
+    never written to disk. Secrets already encrypted for exactly these
+    recipients are left unchanged.
+    """
+    counts: typing.Counter[str] = collections.Counter()
+    for outcome in sk.rekey_each(recipients, sk.select(secrets), force=force, jobs=jobs):
+        counts[outcome.status] += 1
+        if outcome.status == 'skipped':
+            click.secho(
+                f"Skipping {rel(outcome.secret.encrypted)} as it is already "
+                f"encrypted for these recipients", fg='bright_black')
+        elif outcome.status == 'failed':
+            click.secho(f"Failed to re-encrypt {rel(outcome.secret.encrypted)}", fg='red')
+        else:
+            click.echo(f"Re-encrypted {enc(outcome.secret)}")
+
+    click.echo(f"{counts['rekeyed']} re-encrypted, {counts['skipped']} skipped, "
+               f"{counts['failed']} failed")
+
+    if counts['failed']:
+        raise FideliusException(f"Failed to re-encrypt {counts['failed']} secret(s)")
+
+
+@main.command()
+@click.option(
+    '-r', '--recipient', 'recipients',
+    metavar='ID',
+    envvar='FIDELIUS_RECIPIENTS',
+    multiple=True,
+    type=click.STRING,
+    help="Check secrets are encrypted for exactly these recipients.")
+@click.option(
+    '--json', 'as_json',
+    default=False,
+    is_flag=True,
+    help="Print the results as JSON.")
+@jobs_option
+@secrets_argument
+@pass_secret_keeper
+def audit(
+        sk: 'SecretKeeper',
+        secrets: typing.Sequence[pathlib.Path],
+        recipients: typing.Iterable[str],
+        as_json: bool,
+        jobs: int):
+    """
+    Check who secrets are encrypted for, without decrypting them.
+
+    Lists the key IDs each secret is encrypted to and reports truncated or
+    corrupt files. When recipients are given (or set in $FIDELIUS_RECIPIENTS),
+    also reports secrets that are not encrypted for exactly those recipients.
+    Only public keys are needed.
+    """
+    reports = list(sk.audit_each(recipients, sk.select(secrets), jobs=jobs))
+
+    if as_json:
+        import json
+        click.echo(json.dumps([{
+            'secret': rel(report.secret.encrypted),
+            'key_ids': sorted(report.key_ids),
+            'problem': report.problem,
+            'missing': list(report.missing),
+            'unexpected': sorted(report.unexpected),
+            'ok': report.ok,
+        } for report in reports], indent=2))
+    else:
+        for report in reports:
+            click.echo(f"{enc(report.secret)}: {', '.join(sorted(report.key_ids)) or '-'}")
+            if report.problem:
+                click.secho(f"  {report.problem}", fg='red')
+            for recipient in report.missing:
+                click.secho(f"  Not encrypted for {recipient}", fg='red')
+            for key_id in sorted(report.unexpected):
+                click.secho(f"  Encrypted for unexpected key {key_id}", fg='red')
+
+    failed = [r for r in reports if not r.ok]
+    if failed:
+        raise FideliusException(f"{len(failed)} secret(s) failed the audit")
+
+
+@main.command()
+@click.option(
+    '--socket', 'socket_path',
+    type=PathType(dir_okay=False),
+    default=None,
+    help="Defaults to a per-user path in $XDG_RUNTIME_DIR. Must be in a private directory.")
+@jobs_option
+@pass_secret_keeper
+def serve(sk: 'SecretKeeper', socket_path: typing.Optional[pathlib.Path], jobs: int):
+    """
+    Serve decrypted secrets to local processes over a Unix socket.
+
+    All secrets are decrypted into memory when the daemon starts, and are
+    decrypted again when their encrypted file changes. Use the client in
+    fidelius.daemon to fetch secrets from the daemon.
+    """
+    import signal
+    from .daemon import Server, default_socket
+
+    # Exit normally on SIGTERM so that the socket is removed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    socket_path = socket_path or default_socket(sk.directory)
+    with Server(socket_path, sk) as server:
+        server.warm(jobs)
+        click.echo(f"Serving {len(sk.secrets)} secrets on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@main.command()
+@recipients_option
+@click.option(
+    '--delay',
+    type=click.FloatRange(min=0),
+    default=0.2,
+    help="Seconds to wait for changes to stop before syncing.")
+@click.option(
+    '--poll',
+    default=False,
+    is_flag=True,
+    help="Poll for changes instead of using inotify.")
+@jobs_option
+@pass_secret_keeper
+@click.pass_context
+def watch(
+        ctx,
+        sk: 'SecretKeeper',
+        recipients: typing.Iterable[str],
+        delay: float,
+        poll: bool,
+        jobs: int):
+    """
+    Keep plaintext and ciphertext in sync as they change.
+
+    Decrypts a secret when its encrypted file changes (for example after a
+    pull) and encrypts it when its decrypted file changes. New encrypted files
+    are decrypted as they appear. Runs until interrupted.
+    """
+    import signal
+    from .watch import Watch, monitor
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    fidelius = ctx.obj.incantation()
+    watcher = Watch(
+        sk, recipients,
+        monitor=monitor(exclude=fidelius.exclude, poll=poll),
+        fidelius=fidelius,
+        delay=delay,
+        jobs=jobs)
+    click.echo(f"Watching {len(sk.secrets)} secrets in {sk.directory}")
+    try:
+        for outcome in watcher.run():
+            secret = outcome.secret
+            if outcome.status == 'decrypted':
+                click.echo(f"Decrypted {enc(secret)} to {dec(secret)}")
+            elif outcome.status == 'encrypted':
+                click.echo(f"Encrypted {enc(secret)} from the plaintext in {dec(secret)}")
+            elif outcome.failed:
+                click.secho(f"Failed to sync {rel(secret.encrypted)}", fg='red')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 @main.command()
@@ -250,9 +799,9 @@ def encrypt(
 @secret_path_options
 @click.argument(
     'plaintext', type=PathType(exists=True), default=None, required=False)
-@click.pass_obj
+@pass_secret_keeper
 def create(
-        sk: SecretKeeper,
+        sk: 'SecretKeeper',
         path: pathlib.Path,
         plaintext: pathlib.Path,
         recipients: typing.Iterable[str]):
@@ -285,6 +834,7 @@ def create(
             encrypt=plaintext,
             armour=(path.suffix == '.asc'),
             recipients=recipients)
+        sk.manifest.record_file(path, plaintext)
     else:
         text = click.edit(extension=path.suffixes[-2])
         if not text:
@@ -294,3 +844,5 @@ def create(
             text=text,
             armour=(path.suffix == '.asc'),
             recipients=recipients)
+        sk.manifest.record(path, sk.manifest.text_digest(text))
+    sk.manifest.save()
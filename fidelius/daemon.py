@@ -0,0 +1,185 @@
+"""
+A local daemon that serves decrypted secrets over a Unix socket.
+
+The daemon searches for secrets once and keeps their plaintext in a cache,
+decrypting a secret again only when its encrypted file changes. Clients send
+one JSON request per line and receive one JSON response per line:
+
+    {"op": "list"}
+    {"op": "get", "path": "secrets.encrypted/example.json.asc"}
+
+The socket is only accessible to the user running the daemon.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import socket
+import socketserver
+import stat
+import subprocess
+import tempfile
+import typing
+
+import attr
+
+from .cache import SecretCache
+from .secrets import Secret, SecretKeeper
+from .utils import FideliusException, concurrently
+
+log = logging.getLogger(__name__)
+
+
+def default_socket(directory: pathlib.Path) -> pathlib.Path:
+    """A per-user socket path for serving secrets from a directory, in a private directory."""
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    name = hashlib.sha1(directory.resolve().as_posix().encode('utf-8')).hexdigest()[:16]
+    return private_directory(pathlib.Path(runtime) / f'fidelius-{os.getuid()}') / f'{name}.sock'
+
+
+def private_directory(path: pathlib.Path) -> pathlib.Path:
+    """
+    Create a directory only the current user can access, or check an existing one.
+
+    Shared directories like /tmp let other users create the directory first,
+    so it's refused unless it is owned by the current user and private.
+    """
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise FideliusException(f"{path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise FideliusException(f"{path} is not owned by the current user")
+    if st.st_mode & 0o077:
+        raise FideliusException(
+            f"{path} can be accessed by other users (mode {stat.S_IMODE(st.st_mode):o})")
+    return path
+
+
+def remove_stale_socket(path: pathlib.Path) -> None:
+    """Remove a socket left behind by a daemon that has stopped."""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise FideliusException(f"{path} already exists and is not a socket")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(path.as_posix())
+        except ConnectionRefusedError:
+            log.debug(f"Removing stale socket {path}")
+            path.unlink()
+            return
+    raise FideliusException(f"Another daemon is already listening on {path}")
+
+
+class Handler(socketserver.StreamRequestHandler):
+    server: 'Server'
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.respond(json.loads(line))
+            except (ValueError, KeyError, TypeError) as error:
+                response = {'ok': False, 'error': f"Invalid request: {error}"}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: pathlib.Path, secret_keeper: SecretKeeper):
+        if secret_keeper.secret_cache is None:
+            secret_keeper = attr.evolve(secret_keeper, secret_cache=SecretCache(ttl=None))
+        self.secret_keeper = secret_keeper
+        self.path = path
+        self.names = {}
+        for secret in secret_keeper:
+            self.names[secret_keeper.rel(secret.encrypted)] = secret
+            self.names[secret_keeper.rel(secret.decrypted)] = secret
+
+        # The socket serves plaintext, so other users mustn't be able to replace it.
+        private_directory(path.parent)
+        remove_stale_socket(path)
+
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path.as_posix(), Handler)
+        finally:
+            os.umask(umask)
+
+    def warm(self, jobs: typing.Optional[int] = None) -> None:
+        """Decrypt every secret into the cache."""
+        def read(secret: Secret) -> None:
+            try:
+                self.secret_keeper.read(secret)
+            except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+                log.error(f"Failed to decrypt {secret.encrypted}: {error}")
+
+        for _ in concurrently(read, list(self.secret_keeper), jobs):
+            pass
+
+    def lookup(self, name: str) -> Secret:
+        """Find a secret by its encrypted or decrypted path."""
+        secret = self.names.get(os.path.normpath(name))
+        if secret is None:
+            raise FideliusException(f"No secret named {name}")
+        return secret
+
+    def respond(self, request: dict) -> dict:
+        sk = self.secret_keeper
+        if request['op'] == 'list':
+            return {'ok': True, 'secrets': [
+                {'encrypted': sk.rel(s.encrypted), 'decrypted': sk.rel(s.decrypted)} for s in sk
+            ]}
+        elif request['op'] == 'get':
+            try:
+                contents = sk.read(self.lookup(request['path']))
+            except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+                return {'ok': False, 'error': str(error)}
+            return {'ok': True, 'contents': base64.b64encode(contents).decode('ascii')}
+        return {'ok': False, 'error': f"Unknown operation {request['op']!r}"}
+
+    def server_close(self):
+        super().server_close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+@attr.s
+class Client:
+    """Fetch secrets from a running daemon, reusing one connection."""
+
+    path: pathlib.Path = attr.ib()
+    connection: typing.Optional[socket.socket] = attr.ib(default=None, repr=False)
+    reader: typing.Optional[typing.BinaryIO] = attr.ib(default=None, repr=False)
+
+    def request(self, **request) -> dict:
+        if self.connection is None:
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(self.path.as_posix())
+            self.reader = self.connection.makefile('rb')
+
+        self.connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        response = json.loads(self.reader.readline())  # type: ignore
+        if not response['ok']:
+            raise FideliusException(response['error'])
+        return response
+
+    def list(self) -> typing.List[typing.Tuple[str, str]]:
+        return [(s['encrypted'], s['decrypted']) for s in self.request(op='list')['secrets']]
+
+    def get(self, path: str) -> bytes:
+        return base64.b64decode(self.request(op='get', path=path)['contents'])
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.reader.close()  # type: ignore
+            self.connection.close()
+            self.connection = self.reader = None
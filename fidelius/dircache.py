@@ -0,0 +1,97 @@
+"""
+A cache of directory listings used to speed up searching for secrets.
+
+Each directory's listing is stored alongside its modification time, which
+changes whenever an entry is added, removed or renamed in that directory. A
+directory is only scanned again when its modification time has changed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+import typing
+
+import attr
+
+from .utils import find_work_tree, git_directory
+
+log = logging.getLogger(__name__)
+
+#: Listings are sorted (name, is_directory) pairs.
+Entries = typing.List[typing.Tuple[str, bool]]
+
+#: Directories modified this recently might change again within the
+#: resolution of their timestamp, so their listings are never saved.
+RACY_NS = 2 * 10 ** 9
+
+
+@attr.s
+class DirectoryCache:
+    root: pathlib.Path = attr.ib()
+    path: typing.Optional[pathlib.Path] = attr.ib()
+    exclude: typing.List[str] = attr.ib()
+    previous: typing.Dict[str, list] = attr.ib(factory=dict, repr=False)
+    current: typing.Dict[str, list] = attr.ib(factory=dict, repr=False)
+    started: int = attr.ib(factory=time.time_ns)
+    hits: int = attr.ib(default=0)
+    misses: int = attr.ib(default=0)
+
+    @classmethod
+    def load(
+            cls,
+            root: pathlib.Path,
+            exclude: typing.AbstractSet[str]) -> 'DirectoryCache':
+        root = root.resolve()
+        exclude = sorted(exclude)
+        work_tree = find_work_tree(root)
+        if work_tree is None:
+            return cls(root=root, path=None, exclude=exclude)
+
+        name = hashlib.sha1(root.as_posix().encode('utf-8')).hexdigest()[:16]
+        path = git_directory(work_tree) / 'fidelius' / f'discovery-{name}.json'
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            data = None
+        except ValueError as error:
+            log.warning(f"Ignoring unreadable discovery cache {path}: {error}")
+            data = None
+
+        if data and data.get('root') == root.as_posix() and data.get('exclude') == exclude:
+            return cls(root=root, path=path, exclude=exclude, previous=data['directories'])
+        return cls(root=root, path=path, exclude=exclude)
+
+    def key(self, directory: pathlib.Path) -> str:
+        return directory.relative_to(self.root).as_posix()
+
+    def lookup(self, directory: pathlib.Path) -> typing.Tuple[int, typing.Optional[Entries]]:
+        """Return the directory's modification time and its cached listing."""
+        mtime = os.stat(directory).st_mtime_ns
+        key = self.key(directory)
+        cached = self.previous.get(key)
+        if cached and cached[0] == mtime:
+            self.hits += 1
+            self.current[key] = cached
+            return mtime, [(n.rstrip('/'), n.endswith('/')) for n in cached[1]]
+        self.misses += 1
+        return mtime, None
+
+    def store(self, directory: pathlib.Path, mtime: int, entries: Entries) -> None:
+        if mtime > self.started - RACY_NS:
+            return
+        names = [f'{n}/' if is_dir else n for n, is_dir in entries]
+        self.current[self.key(directory)] = [mtime, names]
+
+    def save(self) -> None:
+        log.debug(f"Discovery cache had {self.hits} hits and {self.misses} misses")
+        if self.path is None or self.current == self.previous:
+            return
+
+        data = {'root': self.root.as_posix(), 'exclude': self.exclude, 'directories': self.current}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f'.{self.path.name}.{os.getpid()}')
+        temporary.write_text(json.dumps(data, separators=(',', ':')))
+        os.replace(temporary, self.path)
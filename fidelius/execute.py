@@ -0,0 +1,213 @@
+"""
+Run a command with decrypted secrets that only exist in memory.
+
+Secrets are decrypted into a private directory on a memory-backed filesystem
+(like `/dev/shm`), which mirrors the relative decrypted path of each secret.
+With `memfd` set, the plaintext is instead held in anonymous memory files
+inherited by the command, and the directory only contains symlinks to
+`/proc/self/fd/N`, so the plaintext can't outlive the command even if
+fidelius is killed. Everything is removed when the command exits.
+"""
+
+import logging
+import os
+import pathlib
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import typing
+
+import attr
+
+from . import timings
+from .secrets import Outcome, Secret, SecretKeeper
+from .utils import FideliusException, concurrently
+
+log = logging.getLogger(__name__)
+
+
+def memory_directory() -> pathlib.Path:
+    """Find a directory on a memory-backed filesystem that this user can write to."""
+    for candidate in (os.environ.get('XDG_RUNTIME_DIR'), '/dev/shm', '/run/shm'):
+        if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK | os.X_OK):
+            return pathlib.Path(candidate)
+    raise FideliusException("No memory-backed directory (like /dev/shm) is available")
+
+
+def variable(name: str) -> str:
+    """
+    The environment variable holding the path to a secret.
+
+    Names are built from the relative decrypted path without `.decrypted`,
+    so `files/config.decrypted.json` is `FIDELIUS_FILES_CONFIG_JSON`.
+    """
+    name = re.sub(r'[^A-Za-z0-9]+', '_', name.replace('.decrypted', '')).strip('_')
+    return f'FIDELIUS_{name.upper()}'
+
+
+@attr.s
+class Vault:
+    """
+    Decrypted secrets held in memory for the lifetime of a command.
+
+    Use as a context manager so that the secrets are always removed:
+
+        with Vault(secret_keeper, secret_keeper.select(())) as vault:
+            vault.open()
+            vault.run(['make', 'deploy'])
+
+    With `links` set, each secret's real decrypted path is a symlink to its
+    copy in memory while the vault is open, for commands that expect to find
+    secrets next to their encrypted files.
+    """
+
+    secret_keeper: SecretKeeper = attr.ib()
+    secrets: typing.List[Secret] = attr.ib(converter=list)
+    base: typing.Optional[pathlib.Path] = attr.ib(default=None)
+    memfd: bool = attr.ib(default=False)
+    links: bool = attr.ib(default=False)
+    directory: typing.Optional[pathlib.Path] = attr.ib(default=None)
+    fds: typing.List[int] = attr.ib(factory=list, repr=False)
+    linked: typing.List[pathlib.Path] = attr.ib(factory=list, repr=False)
+    created: typing.List[pathlib.Path] = attr.ib(factory=list, repr=False)
+    lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False, cmp=False)
+
+    def __attrs_post_init__(self):
+        if self.memfd and not hasattr(os, 'memfd_create'):
+            raise FideliusException("memfd_create() is not available on this platform")
+
+    def __enter__(self) -> 'Vault':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def path(self, secret: Secret) -> pathlib.Path:
+        """Where a secret can be read from while the vault is open."""
+        if self.directory is None:
+            raise FideliusException("Secrets have not been decrypted yet")
+        return self.directory / self.secret_keeper.rel(secret.decrypted)
+
+    def open(self, jobs: typing.Optional[int] = None) -> typing.List[Outcome]:
+        """
+        Decrypt the secrets into memory using up to `jobs` concurrent threads.
+
+        Links are only created if every secret was decrypted.
+        """
+        if self.links:
+            existing = [s for s in self.secrets if os.path.lexists(s.decrypted)]
+            if existing:
+                raise FideliusException(
+                    f"Can't link secrets over existing plaintext, including "
+                    f"{self.secret_keeper.rel(existing[0].decrypted)} (run 'fidelius clean')")
+
+        self.directory = pathlib.Path(tempfile.mkdtemp(
+            prefix='fidelius-', dir=self.base or memory_directory()))
+        log.debug(f"Decrypting {len(self.secrets)} secrets into {self.directory}")
+        with timings.span('exec.decrypt', secrets=len(self.secrets), memfd=self.memfd):
+            outcomes = list(concurrently(self._write, self.secrets, jobs))
+
+        if self.links and not any(o.failed for o in outcomes):
+            for secret in self.secrets:
+                self._link(secret)
+        return outcomes
+
+    def _write(self, secret: Secret) -> Outcome:
+        path = self.path(secret)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if self.memfd:
+                fd = os.memfd_create(secret.decrypted.name)
+                with self.lock:
+                    self.fds.append(fd)
+                with open(fd, 'wb', closefd=False) as f:
+                    for chunk in secret.stream(self.secret_keeper.gpg):
+                        f.write(chunk)
+                os.symlink(f'/proc/self/fd/{fd}', path)
+            else:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with open(fd, 'wb') as f:
+                    for chunk in secret.stream(self.secret_keeper.gpg):
+                        f.write(chunk)
+        except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+            log.error(f"Failed to decrypt {self.secret_keeper.rel(secret.encrypted)}: {error}")
+            return Outcome(secret, 'failed', error)
+        return Outcome(secret, 'decrypted')
+
+    def _link(self, secret: Secret) -> None:
+        missing = [p for p in secret.decrypted.parents if not p.exists()]
+        for directory in reversed(missing):
+            directory.mkdir()
+            self.created.append(directory)
+        os.symlink(self.path(secret), secret.decrypted)
+        self.linked.append(secret.decrypted)
+
+    def environment(self) -> typing.Dict[str, str]:
+        """Variables pointing the command at the directory and each secret."""
+        environment = {'FIDELIUS_SECRETS': str(self.directory)}
+        for secret in self.secrets:
+            name = variable(self.secret_keeper.rel(secret.decrypted))
+            if name in environment:
+                log.warning(f"Not setting ${name} for {self.secret_keeper.rel(secret.encrypted)} "
+                            f"as another secret has the same name")
+                continue
+            environment[name] = str(self.path(secret))
+        return environment
+
+    def run(
+            self,
+            command: typing.Sequence[str],
+            env: typing.Optional[typing.Mapping[str, str]] = None) -> int:
+        """
+        Run a command with the secrets, returning its exit status.
+
+        SIGTERM and SIGHUP are passed on to the command, and fidelius waits
+        for it to exit before removing the secrets. Interrupts from the
+        terminal are received by the command directly.
+        """
+        environment = dict(os.environ if env is None else env)
+        environment.update(self.environment())
+        try:
+            process = subprocess.Popen(command, env=environment, pass_fds=self.fds)
+        except OSError as error:
+            raise FideliusException(f"Can't run {command[0]}: {error}")
+
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGHUP):
+                handlers[signum] = signal.signal(
+                    signum, lambda signum, frame: process.send_signal(signum))
+        try:
+            while True:
+                try:
+                    return process.wait()
+                except KeyboardInterrupt:
+                    continue
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def close(self) -> None:
+        """Remove the links (and directories made for them), the directory and the memory files."""
+        for path in self.linked:
+            if path.is_symlink():
+                path.unlink()
+        self.linked.clear()
+
+        for directory in reversed(self.created):
+            try:
+                directory.rmdir()
+            except OSError:
+                log.debug(f"Not removing {directory} as it is not empty")
+        self.created.clear()
+
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+        for fd in self.fds:
+            os.close(fd)
+        self.fds.clear()
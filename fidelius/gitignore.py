@@ -0,0 +1,334 @@
+"""
+Check paths against a repository's ignore rules without running git.
+
+Patterns are read from the global excludes file, '.git/info/exclude' and the
+'.gitignore' files between the root of the working tree and each path, and
+compiled into regular expressions once. Results are cached in the git
+directory, and each one is kept until an ignore file it depends on changes.
+Files tracked by git are found with a single 'git ls-files', and cached until
+the index changes.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import re
+import subprocess
+import typing
+
+import attr
+
+from . import timings
+from .utils import FideliusException, git_directory
+
+log = logging.getLogger(__name__)
+
+
+def translate(glob: str) -> str:
+    """Translate a gitignore glob into a regular expression."""
+    i, n, regex = 0, len(glob), ''
+    while i < n:
+        c = glob[i]
+        if glob.startswith('**/', i) and (i == 0 or glob[i - 1] == '/'):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if glob.startswith('**', i) and i + 2 == n and i > 0 and glob[i - 1] == '/':
+            regex += '.*'
+            i += 2
+            continue
+
+        i += 1
+        if c == '*':
+            while i < n and glob[i] == '*':
+                i += 1
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '\\' and i < n:
+            regex += re.escape(glob[i])
+            i += 1
+        elif c == '[':
+            j = i
+            if j < n and glob[j] in '!^':
+                j += 1
+            if j < n and glob[j] == ']':
+                j += 1
+            while j < n and glob[j] != ']':
+                j += 1
+            if j >= n:
+                regex += '\\['
+            else:
+                stuff = glob[i:j].replace('\\', '\\\\')
+                if stuff[0] in '!^':
+                    stuff = '^' + stuff[1:]
+                regex += f'[{stuff}]'
+                i = j + 1
+        else:
+            regex += re.escape(c)
+    return regex
+
+
+@attr.s(frozen=True)
+class Pattern:
+    regex: typing.Pattern = attr.ib()
+    negate: bool = attr.ib()
+    directory_only: bool = attr.ib()
+
+    @classmethod
+    def parse(cls, line: str) -> typing.Optional['Pattern']:
+        line = line.rstrip('\n').rstrip('\r')
+        # Trailing spaces are ignored unless they are escaped.
+        while line.endswith(' ') and not line.endswith('\\ '):
+            line = line[:-1]
+        if not line or line.startswith('#'):
+            return None
+
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+
+        directory_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+
+        if '/' in line:
+            regex = translate(line.lstrip('/'))
+        else:
+            regex = '(?:.*/)?' + translate(line)
+        return cls(re.compile(regex + r'\Z', re.DOTALL), negate, directory_only)
+
+    def match(self, path: str, is_dir: bool) -> bool:
+        if self.directory_only and not is_dir:
+            return False
+        return self.regex.match(path) is not None
+
+
+def read_patterns(path: pathlib.Path) -> typing.List[Pattern]:
+    try:
+        text = path.read_text(encoding='utf-8', errors='surrogateescape')
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        return []
+    return [p for p in map(Pattern.parse, text.splitlines()) if p is not None]
+
+
+def config_excludes_file(config: pathlib.Path) -> typing.Optional[str]:
+    """Read core.excludesFile from a git config file."""
+    try:
+        lines = config.read_text(encoding='utf-8', errors='replace').splitlines()
+    except OSError:
+        return None
+
+    section, value = None, None
+    for line in lines:
+        line = line.split('#')[0].split(';')[0].strip()
+        if line.startswith('['):
+            section = line.strip('[]').strip().lower()
+        elif section == 'core' and '=' in line:
+            key, _, v = line.partition('=')
+            if key.strip().lower() == 'excludesfile':
+                value = v.strip().strip('"')
+    return value
+
+
+def global_excludes_file(git_dir: pathlib.Path) -> pathlib.Path:
+    """Find the excludes file git uses for every repository."""
+    xdg = pathlib.Path(os.environ.get('XDG_CONFIG_HOME') or pathlib.Path.home() / '.config')
+    value = None
+    for config in (xdg / 'git' / 'config', pathlib.Path.home() / '.gitconfig', git_dir / 'config'):
+        value = config_excludes_file(config) or value
+    if value:
+        return pathlib.Path(os.path.expanduser(value))
+    return xdg / 'git' / 'ignore'
+
+
+Stat = typing.Optional[typing.List[int]]
+
+
+def stat(path: pathlib.Path) -> Stat:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+@attr.s
+class GitIgnore:
+    """
+    Ignore rules for a git working tree.
+
+    Results are kept in memory and written to the cache by `save()`, so that
+    several checks can share a single write.
+    """
+
+    root: pathlib.Path = attr.ib(converter=lambda p: p.resolve())
+    git_dir: pathlib.Path = attr.ib(default=None)
+    patterns: typing.Dict[str, typing.List[Pattern]] = attr.ib(factory=dict, repr=False)
+    directories: typing.Dict[str, bool] = attr.ib(factory=dict, repr=False)
+    cache: typing.Optional[typing.Dict[str, typing.Any]] = attr.ib(default=None, repr=False)
+    stats: typing.Dict[str, Stat] = attr.ib(factory=dict, repr=False)
+    index: typing.Optional[typing.Set[str]] = attr.ib(default=None, repr=False)
+    changed: bool = attr.ib(default=False, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.git_dir is None:
+            self.git_dir = git_directory(self.root)
+
+    @property
+    def cache_path(self) -> pathlib.Path:
+        return self.git_dir / 'fidelius' / 'gitignore.json'
+
+    def sources(self, base: str) -> typing.List[pathlib.Path]:
+        """The ignore files that apply to entries in a directory, in precedence order."""
+        if base == '':
+            return [
+                global_excludes_file(self.git_dir),
+                self.git_dir / 'info' / 'exclude',
+                self.root / '.gitignore',
+            ]
+        return [self.root / base / '.gitignore']
+
+    def stat(self, source: str) -> Stat:
+        if source not in self.stats:
+            self.stats[source] = stat(pathlib.Path(source))
+        return self.stats[source]
+
+    def depends(self, name: str) -> typing.List[str]:
+        """The ignore files that a path relative to the root is matched against."""
+        parts = name.split('/')
+        directories = ('/'.join(parts[:i]) for i in range(len(parts)))
+        return [s.as_posix() for d in directories for s in self.sources(d)]
+
+    def rules(self, base: str) -> typing.List[typing.Tuple[str, Pattern]]:
+        """Compiled patterns for entries in a directory, with the directory they apply to."""
+        if base not in self.patterns:
+            self.patterns[base] = [p for s in self.sources(base) for p in read_patterns(s)]
+        return [(base, p) for p in self.patterns[base]]
+
+    def match(self, path: str, is_dir: bool) -> bool:
+        parts = path.split('/')
+        rules = []
+        for i in range(len(parts)):
+            rules.extend(self.rules('/'.join(parts[:i])))
+
+        for base, pattern in reversed(rules):
+            relative = path[len(base) + 1:] if base else path
+            if pattern.match(relative, is_dir):
+                return not pattern.negate
+        return False
+
+    def ignored(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Check if a path relative to the root is ignored.
+
+        A path inside an ignored directory is always ignored, as git can't
+        re-include it.
+        """
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            directory = '/'.join(parts[:i])
+            if directory not in self.directories:
+                self.directories[directory] = self.match(directory, is_dir=True)
+            if self.directories[directory]:
+                return True
+        return self.match(path, is_dir)
+
+    def relative(self, path: pathlib.Path) -> typing.Optional[str]:
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith('..'):
+            return None
+        return pathlib.Path(relative).as_posix()
+
+    def load(self) -> typing.Dict[str, typing.Any]:
+        """
+        Read cached results, dropping any that depend on a file that has changed.
+
+        Results for paths are kept while the ignore files they were matched
+        against are unchanged, and results for tracked files while the index
+        is unchanged.
+        """
+        if self.cache is not None:
+            return self.cache
+        try:
+            cache = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            cache = {}
+
+        sources = cache.get('sources', {})
+        stale = {s for s, st in sources.items() if self.stat(s) != st}
+        results = {name: result for name, result in cache.get('results', {}).items()
+                   if not stale.intersection(self.depends(name))}
+        index = stat(self.git_dir / 'index')
+        tracked = cache.get('tracked', {}) if cache.get('index') == index else {}
+        self.cache = {
+            'sources': {s: st for s, st in sources.items() if s not in stale},
+            'results': results,
+            'index': index,
+            'tracked': tracked,
+        }
+        return self.cache
+
+    def save(self) -> None:
+        """Write results to the cache, if any have been added since it was read."""
+        if self.changed and self.git_dir.is_dir():
+            self.cache_path.parent.mkdir(exist_ok=True)
+            temporary = self.cache_path.with_name(f'.{self.cache_path.name}.{os.getpid()}')
+            temporary.write_text(json.dumps(self.cache))
+            os.replace(temporary, self.cache_path)
+            self.changed = False
+
+    def included(self, paths: typing.Iterable[pathlib.Path]) -> typing.Set[pathlib.Path]:
+        """Find which paths are not ignored, using cached results where possible."""
+        cache = self.load()
+        names = {path: self.relative(path) for path in paths}
+        for name in names.values():
+            if name is not None and name not in cache['results']:
+                cache['results'][name] = self.ignored(name)
+                cache['sources'].update((s, self.stat(s)) for s in self.depends(name))
+                self.changed = True
+        return {path for path, name in names.items()
+                if name is None or not cache['results'][name]}
+
+    def tracked(self, paths: typing.Iterable[pathlib.Path]) -> typing.Set[pathlib.Path]:
+        """
+        Find which paths are tracked by git, using cached results where possible.
+
+        The index is listed with 'git ls-files' at most once, the first time a
+        path isn't in the cache.
+        """
+        cache = self.load()
+        names = {}
+        for path in paths:
+            name = self.relative(path)
+            if name is None:
+                name = self.relative(pathlib.Path(os.path.realpath(path)))
+            if name is not None:
+                names[path] = name
+
+        for name in names.values():
+            if name not in cache['tracked']:
+                cache['tracked'][name] = name in self.list_index()
+                self.changed = True
+        return {path for path, name in names.items() if cache['tracked'][name]}
+
+    def list_index(self) -> typing.Set[str]:
+        """List the files in git's index."""
+        if self.index is None:
+            with timings.span('git ls-files'):
+                result = subprocess.run(
+                    ('git', 'ls-files', '-z', '--cached'),
+                    cwd=self.root,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    encoding='utf-8',
+                    errors='surrogateescape')
+            if result.returncode != 0:
+                raise FideliusException(
+                    f"Failed to list files tracked by git: {result.stderr.strip()}")
+            self.index = set(result.stdout.split('\0')) - {''}
+        return self.index
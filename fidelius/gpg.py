@@ -1,17 +1,110 @@
+import abc
 import logging
+import os
 import pathlib
+import shutil
 import subprocess
+import tempfile
+import time
 import typing
 
 import attr
 
+from . import timings
 from .utils import FideliusException
 
 log = logging.getLogger(__name__)
 
+STATUS_PREFIX = '[GNUPG:] '
+CHUNK_SIZE = 64 * 1024
+
+Pair = typing.Tuple[pathlib.Path, pathlib.Path]
+Results = typing.Dict[pathlib.Path, typing.Optional[Exception]]
+
+
+class Backend(abc.ABC):
+    """
+    Performs encryption and decryption for secrets.
+
+    Paths to encrypted files are passed with a flag showing if they should use
+    ASCII armour. Failures are logged with the path of the file that failed
+    and raised as exceptions.
+    """
+
+    parents: bool
+
+    @abc.abstractmethod
+    def decrypt(
+            self,
+            encrypted: pathlib.Path,
+            decrypted: pathlib.Path,
+            armour: bool) -> object:
+        """Decrypt an encrypted file, writing the plaintext to another file."""
+
+    def decrypt_many(self, pairs: typing.Sequence[Pair]) -> Results:
+        """Decrypt several files, returning the error (if any) for each one."""
+        results: Results = {}
+        for encrypted, decrypted in pairs:
+            try:
+                self.decrypt(encrypted, decrypted, armour=encrypted.suffix == '.asc')
+            except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+                results[encrypted] = error
+            else:
+                results[encrypted] = None
+        return results
+
+    @abc.abstractmethod
+    def contents(self, path: pathlib.Path, armour: bool) -> str:
+        """Decrypt an encrypted file, returning the plaintext."""
+
+    @abc.abstractmethod
+    def stream(self, path: pathlib.Path, armour: bool) -> typing.Iterator[bytes]:
+        """Decrypt an encrypted file, yielding chunks of plaintext bytes."""
+
+    @abc.abstractmethod
+    def encrypt_text(
+            self,
+            path: pathlib.Path,
+            text: str,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> object:
+        """Encrypt some text, writing the ciphertext to a file."""
+
+    @abc.abstractmethod
+    def encrypt_file(
+            self,
+            output: pathlib.Path,
+            encrypt: pathlib.Path,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> object:
+        """Encrypt a plaintext file, writing the ciphertext to another file."""
+
+    @abc.abstractmethod
+    def encrypt_stream(
+            self,
+            path: pathlib.Path,
+            chunks: typing.Iterable[bytes],
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        """Encrypt chunks of plaintext bytes, writing the ciphertext to a file."""
+
+    @abc.abstractmethod
+    def encryption_keys(self, recipient: str) -> typing.FrozenSet[str]:
+        """Find the IDs of the usable encryption keys for a recipient."""
+
+    def ensure_parent(self, decrypted: pathlib.Path) -> None:
+        if not decrypted.parent.exists():
+            if self.parents:
+                decrypted.parent.mkdir(parents=True, exist_ok=True)
+            else:
+                raise FideliusException(
+                    f"Directory {decrypted.parent} does not exist")
+
 
 @attr.s(frozen=True)
-class GPG:
+class GPG(Backend):
+    """A backend that runs the gpg command for each operation."""
+
     verbose: bool = attr.ib(default=False)
     parents: bool = attr.ib(default=True)
     home: typing.Optional[pathlib.Path] = attr.ib(default=None)
@@ -32,18 +125,27 @@ class GPG:
     def run(self,
             arguments: typing.Sequence[str],
             armour: bool,
-            stdin: typing.Optional[str] = None) -> subprocess.CompletedProcess:
+            stdin: typing.Optional[str] = None,
+            path: typing.Optional[pathlib.Path] = None) -> subprocess.CompletedProcess:
+        """
+        Run gpg, logging its STDERR output if it fails.
+
+        Each logged line is prefixed with the path being operated on, as
+        several gpg processes may be running at once.
+        """
+        operation = next((a for a in arguments if a in ('--decrypt', '--encrypt')), None)
         try:
-            return subprocess.run(
-                self.command(arguments, armour),
-                encoding='utf-8',
-                input=stdin,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True)
+            with timings.span('gpg', operation=operation, path=path):
+                return subprocess.run(
+                    self.command(arguments, armour),
+                    encoding='utf-8',
+                    input=stdin,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    check=True)
         except subprocess.CalledProcessError as error:
             for line in error.stderr.splitlines():
-                log.error(line)
+                log.error(f"{path}: {line}" if path else line)
             raise
 
     def decrypt(
@@ -53,22 +155,196 @@ class GPG:
             armour: bool) -> subprocess.CompletedProcess:
         """Run an appropriate decryption method on the encrypted file."""
         log.debug(f"Decrypting {encrypted} to {decrypted}")
-
-        if not decrypted.parent.exists():
-            if self.parents:
-                decrypted.parent.mkdir()
-            else:
-                raise FideliusException(
-                    f"Directory {decrypted.parent} does not exist")
-
+        self.ensure_parent(decrypted)
         return self.run([
             '--output', str(decrypted),
             '--decrypt', str(encrypted)
-        ], armour=armour)
+        ], armour=armour, path=encrypted)
+
+    def decrypt_many(self, pairs: typing.Sequence[Pair]) -> Results:
+        """
+        Decrypt several files with a single gpg process.
+
+        Runs gpg's --decrypt-files mode on numbered links to each encrypted
+        file. The links are placed in a private temporary directory next to
+        each decrypted file, so that gpg writes the plaintext to the same
+        filesystem and it can be moved into place with an atomic rename.
+        gpg's status output is used to work out which files were decrypted,
+        and returns the error (if any) for each encrypted file.
+        """
+        log.debug(f"Decrypting {len(pairs)} files")
+        results: Results = {}
+
+        # The working directory only holds a link to each staging directory,
+        # so that gpg can be given short names that don't contain spaces.
+        with tempfile.TemporaryDirectory(prefix='fidelius-') as temporary:
+            directory = pathlib.Path(temporary)
+            staging: typing.Dict[pathlib.Path, str] = {}
+            names: typing.Dict[int, str] = {}
+            try:
+                for i, (encrypted, decrypted) in enumerate(pairs):
+                    try:
+                        stage = self.stage(decrypted.parent, directory, staging)
+                        (directory / stage / f'{i}{encrypted.suffix}').symlink_to(
+                            encrypted.resolve())
+                    except (OSError, FideliusException) as error:
+                        results[encrypted] = error
+                    else:
+                        names[i] = f'{stage}/{i}{encrypted.suffix}'
+
+                try:
+                    with timings.span('gpg.decrypt-files', files=len(names)):
+                        stderr = self.run_decrypt_files(directory, names, pairs)
+                except OSError as error:
+                    return {encrypted: results.get(encrypted, error) for encrypted, _ in pairs}
+
+                preamble, statuses = self.file_statuses(stderr)
+                for i, name in names.items():
+                    encrypted, decrypted = pairs[i]
+                    output = directory / name[:-len(encrypted.suffix)]
+                    decrypted_okay, lines = statuses.get(name, (False, []))
+                    if not (decrypted_okay and output.exists()):
+                        results[encrypted] = self.file_error(encrypted, preamble + lines)
+                        continue
+
+                    try:
+                        os.replace(str(output), str(decrypted))
+                    except OSError as error:
+                        results[encrypted] = error
+                    else:
+                        results[encrypted] = None
+            finally:
+                for stage in staging.values():
+                    shutil.rmtree(os.readlink(str(directory / stage)), ignore_errors=True)
+
+        return {encrypted: results[encrypted] for encrypted, _ in pairs}
+
+    def stage(
+            self,
+            parent: pathlib.Path,
+            directory: pathlib.Path,
+            staging: typing.Dict[pathlib.Path, str]) -> str:
+        """
+        Find the name of a link in `directory` to a private directory in `parent`.
+
+        The private directory and the link to it are created the first time
+        they're needed, and recorded in `staging` so they can be removed.
+        """
+        if parent not in staging:
+            if not parent.exists():
+                if not self.parents:
+                    raise FideliusException(f"Directory {parent} does not exist")
+                parent.mkdir(parents=True, exist_ok=True)
+            private = tempfile.mkdtemp(prefix='.fidelius-', dir=str(parent))
+            name = str(len(staging))
+            (directory / name).symlink_to(private)
+            staging[parent] = name
+        return staging[parent]
+
+    @staticmethod
+    def file_error(encrypted: pathlib.Path, lines: typing.Sequence[str]) -> FideliusException:
+        """Log the messages gpg printed about a file that failed to decrypt."""
+        for line in lines:
+            log.error(f"{encrypted}: {line}")
+        if lines:
+            return FideliusException(f"Failed to decrypt {encrypted}: {'; '.join(lines)}")
+        return FideliusException(f"Failed to decrypt {encrypted}")
+
+    def run_decrypt_files(
+            self,
+            directory: pathlib.Path,
+            names: typing.Dict[int, str],
+            pairs: typing.Sequence[Pair]) -> str:
+        """
+        Run gpg's --decrypt-files mode, returning its status output.
+
+        Status lines are read as gpg writes them, so that the time gpg spent
+        on each file can be recorded.
+        """
+        process = subprocess.Popen(
+            self.command(
+                ['--status-fd', '2', '--decrypt-files', *names.values()], armour=False),
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            encoding='utf-8')
+        paths = {name: pairs[i][0] for i, name in names.items()}
+        lines = []
+        name, start = None, 0.0
+        with process:
+            for line in process.stderr:  # type: ignore
+                lines.append(line)
+                if line.startswith(STATUS_PREFIX + 'FILE_START '):
+                    name, start = line.split()[-1], time.perf_counter()
+                elif line.startswith(STATUS_PREFIX + 'FILE_DONE') and name is not None:
+                    timings.record('gpg.file', start, path=paths.get(name))
+                    name = None
+        return ''.join(lines)
+
+    @staticmethod
+    def file_statuses(stderr: str) -> typing.Tuple[
+            typing.List[str], typing.Dict[str, typing.Tuple[bool, typing.List[str]]]]:
+        """
+        Parse the status output of a --decrypt-files run.
+
+        Returns the messages gpg printed before starting on the first file,
+        which apply to every file, and for each file a flag showing if it was
+        decrypted and the messages gpg printed while working on it.
+        """
+        statuses: typing.Dict[str, typing.Tuple[bool, typing.List[str]]] = {}
+        preamble: typing.List[str] = []
+        name: typing.Optional[str] = None
+        okay, lines = False, preamble
+        for line in stderr.splitlines():
+            if not line.startswith(STATUS_PREFIX):
+                lines.append(line)
+                continue
+
+            keyword, *arguments = line[len(STATUS_PREFIX):].split(' ')
+            if keyword == 'FILE_START':
+                name, okay, lines = arguments[-1], False, []
+            elif keyword == 'DECRYPTION_OKAY':
+                okay = True
+            elif keyword == 'DECRYPTION_FAILED':
+                okay = False
+            elif keyword == 'FILE_DONE' and name is not None:
+                statuses[name] = (okay, lines)
+                name = None
+        return preamble, statuses
 
     def contents(self, path: pathlib.Path, armour: bool) -> str:
-        log.debug("Reading contents of {path}")
-        return self.run(['--decrypt', str(path)], armour).stdout
+        log.debug(f"Reading contents of {path}")
+        return self.run(['--decrypt', str(path)], armour, path=path).stdout
+
+    def stream(self, path: pathlib.Path, armour: bool) -> typing.Iterator[bytes]:
+        """
+        Decrypt a file, yielding plaintext as gpg writes it.
+
+        Memory use does not depend on the size of the file, and the plaintext
+        is never decoded, so binary secrets are passed through unchanged.
+        """
+        log.debug(f"Streaming contents of {path}")
+        return timings.timed('gpg.stream', self._stream(path, armour), path=path)
+
+    def _stream(self, path: pathlib.Path, armour: bool) -> typing.Iterator[bytes]:
+        command = self.command(['--decrypt', str(path)], armour)
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr)
+            try:
+                yield from iter(lambda: process.stdout.read1(CHUNK_SIZE), b'')  # type: ignore
+            finally:
+                process.stdout.close()  # type: ignore
+                returncode = process.wait()
+
+            if returncode:
+                stderr.seek(0)
+                for line in stderr.read().decode('utf-8', errors='replace').splitlines():
+                    log.error(f"{path}: {line}")
+                raise subprocess.CalledProcessError(returncode, command)
 
     def encrypt_text(
             self,
@@ -81,7 +357,7 @@ class GPG:
         for recipient in recipients:
             args += ['--recipient', recipient]
         args += ['--output', str(path), '--encrypt']
-        return self.run(args, armour=armour, stdin=text)
+        return self.run(args, armour=armour, stdin=text, path=path)
 
     def encrypt_file(
             self,
@@ -94,4 +370,71 @@ class GPG:
         for recipient in recipients:
             args += ['--recipient', recipient]
         args += ['--output', str(output), '--encrypt', str(encrypt)]
-        self.run(args, armour)
+        self.run(args, armour, path=encrypt)
+
+    def encrypt_stream(
+            self,
+            path: pathlib.Path,
+            chunks: typing.Iterable[bytes],
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        """
+        Encrypt plaintext as it is produced, writing it to gpg's STDIN.
+
+        If the chunks raise an exception, gpg is stopped before it finishes
+        writing the output file and the exception is raised again.
+        """
+        log.debug(f"Encrypting a stream to {path}")
+        args: typing.List[str] = []
+        for recipient in recipients:
+            args += ['--recipient', recipient]
+        command = self.command([*args, '--output', str(path), '--encrypt'], armour)
+        with timings.span('gpg', operation='--encrypt', path=path), \
+                tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=stderr)
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)  # type: ignore
+            except BrokenPipeError:
+                pass
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                try:
+                    process.stdin.close()  # type: ignore
+                except BrokenPipeError:
+                    pass
+
+            returncode = process.wait()
+            if returncode:
+                stderr.seek(0)
+                for line in stderr.read().decode('utf-8', errors='replace').splitlines():
+                    log.error(f"{path}: {line}")
+                raise subprocess.CalledProcessError(returncode, command)
+
+    def encryption_keys(self, recipient: str) -> typing.FrozenSet[str]:
+        """
+        Find the IDs of the keys gpg could encrypt to for a recipient.
+
+        Keys and subkeys that are invalid, disabled, revoked or expired, or
+        can't be used for encryption, are not included.
+        """
+        result = subprocess.run(
+            self.command(['--with-colons', '--list-keys', '--', recipient], armour=False),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding='utf-8')
+        keys = set()
+        for line in result.stdout.splitlines():
+            fields = line.split(':')
+            if len(fields) < 12 or fields[0] not in ('pub', 'sub'):
+                continue
+            if fields[1] not in ('i', 'd', 'r', 'e', 'n') and 'e' in fields[11]:
+                keys.add(fields[4].upper())
+        return frozenset(keys)
@@ -0,0 +1,186 @@
+"""
+An in-process backend using the GPGME Python bindings.
+
+The bindings are an optional dependency, installed with `pip install gpg` or a
+system package such as `python3-gpg`. One GPGME context is created for each
+thread and reused for every operation that thread performs.
+"""
+
+import logging
+import pathlib
+import re
+import threading
+import typing
+
+import attr
+
+from .gpg import CHUNK_SIZE, Backend
+from .utils import FideliusException
+
+log = logging.getLogger(__name__)
+
+KEY_ID = re.compile(r'(?:0x)?([0-9A-Fa-f]{8,40})')
+
+
+def usable(key) -> bool:
+    """Check a key can be used for encryption."""
+    return key.can_encrypt and not (key.invalid or key.disabled or key.revoked or key.expired)
+
+
+def names(key, recipient: str) -> bool:
+    """
+    Check a recipient names a key exactly.
+
+    Recipients can be a fingerprint or key ID, an email address (with or
+    without angle brackets), or a whole user ID. Unlike gpg, a recipient that
+    is only part of a user ID doesn't match.
+    """
+    match = KEY_ID.fullmatch(recipient)
+    if match:
+        wanted = match.group(1).upper()
+        fingerprints = (key.fpr, *(subkey.fpr for subkey in key.subkeys))
+        return any(fpr and fpr.upper().endswith(wanted) for fpr in fingerprints)
+
+    recipient = recipient[1:] if recipient.startswith('=') else recipient
+    email = recipient.strip('<>').lower()
+    return any(uid.uid == recipient or (uid.email or '').lower() == email for uid in key.uids)
+
+
+def recipient_keys(
+        keylist: typing.Callable[[str], typing.Iterable[typing.Any]],
+        recipients: typing.Iterable[str]) -> typing.List[typing.Any]:
+    """
+    Find exactly one usable key for each recipient.
+
+    `keylist` finds the candidate keys for a recipient. An exception is raised
+    if a recipient doesn't name exactly one usable key, or if there are no
+    recipients, rather than letting GPGME fall back to a passphrase.
+    """
+    keys = []
+    for recipient in recipients:
+        candidates = [k for k in keylist(recipient) if names(k, recipient) and usable(k)]
+        if not candidates:
+            raise FideliusException(f"No usable encryption key for {recipient}")
+        if len(candidates) > 1:
+            raise FideliusException(
+                f"More than one key for {recipient}: {', '.join(k.fpr for k in candidates)}")
+        keys.extend(candidates)
+    if not keys:
+        raise FideliusException("No recipients to encrypt for")
+    return keys
+
+
+@attr.s(frozen=True)
+class GPGME(Backend):
+    """A backend that uses GPGME contexts instead of running gpg."""
+
+    parents: bool = attr.ib(default=True)
+    home: typing.Optional[pathlib.Path] = attr.ib(default=None)
+    local: threading.local = attr.ib(factory=threading.local, init=False, repr=False, cmp=False)
+
+    def __attrs_post_init__(self):
+        try:
+            import gpg  # noqa: F401
+        except ImportError:
+            raise FideliusException(
+                "The gpgme backend needs the GPGME Python bindings (pip install gpg)")
+
+    def context(self, armour: bool):
+        import gpg
+
+        context = getattr(self.local, 'context', None)
+        if context is None:
+            home_dir = self.home.as_posix() if self.home else None
+            context = self.local.context = gpg.Context(home_dir=home_dir)
+        context.armor = armour
+        return context
+
+    def _decrypt(self, path: pathlib.Path, armour: bool) -> bytes:
+        import gpg.errors
+
+        try:
+            with path.open('rb') as f:
+                plaintext, _, _ = self.context(armour).decrypt(f, verify=False)
+        except gpg.errors.GpgError as error:
+            log.error(f"{path}: {error}")
+            raise FideliusException(f"Failed to decrypt {path}") from error
+        return plaintext
+
+    def _encrypt(
+            self,
+            path: pathlib.Path,
+            plaintext: bytes,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        import gpg.errors
+
+        context = self.context(armour)
+        try:
+            keys = recipient_keys(lambda r: context.keylist(pattern=r), recipients)
+            ciphertext, _, _ = context.encrypt(plaintext, recipients=keys, sign=False)
+        except gpg.errors.GpgError as error:
+            log.error(f"{path}: {error}")
+            raise FideliusException(f"Failed to encrypt {path}") from error
+        path.write_bytes(ciphertext)
+
+    def decrypt(
+            self,
+            encrypted: pathlib.Path,
+            decrypted: pathlib.Path,
+            armour: bool) -> None:
+        log.debug(f"Decrypting {encrypted} to {decrypted}")
+        plaintext = self._decrypt(encrypted, armour)
+        self.ensure_parent(decrypted)
+        decrypted.write_bytes(plaintext)
+
+    def contents(self, path: pathlib.Path, armour: bool) -> str:
+        log.debug(f"Reading contents of {path}")
+        return self._decrypt(path, armour).decode('utf-8')
+
+    def stream(self, path: pathlib.Path, armour: bool) -> typing.Iterator[bytes]:
+        """
+        Decrypt a file, yielding chunks of plaintext bytes.
+
+        GPGME decrypts the whole file into memory first, so unlike GPG.stream
+        memory use grows with the size of the file.
+        """
+        log.debug(f"Streaming contents of {path}")
+        plaintext = memoryview(self._decrypt(path, armour))
+        for i in range(0, len(plaintext), CHUNK_SIZE):
+            yield bytes(plaintext[i:i + CHUNK_SIZE])
+
+    def encrypt_text(
+            self,
+            path: pathlib.Path,
+            text: str,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        log.debug(f"Encrypting {path}")
+        self._encrypt(path, text.encode('utf-8'), armour, recipients)
+
+    def encrypt_file(
+            self,
+            output: pathlib.Path,
+            encrypt: pathlib.Path,
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        log.debug(f"Encrypting {encrypt} to {output}")
+        self._encrypt(output, encrypt.read_bytes(), armour, recipients)
+
+    def encrypt_stream(
+            self,
+            path: pathlib.Path,
+            chunks: typing.Iterable[bytes],
+            armour: bool,
+            recipients: typing.Iterable[str]) -> None:
+        log.debug(f"Encrypting a stream to {path}")
+        self._encrypt(path, b''.join(chunks), armour, recipients)
+
+    def encryption_keys(self, recipient: str) -> typing.FrozenSet[str]:
+        context = self.context(armour=False)
+        return frozenset(
+            subkey.keyid.upper()
+            for key in context.keylist(pattern=recipient)
+            for subkey in key.subkeys
+            if subkey.can_encrypt and not (
+                subkey.invalid or subkey.disabled or subkey.revoked or subkey.expired))
@@ -3,14 +3,21 @@ Each Incantation can be converted to a list of secrets.
 """
 
 import logging
+import os
 import pathlib
+import subprocess
+import time
 import typing
 
 import attr
 
+from . import timings
+from .dircache import DirectoryCache, Entries
+from .gitignore import GitIgnore
 from .gpg import GPG
-from .secrets import Secret, SecretKeeper
-from .utils import in_directories
+from .index import SecretIndex
+from .secrets import Secret, SecretKeeper, check_ignored
+from .utils import FideliusException, batches, find_work_tree
 
 log = logging.getLogger(__name__)
 
@@ -19,62 +26,225 @@ Pairs = typing.Sequence[Pair]
 PairMap = typing.Dict[pathlib.Path, Secret]
 
 
+#: Directories that are never searched for secrets.
+EXCLUDE = frozenset({
+    '.git', '.hg', '.svn', '.tox', '.nox', '.mypy_cache', '.pytest_cache',
+    '__pycache__', 'node_modules',
+})
+
+
 @attr.s(frozen=True)
 class Fidelius:
     """
     Search for secrets to encrypt/decrypt in a directory.
 
-    Selects files and directories with '.encrypted' in the name.
+    Selects files and directories with '.encrypted' in the name. Candidates
+    are found by walking the filesystem, or by listing the files git knows
+    about when `discovery` is 'git' ('auto' uses git inside a repository).
+    Filesystem searches can cache directory listings inside the git directory.
     """
 
     directory: pathlib.Path = attr.ib(factory=pathlib.Path.cwd)
+    exclude: typing.AbstractSet[str] = attr.ib(default=EXCLUDE)
+    discovery: str = attr.ib(
+        default='filesystem',
+        validator=attr.validators.in_(('auto', 'filesystem', 'git')))
+    cache: bool = attr.ib(default=False)
 
     def cast(self, **kwargs) -> SecretKeeper:
         return SecretKeeper(secrets=self.search(), directory=self.directory, **kwargs)
 
+    def cast_lazily(self, verify_gitignore: bool = False, **kwargs) -> SecretKeeper:
+        """
+        Create a SecretKeeper that only searches for secrets when it needs them.
+
+        `SecretKeeper.stream()` (and the `*_each` methods, when not given any
+        secrets) use secrets as they are found, and keep them once the search
+        has finished. Anything that needs every secret waits for the search to
+        finish. Decrypted paths are checked against .gitignore as secrets are
+        found, so an exception can be raised after some secrets have been
+        used; use `cast()` and `run_gitignore_check()` to check every path
+        before using any secrets.
+        """
+        index = SecretIndex(self.directory, source=lambda: self.discover(verify_gitignore))
+        return SecretKeeper(secrets=index, directory=self.directory, **kwargs)
+
     def search(self) -> PairMap:
         log.info(f"Searching for encrypted files in {self.directory}")
-        pairs: typing.List[Pair] = []
+        with timings.span('search', discovery=self.discovery) as attributes:
+            pairs = list(self.git() if self.use_git() else self.walk())
+            attributes['secrets'] = len(pairs)
+        log.info(f"Search found {len(pairs)} encrypted files in {self.directory}")
 
-        directories = self.directories(self.directory, '**/*.encrypted*')
-        log.info(f"Found {len(directories)} encrypted directories")
+        secrets = {encrypted: Secret(
+            encrypted=encrypted,
+            decrypted=decrypted,
+        ) for encrypted, decrypted in pairs}
 
-        for enc_dir in sorted(directories):
-            dec_dir = self.rename_directory(enc_dir)
-            for enc_path in enc_dir.glob('**/*'):
-                if enc_path.is_file():
-                    pairs.append((enc_path, self.rename(self.transpose(
-                        enc_path, from_dir=enc_dir, to_dir=dec_dir))))
+        return secrets
 
-        files = [f for f in self.files(self.directory, '**/*.encrypted*')
-                 if not in_directories(f, directories)]
-        log.info(f"Found {len(files)} encrypted files")
+    def discover(self, verify_gitignore: bool = False) -> typing.Iterator[Secret]:
+        """
+        Yield secrets in order as they are found.
 
-        for enc_path in sorted(files):
-            pairs.append((enc_path, self.rename(enc_path)))
+        Decrypted paths are checked against .gitignore in batches, which start
+        with a single secret and grow as more are found. A secret is only
+        yielded once its decrypted path is known to be ignored, so secrets
+        found before a path that isn't ignored may already have been used
+        when the exception is raised.
+        """
+        log.info(f"Searching for encrypted files in {self.directory}")
+        work_tree = find_work_tree(self.directory)
+        gitignore = None if verify_gitignore or work_tree is None else GitIgnore(work_tree)
+        pairs = batches(self.git() if self.use_git() else self.walk(), jobs=1, size=256)
+        try:
+            while True:
+                # Only the search is timed, not the work done with each batch.
+                start = time.perf_counter()
+                batch = next(pairs, None)
+                if batch is None:
+                    return
+                timings.record('search', start, discovery=self.discovery, secrets=len(batch))
 
-        log.info(f"Search found {len(pairs)} encrypted files in {self.directory}")
+                secrets = [Secret(encrypted=encrypted, decrypted=decrypted)
+                           for encrypted, decrypted in batch]
+                decrypted = {s.decrypted for s in secrets}
+                check_ignored(decrypted, work_tree, verify_gitignore, gitignore)
+                yield from secrets
+        finally:
+            if gitignore is not None:
+                gitignore.save()
 
-        secrets = {encrypted.resolve(): Secret(
-            encrypted=encrypted.resolve(),
-            decrypted=decrypted.resolve(),
-        ) for encrypted, decrypted in pairs}
+    def use_git(self) -> bool:
+        if self.discovery == 'auto':
+            return find_work_tree(self.directory) is not None
+        return self.discovery == 'git'
 
-        return secrets
+    def git(self) -> typing.Iterator[Pair]:
+        """
+        Find pairs of encrypted and decrypted paths from git's index.
 
-    @staticmethod
-    def directories(
+        Lists tracked files and untracked files that are not ignored, so only
+        files git knows about are considered. Pairs are sorted by their
+        encrypted path, matching the order of a filesystem walk.
+        """
+        root = self.directory.resolve()
+        try:
+            result = subprocess.run(
+                ('git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'),
+                cwd=root,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                encoding='utf-8',
+                check=True)
+        except (OSError, subprocess.CalledProcessError) as error:
+            raise FideliusException(f"Could not list files in {root} with git: {error}")
+
+        pairs = []
+        for name in set(result.stdout.split('\0')):
+            if '.encrypted' not in name:
+                continue
+            parts = pathlib.PurePosixPath(name).parts
+            if self.exclude.intersection(parts[:-1]):
+                continue
+            pair = self.pair(root, parts)
+            # Files deleted from the working tree are still in the index.
+            if pair and pair[0].is_file():
+                pairs.append((self.target(pair[0]), pair[1]))
+        return iter(sorted(pairs))
+
+    def pair(self, root: pathlib.Path, parts: typing.Sequence[str]) -> typing.Optional[Pair]:
+        """Apply the renaming rules to a path relative to the root directory."""
+        path = root.joinpath(*parts)
+        for i in reversed(range(len(parts) - 1)):
+            if '.encrypted' in parts[i]:
+                enc_dir = root.joinpath(*parts[:i + 1])
+                return path, self.rename(self.transpose(
+                    path, from_dir=enc_dir, to_dir=self.rename_directory(enc_dir)))
+        if '.encrypted' in parts[-1]:
+            return path, self.rename(path)
+        return None
+
+    def walk(self) -> typing.Iterator[Pair]:
+        """
+        Find pairs of encrypted and decrypted paths in a single pass.
+
+        Directories are visited once each, in sorted order, so pairs are found
+        sorted by their encrypted path (or for symlinked files, the path of the
+        link). Excluded directories and symlinks to directories are not
+        descended into. When `cache` is set, directories that have not changed
+        since the last search are not listed again.
+        """
+        root = self.directory.resolve()
+        if not self.cache:
+            return self._walk(root, None, None)
+        return self._cached_walk(root, DirectoryCache.load(root, self.exclude))
+
+    def _cached_walk(self, root: pathlib.Path, cache: DirectoryCache) -> typing.Iterator[Pair]:
+        yield from self._walk(root, None, cache)
+        cache.save()
+
+    def _walk(
+            self,
             directory: pathlib.Path,
-            pattern: str) -> typing.Sequence[pathlib.Path]:
-        """Find directories that match a pattern."""
-        return tuple(sorted(p for p in directory.glob(pattern) if p.is_dir()))
+            encrypted: typing.Optional[Pair],
+            cache: typing.Optional[DirectoryCache]) -> typing.Iterator[Pair]:
+        for name, is_dir in self._entries(directory, encrypted is not None, cache):
+            path = directory / name
+            if is_dir:
+                if '.encrypted' in name:
+                    log.debug(f"Found encrypted directory {path}")
+                    yield from self._walk(path, (path, self.rename_directory(path)), cache)
+                else:
+                    yield from self._walk(path, encrypted, cache)
+            elif encrypted:
+                enc_dir, dec_dir = encrypted
+                yield self.target(path), self.rename(self.transpose(
+                    path, from_dir=enc_dir, to_dir=dec_dir))
+            else:
+                yield self.target(path), self.rename(path)
 
-    @staticmethod
-    def files(
+    def _entries(
+            self,
             directory: pathlib.Path,
-            pattern: str) -> typing.Sequence[pathlib.Path]:
-        """Find our files that are not in the directories we already have."""
-        return tuple(sorted(p for p in directory.glob(pattern) if p.is_file()))
+            in_encrypted: bool,
+            cache: typing.Optional[DirectoryCache]) -> Entries:
+        """List the subdirectories and candidate files in a directory."""
+        mtime = 0
+        try:
+            if cache is not None:
+                mtime, entries = cache.lookup(directory)
+                if entries is not None:
+                    return entries
+
+            entries = []
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in self.exclude:
+                            entries.append((entry.name, True))
+                    elif entry.is_file() and (in_encrypted or '.encrypted' in entry.name):
+                        entries.append((entry.name, False))
+        except OSError as error:
+            log.warning(f"Can't search {directory}: {error}")
+            return []
+
+        entries.sort()
+        if cache is not None:
+            cache.store(directory, mtime, entries)
+        return entries
+
+    @staticmethod
+    def target(path: pathlib.Path) -> pathlib.Path:
+        """
+        Find the file a symlinked secret points to.
+
+        The decrypted path is still named after the link, but the secret is
+        read from and written to the file it points to.
+        """
+        if os.path.islink(path):
+            return pathlib.Path(os.path.realpath(path))
+        return path
 
     @staticmethod
     def rename_directory(path: pathlib.Path) -> pathlib.Path:
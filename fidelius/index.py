@@ -0,0 +1,236 @@
+"""
+A sorted index of secrets, keyed by their path relative to the repository.
+
+Paths are normalised to relative names with string operations only, so
+looking up a secret never touches the filesystem. Names are kept in a sorted
+list, so secrets are iterated in order without sorting them again and every
+secret in a directory can be found with a binary search. Globs are matched
+against names in the smallest directory that contains every match.
+
+An index can be given a source of secrets instead, which is only searched
+when something needs every secret. Until then, `stream()` yields secrets
+from the source as they are found without keeping them.
+"""
+
+import bisect
+import os
+import pathlib
+import re
+import typing
+
+if typing.TYPE_CHECKING:
+    from .secrets import Secret
+
+PathLike = typing.Union[str, os.PathLike]
+
+GLOB_CHARACTERS = re.compile(r'[*?\[]')
+
+#: Absolute paths that `os.path.abspath()` would change.
+UNNORMALISED = re.compile(r'//|/\.\.?(?:/|$)|/$')
+
+
+def key(name: str) -> str:
+    """
+    The sort key for a relative name.
+
+    Separators sort before every other character, so names are ordered the
+    same way as paths (`a/b` sorts before `a-b/c` and `a.encrypted/d`).
+    """
+    return name.replace('/', '\0')
+
+
+def translate(pattern: str) -> typing.Pattern:
+    """
+    Convert a glob to a regular expression matching relative names.
+
+    `*` and `?` don't match across directories, `**` matches any number of
+    directories, and `[...]` matches a single character from a set.
+    """
+    regex, i = '', 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if pattern.startswith('**/', i - 1):
+            regex += '(?:.*/)?'
+            i += 2
+        elif pattern.startswith('**', i - 1):
+            regex += '.*'
+            i += 1
+        elif c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[' and ']' in pattern[i + 1:]:
+            end = pattern.index(']', i + 1)
+            characters = pattern[i:end].replace('\\', '\\\\')
+            if characters.startswith('!'):
+                characters = '^' + characters[1:]
+            regex += f'[{characters}]'
+            i = end + 1
+        else:
+            regex += re.escape(c)
+    return re.compile(regex, re.DOTALL)
+
+
+def within(keys: typing.List[str], prefix: str) -> range:
+    """The positions of sorted keys that are `prefix` or are inside it."""
+    prefix = prefix.rstrip('\0')
+    if not prefix:
+        return range(len(keys))
+    # Separators are the lowest character, so everything inside `prefix`
+    # sorts between it and the same key followed by the next character.
+    return range(bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + '\1'))
+
+
+class SecretIndex(typing.MutableMapping[pathlib.Path, 'Secret']):
+    """
+    Secrets keyed by encrypted path, stored in order of their relative names.
+
+    Behaves like a dict of secrets keyed by absolute encrypted path, and
+    accepts relative paths (from the current directory) as keys too. Paths
+    outside the root directory are indexed by their absolute path.
+
+    With a `source`, secrets are searched for when first needed, and can be
+    streamed while the search is still running.
+    """
+
+    def __init__(
+            self,
+            root: PathLike,
+            secrets: typing.Optional[typing.Mapping[pathlib.Path, 'Secret']] = None,
+            source: typing.Optional[typing.Callable[[], typing.Iterator['Secret']]] = None):
+        root = os.path.abspath(root)
+        self.roots = tuple(
+            r if r.endswith(os.sep) else r + os.sep
+            for r in dict.fromkeys((root, os.path.realpath(root))))
+        self.secrets: typing.Dict[str, 'Secret'] = {}
+        for secret in (secrets or {}).values():
+            self.secrets[key(self.name(secret.encrypted))] = secret
+        self.order = sorted(self.secrets)
+        self.decrypted: typing.Optional[typing.Tuple[typing.List[str], typing.List[str]]] = None
+        self.source = source
+
+    def fill(self) -> None:
+        """Search the source for every secret, if that hasn't happened yet."""
+        if self.source is None:
+            return
+        for secret in self.source():
+            k = key(self.name(secret.encrypted))
+            if k not in self.secrets:
+                self.secrets[k] = secret
+                # Sources usually yield secrets in order, so this is an append.
+                bisect.insort(self.order, k)
+        self.source = None
+        self.decrypted = None
+
+    def stream(self) -> typing.Iterator['Secret']:
+        """
+        Yield secrets from the source as they're found, or every secret in order.
+
+        Secrets are kept once the source has been read to the end, so the
+        search only runs again if an earlier stream was stopped part way.
+        """
+        if self.source is None:
+            return iter(self.values())
+        return self._stream(self.source)
+
+    def _stream(
+            self,
+            source: typing.Callable[[], typing.Iterator['Secret']]) -> typing.Iterator['Secret']:
+        found = []
+        for secret in source():
+            found.append(secret)
+            yield secret
+        if self.source is source:
+            for secret in found:
+                self.secrets.setdefault(key(self.name(secret.encrypted)), secret)
+            self.order = sorted(self.secrets)
+            self.source = None
+            self.decrypted = None
+
+    def __repr__(self):
+        if self.source is not None:
+            return f'{type(self).__name__}({self.roots[0][:-1]!r}, not searched yet)'
+        return f'{type(self).__name__}({self.roots[0][:-1]!r}, {len(self.order)} secrets)'
+
+    def name(self, path: PathLike) -> str:
+        """Convert a path to a name relative to the root, without resolving it."""
+        path = os.fspath(path)
+        if os.sep != '/' or not path.startswith('/') or UNNORMALISED.search(path):
+            path = os.path.abspath(path)
+        for root in self.roots:
+            if path.startswith(root):
+                path = path[len(root):]
+                break
+            if path + os.sep == root:
+                return ''
+        return path.replace(os.sep, '/')
+
+    def __getitem__(self, path: PathLike) -> 'Secret':
+        self.fill()
+        return self.secrets[key(self.name(path))]
+
+    def __setitem__(self, path: PathLike, secret: 'Secret') -> None:
+        self.fill()
+        k = key(self.name(path))
+        if k not in self.secrets:
+            bisect.insort(self.order, k)
+        self.secrets[k] = secret
+        self.decrypted = None
+
+    def __delitem__(self, path: PathLike) -> None:
+        self.fill()
+        k = key(self.name(path))
+        del self.secrets[k]
+        del self.order[bisect.bisect_left(self.order, k)]
+        self.decrypted = None
+
+    def __contains__(self, path: object) -> bool:
+        if not isinstance(path, (str, os.PathLike)):
+            return False
+        self.fill()
+        return key(self.name(path)) in self.secrets
+
+    def __iter__(self) -> typing.Iterator[pathlib.Path]:
+        self.fill()
+        return (self.secrets[k].encrypted for k in self.order)
+
+    def __len__(self) -> int:
+        self.fill()
+        return len(self.order)
+
+    def values(self) -> typing.List['Secret']:  # type: ignore
+        """Every secret, in order."""
+        self.fill()
+        return [self.secrets[k] for k in self.order]
+
+    def items(self) -> typing.List[typing.Tuple[pathlib.Path, 'Secret']]:  # type: ignore
+        return [(s.encrypted, s) for s in self.values()]
+
+    def prefix(self, directory: PathLike) -> typing.List['Secret']:
+        """Every secret with an encrypted or decrypted path in a directory."""
+        return self._find(key(self.name(directory)), None)
+
+    def glob(self, pattern: str) -> typing.List['Secret']:
+        """Every secret with an encrypted or decrypted path matching a glob."""
+        name = self.name(pattern)
+        match = GLOB_CHARACTERS.search(name)
+        literal = name[:match.start()] if match else name
+        return self._find(key(literal[:literal.rfind('/') + 1]), translate(name))
+
+    def _find(self, prefix: str, regex: typing.Optional[typing.Pattern]) -> typing.List['Secret']:
+        """Find secrets inside a prefix with a name matching a regex, in order."""
+        self.fill()
+        if self.decrypted is None:
+            pairs = sorted((key(self.name(s.decrypted)), k) for k, s in self.secrets.items())
+            self.decrypted = [d for d, _ in pairs], [e for _, e in pairs]
+        decrypted, encrypted = self.decrypted
+
+        found = set()
+        for i in within(self.order, prefix):
+            if regex is None or regex.fullmatch(self.order[i].replace('\0', '/')):
+                found.add(self.order[i])
+        for i in within(decrypted, prefix):
+            if regex is None or regex.fullmatch(decrypted[i].replace('\0', '/')):
+                found.add(encrypted[i])
+        return [self.secrets[k] for k in sorted(found)]
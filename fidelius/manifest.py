@@ -0,0 +1,149 @@
+"""
+A local record of what each secret decrypts to.
+
+The manifest maps each encrypted file to a digest of its ciphertext and a keyed
+digest of the plaintext it decrypts to. Comparing a plaintext file against the
+manifest avoids running gpg to find out if it has changed. The manifest is
+stored inside the git directory, so it is never committed.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pathlib
+import threading
+import typing
+
+import attr
+
+from .utils import find_work_tree, git_directory
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def ciphertext_digest(path: pathlib.Path) -> str:
+    """Hash the contents of a file without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@attr.s(frozen=True)
+class Entry:
+    ciphertext: str = attr.ib()
+    plaintext: str = attr.ib()
+
+
+@attr.s
+class Manifest:
+    """
+    Digests of ciphertext and plaintext for each secret in a working tree.
+
+    Plaintext digests are keyed with a random secret stored in the manifest so
+    they can't be used to guess the contents of low-entropy secrets. A manifest
+    without a path is kept in memory and never saved.
+    """
+
+    root: pathlib.Path = attr.ib()
+    path: typing.Optional[pathlib.Path] = attr.ib(default=None)
+    key: bytes = attr.ib(factory=lambda: os.urandom(32), repr=False)
+    entries: typing.Dict[str, Entry] = attr.ib(factory=dict, repr=False)
+    lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False, cmp=False)
+
+    @classmethod
+    def load(cls, directory: pathlib.Path) -> 'Manifest':
+        work_tree = find_work_tree(directory)
+        if work_tree is None:
+            log.debug(f"Not saving a manifest as {directory} is not in a git repository")
+            return cls(root=directory.resolve())
+
+        path = git_directory(work_tree) / 'fidelius' / 'manifest.json'
+        try:
+            data = json.loads(path.read_text())
+            return cls(
+                root=work_tree,
+                path=path,
+                key=bytes.fromhex(data['key']),
+                entries={k: Entry(*v) for k, v in data['entries'].items()})
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as error:
+            log.warning(f"Ignoring unreadable manifest {path}: {error}")
+        return cls(root=work_tree, path=path)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+
+        with self.lock:
+            data = {
+                'key': self.key.hex(),
+                'entries': {
+                    k: [e.ciphertext, e.plaintext] for k, e in sorted(self.entries.items())
+                },
+            }
+
+        log.debug(f"Saving manifest to {self.path}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f'.{self.path.name}.{os.getpid()}')
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temporary, self.path)
+
+    def name(self, encrypted: pathlib.Path) -> str:
+        return os.path.relpath(encrypted.resolve(), self.root)
+
+    def plaintext_digest(self, path: pathlib.Path) -> str:
+        """Hash a plaintext file without reading it into memory at once."""
+        with path.open('rb') as f:
+            return self.stream_digest(iter(lambda: f.read(CHUNK_SIZE), b''))
+
+    def hasher(self) -> 'hmac.HMAC':
+        """Create a keyed hash to digest plaintext as it is produced."""
+        return hmac.new(self.key, digestmod=hashlib.sha256)
+
+    def stream_digest(self, chunks: typing.Iterable[bytes]) -> str:
+        digest = self.hasher()
+        for chunk in chunks:
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def text_digest(self, text: str) -> str:
+        return hmac.new(self.key, text.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def record(self, encrypted: pathlib.Path, plaintext: str) -> None:
+        """Record the plaintext digest for the current contents of a secret."""
+        entry = Entry(ciphertext=ciphertext_digest(encrypted), plaintext=plaintext)
+        with self.lock:
+            self.entries[self.name(encrypted)] = entry
+
+    def record_file(self, encrypted: pathlib.Path, plaintext: pathlib.Path) -> None:
+        self.record(encrypted, self.plaintext_digest(plaintext))
+
+    def entry(self, encrypted: pathlib.Path) -> typing.Optional[Entry]:
+        """The entry for a secret, which may be for an older ciphertext."""
+        with self.lock:
+            return self.entries.get(self.name(encrypted))
+
+    def unchanged(
+            self,
+            encrypted: pathlib.Path,
+            plaintext: pathlib.Path) -> typing.Optional[bool]:
+        """
+        Check if a plaintext file matches what a secret decrypts to.
+
+        Returns None if the manifest has no entry for the current ciphertext,
+        in which case the caller will need to decrypt the secret to find out.
+        """
+        entry = self.entry(encrypted)
+        if entry is None or entry.ciphertext != ciphertext_digest(encrypted):
+            return None
+
+        return hmac.compare_digest(entry.plaintext, self.plaintext_digest(plaintext))
@@ -0,0 +1,308 @@
+"""
+Read OpenPGP packet headers without decrypting anything.
+
+Encrypted messages start with a session key packet for each recipient, which
+holds the ID of the key it was encrypted to, followed by a single encrypted
+data packet. Reading the packet structure finds who a secret is encrypted for
+and detects truncated or corrupt files without needing a private key. The
+integrity of the encrypted data itself can only be checked by decrypting it.
+"""
+
+import base64
+import binascii
+import pathlib
+import typing
+
+import attr
+
+from .utils import FideliusException
+
+ARMOUR_BEGIN = b'-----BEGIN PGP MESSAGE-----'
+
+#: Packet tags (RFC 4880 section 4.3).
+PUBLIC_KEY_ENCRYPTED_SESSION_KEY = 1
+SYMMETRIC_KEY_ENCRYPTED_SESSION_KEY = 3
+SYMMETRICALLY_ENCRYPTED_DATA = 9
+MARKER = 10
+SYM_ENCRYPTED_INTEGRITY_PROTECTED_DATA = 18
+AEAD_ENCRYPTED_DATA = 20
+
+SESSION_KEYS = frozenset({
+    PUBLIC_KEY_ENCRYPTED_SESSION_KEY, SYMMETRIC_KEY_ENCRYPTED_SESSION_KEY, MARKER,
+})
+ENCRYPTED_DATA = frozenset({
+    SYMMETRICALLY_ENCRYPTED_DATA, SYM_ENCRYPTED_INTEGRITY_PROTECTED_DATA, AEAD_ENCRYPTED_DATA,
+})
+
+CHUNK_SIZE = 64 * 1024
+
+CRC24_INIT = 0xB704CE
+CRC24_POLY = 0x1864CFB
+
+
+class Truncated(FideliusException):
+    """Raised when OpenPGP data ends part way through a packet."""
+
+
+@attr.s(frozen=True)
+class Inspection:
+    """The recipients of an encrypted file, and what is wrong with it (if anything)."""
+
+    key_ids: typing.FrozenSet[str] = attr.ib()
+    problem: typing.Optional[str] = attr.ib(default=None)
+
+
+@attr.s
+class Reader:
+    """Read exact numbers of bytes from an iterator of chunks."""
+
+    chunks: typing.Iterator[bytes] = attr.ib(converter=iter)
+    buffer: bytes = attr.ib(default=b'')
+
+    def fill(self) -> bool:
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        return False
+
+    def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            if not self.fill():
+                raise Truncated("Unexpected end of OpenPGP data")
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def skip(self, size: int) -> None:
+        """Discard some data without keeping more than a chunk in memory."""
+        while size > len(self.buffer):
+            size -= len(self.buffer)
+            self.buffer = b''
+            if not self.fill():
+                raise Truncated("Unexpected end of OpenPGP data")
+        self.buffer = self.buffer[size:]
+
+    def skip_all(self) -> None:
+        self.buffer = b''
+        for _ in self.chunks:
+            pass
+
+    def integer(self, size: int) -> int:
+        return int.from_bytes(self.read(size), 'big')
+
+    def at_end(self) -> bool:
+        return not self.buffer and not self.fill()
+
+
+# The CRC-24 of each byte value, so checksums need one lookup per byte.
+# Generated from CRC24_POLY; tests/test_packets.py checks it.
+CRC24_TABLE = (
+    0x000000, 0x864CFB, 0x8AD50D, 0x0C99F6, 0x93E6E1, 0x15AA1A, 0x1933EC, 0x9F7F17,
+    0xA18139, 0x27CDC2, 0x2B5434, 0xAD18CF, 0x3267D8, 0xB42B23, 0xB8B2D5, 0x3EFE2E,
+    0xC54E89, 0x430272, 0x4F9B84, 0xC9D77F, 0x56A868, 0xD0E493, 0xDC7D65, 0x5A319E,
+    0x64CFB0, 0xE2834B, 0xEE1ABD, 0x685646, 0xF72951, 0x7165AA, 0x7DFC5C, 0xFBB0A7,
+    0x0CD1E9, 0x8A9D12, 0x8604E4, 0x00481F, 0x9F3708, 0x197BF3, 0x15E205, 0x93AEFE,
+    0xAD50D0, 0x2B1C2B, 0x2785DD, 0xA1C926, 0x3EB631, 0xB8FACA, 0xB4633C, 0x322FC7,
+    0xC99F60, 0x4FD39B, 0x434A6D, 0xC50696, 0x5A7981, 0xDC357A, 0xD0AC8C, 0x56E077,
+    0x681E59, 0xEE52A2, 0xE2CB54, 0x6487AF, 0xFBF8B8, 0x7DB443, 0x712DB5, 0xF7614E,
+    0x19A3D2, 0x9FEF29, 0x9376DF, 0x153A24, 0x8A4533, 0x0C09C8, 0x00903E, 0x86DCC5,
+    0xB822EB, 0x3E6E10, 0x32F7E6, 0xB4BB1D, 0x2BC40A, 0xAD88F1, 0xA11107, 0x275DFC,
+    0xDCED5B, 0x5AA1A0, 0x563856, 0xD074AD, 0x4F0BBA, 0xC94741, 0xC5DEB7, 0x43924C,
+    0x7D6C62, 0xFB2099, 0xF7B96F, 0x71F594, 0xEE8A83, 0x68C678, 0x645F8E, 0xE21375,
+    0x15723B, 0x933EC0, 0x9FA736, 0x19EBCD, 0x8694DA, 0x00D821, 0x0C41D7, 0x8A0D2C,
+    0xB4F302, 0x32BFF9, 0x3E260F, 0xB86AF4, 0x2715E3, 0xA15918, 0xADC0EE, 0x2B8C15,
+    0xD03CB2, 0x567049, 0x5AE9BF, 0xDCA544, 0x43DA53, 0xC596A8, 0xC90F5E, 0x4F43A5,
+    0x71BD8B, 0xF7F170, 0xFB6886, 0x7D247D, 0xE25B6A, 0x641791, 0x688E67, 0xEEC29C,
+    0x3347A4, 0xB50B5F, 0xB992A9, 0x3FDE52, 0xA0A145, 0x26EDBE, 0x2A7448, 0xAC38B3,
+    0x92C69D, 0x148A66, 0x181390, 0x9E5F6B, 0x01207C, 0x876C87, 0x8BF571, 0x0DB98A,
+    0xF6092D, 0x7045D6, 0x7CDC20, 0xFA90DB, 0x65EFCC, 0xE3A337, 0xEF3AC1, 0x69763A,
+    0x578814, 0xD1C4EF, 0xDD5D19, 0x5B11E2, 0xC46EF5, 0x42220E, 0x4EBBF8, 0xC8F703,
+    0x3F964D, 0xB9DAB6, 0xB54340, 0x330FBB, 0xAC70AC, 0x2A3C57, 0x26A5A1, 0xA0E95A,
+    0x9E1774, 0x185B8F, 0x14C279, 0x928E82, 0x0DF195, 0x8BBD6E, 0x872498, 0x016863,
+    0xFAD8C4, 0x7C943F, 0x700DC9, 0xF64132, 0x693E25, 0xEF72DE, 0xE3EB28, 0x65A7D3,
+    0x5B59FD, 0xDD1506, 0xD18CF0, 0x57C00B, 0xC8BF1C, 0x4EF3E7, 0x426A11, 0xC426EA,
+    0x2AE476, 0xACA88D, 0xA0317B, 0x267D80, 0xB90297, 0x3F4E6C, 0x33D79A, 0xB59B61,
+    0x8B654F, 0x0D29B4, 0x01B042, 0x87FCB9, 0x1883AE, 0x9ECF55, 0x9256A3, 0x141A58,
+    0xEFAAFF, 0x69E604, 0x657FF2, 0xE33309, 0x7C4C1E, 0xFA00E5, 0xF69913, 0x70D5E8,
+    0x4E2BC6, 0xC8673D, 0xC4FECB, 0x42B230, 0xDDCD27, 0x5B81DC, 0x57182A, 0xD154D1,
+    0x26359F, 0xA07964, 0xACE092, 0x2AAC69, 0xB5D37E, 0x339F85, 0x3F0673, 0xB94A88,
+    0x87B4A6, 0x01F85D, 0x0D61AB, 0x8B2D50, 0x145247, 0x921EBC, 0x9E874A, 0x18CBB1,
+    0xE37B16, 0x6537ED, 0x69AE1B, 0xEFE2E0, 0x709DF7, 0xF6D10C, 0xFA48FA, 0x7C0401,
+    0x42FA2F, 0xC4B6D4, 0xC82F22, 0x4E63D9, 0xD11CCE, 0x575035, 0x5BC9C3, 0xDD8538,
+)
+
+
+def crc24(data: bytes, crc: int = CRC24_INIT) -> int:
+    """Update the CRC-24 checksum used by ASCII armour (RFC 4880 section 6.1)."""
+    table = CRC24_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ table[(crc >> 16) ^ byte]
+    return crc
+
+
+def dearmour(lines: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+    """
+    Decode ASCII armoured data a line at a time.
+
+    Raises an exception if the armour is incomplete or its checksum doesn't
+    match the data.
+    """
+    lines = iter(lines)
+    for line in lines:
+        if line.strip() == ARMOUR_BEGIN:
+            break
+    else:
+        raise FideliusException("No ASCII armour found")
+    for line in lines:  # Armour headers end with a blank line.
+        if not line.strip():
+            break
+
+    crc, pending, checksum = CRC24_INIT, b'', None
+    for line in lines:
+        line = line.strip()
+        if line.startswith(b'-----'):
+            break
+        if line.startswith(b'='):
+            checksum = line[1:]
+            continue
+
+        pending += line
+        usable = len(pending) - len(pending) % 4
+        try:
+            data = base64.b64decode(pending[:usable], validate=True)
+        except binascii.Error:
+            raise FideliusException("Invalid characters in ASCII armour")
+        pending = pending[usable:]
+        crc = crc24(data, crc)
+        yield data
+    else:
+        raise Truncated("ASCII armour has no end line")
+
+    if pending:
+        raise FideliusException("Incomplete ASCII armour")
+    if checksum is not None and base64.b64decode(checksum) != crc.to_bytes(3, 'big'):
+        raise FideliusException("ASCII armour checksum does not match")
+
+
+def chunks(path: pathlib.Path) -> typing.Iterator[bytes]:
+    """Read the binary packets of a file, removing ASCII armour if it has any."""
+    with path.open('rb') as f:
+        armoured = f.read(len(ARMOUR_BEGIN)) == ARMOUR_BEGIN
+        f.seek(0)
+        if armoured:
+            yield from dearmour(f)
+        else:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+
+
+def header(reader: Reader) -> typing.Tuple[int, typing.Optional[int], bool]:
+    """
+    Read a packet header, returning the packet's tag and length.
+
+    The flag is set if the length only covers part of the packet body, which
+    is followed by another length. The length is None if the packet continues
+    to the end of the data. Both are only allowed for data packets.
+    """
+    first = reader.integer(1)
+    if not first & 0x80:
+        raise FideliusException("Not an OpenPGP packet")
+
+    if first & 0x40:
+        return (first & 0x3f, *length(reader))
+
+    tag, length_type = (first >> 2) & 0x0f, first & 0x03
+    if length_type == 3:
+        return tag, None, False
+    return tag, reader.integer(1 << length_type), False
+
+
+def length(reader: Reader) -> typing.Tuple[int, bool]:
+    """Read a new format packet length, and if it's a partial body length."""
+    octet = reader.integer(1)
+    if octet < 192:
+        return octet, False
+    if octet < 224:
+        return ((octet - 192) << 8) + reader.integer(1) + 192, False
+    if octet == 255:
+        return reader.integer(4), False
+    return 1 << (octet & 0x1f), True
+
+
+def packets(reader: Reader) -> typing.Iterator[typing.Tuple[int, bytes]]:
+    """
+    Yield the tag of each packet with the body of session key packets.
+
+    The bodies of other packets are skipped once the consumer asks for the
+    next packet, and never held in memory.
+    """
+    while not reader.at_end():
+        tag, size, partial = header(reader)
+        if tag in SESSION_KEYS:
+            if size is None or partial:
+                raise FideliusException("Invalid session key packet")
+            yield tag, reader.read(size)
+            continue
+
+        yield tag, b''
+        if size is None:
+            reader.skip_all()
+            continue
+        reader.skip(size)
+        while partial:
+            size, partial = length(reader)
+            reader.skip(size)
+
+
+def key_id(tag: int, body: bytes) -> typing.Optional[str]:
+    """The key ID of a version 3 public-key encrypted session key packet."""
+    if tag == PUBLIC_KEY_ENCRYPTED_SESSION_KEY and body[:1] == b'\x03':
+        return body[1:9].hex().upper()
+    return None
+
+
+def key_ids(path: pathlib.Path) -> typing.FrozenSet[str]:
+    """
+    Find the IDs of the keys an encrypted file can be decrypted with.
+
+    IDs are upper case hex strings, matching gpg's long key ID format. Hidden
+    recipients have a key ID of all zeros. Only the session key packets at
+    the start of the file are read.
+    """
+    ids = set()
+    for tag, body in packets(Reader(chunks(path))):
+        if tag not in SESSION_KEYS:
+            break
+        ids.add(key_id(tag, body))
+    return frozenset(ids - {None})
+
+
+def inspect(path: pathlib.Path) -> Inspection:
+    """
+    Read every packet in an encrypted file, checking the file is complete.
+
+    A well formed file has one or more session key packets followed by a
+    single encrypted data packet that ends exactly at the end of the file.
+    """
+    ids: typing.Set[typing.Optional[str]] = set()
+    session_keys = data = 0
+    try:
+        for tag, body in packets(Reader(chunks(path))):
+            if data:
+                return Inspection(frozenset(ids - {None}), "Unexpected data after encrypted data")
+            if tag in SESSION_KEYS:
+                session_keys += tag != MARKER
+                ids.add(key_id(tag, body))
+            elif tag in ENCRYPTED_DATA:
+                data += 1
+            else:
+                return Inspection(frozenset(ids - {None}), f"Unexpected packet with tag {tag}")
+    except Truncated as error:
+        return Inspection(frozenset(ids - {None}), f"Truncated: {error}")
+    except (FideliusException, OSError) as error:
+        return Inspection(frozenset(ids - {None}), f"Corrupt: {error}")
+
+    if not session_keys:
+        return Inspection(frozenset(ids - {None}), "No session key packets")
+    if not data:
+        return Inspection(frozenset(ids - {None}), "No encrypted data")
+    return Inspection(frozenset(ids - {None}))
@@ -1,18 +1,74 @@
+import hmac
 import logging
 import os.path
 import pathlib
+import shutil
 import subprocess
+import tempfile
 import typing
 
 import attr
 
-from .gpg import GPG
-from .utils import FideliusException
+from . import timings
+from .audit import AuditCache, Report
+from .cache import SecretCache, parser
+from .gitignore import GitIgnore
+from .gpg import GPG, Backend
+from .index import GLOB_CHARACTERS, SecretIndex
+from .manifest import Manifest, ciphertext_digest
+from .packets import key_ids
+from .shards import Shard
+from .utils import FideliusException, batches, concurrently, default_jobs, find_work_tree
 
 log = logging.getLogger(__name__)
 
+def check_ignored(
+        paths: typing.Set[pathlib.Path],
+        work_tree: typing.Optional[pathlib.Path],
+        verify: bool = False,
+        gitignore: typing.Optional[GitIgnore] = None) -> None:
+    """
+    Check that decrypted paths are ignored by git, raising an exception if not.
 
-@attr.s(frozen=True, kw_only=True)
+    Paths are checked against the repository's ignore files in-process.
+    Any path that appears not to be ignored is checked again with
+    'git check-ignore', which is used for every path if `verify` is set.
+    Ignore rules don't apply to tracked files, so paths that appear to be
+    ignored are also checked against the index. A `gitignore` passed in is
+    left for the caller to save, so several checks can share its results.
+    """
+    with timings.span('gitignore', paths=len(paths)):
+        if verify or work_tree is None:
+            included = git_check_ignore(paths)
+        else:
+            rules = gitignore or GitIgnore(work_tree)
+            included = rules.included(paths)
+            tracked = rules.tracked(paths - included)
+            if gitignore is None:
+                rules.save()
+            if included:
+                included = git_check_ignore(included)
+            included |= tracked
+
+    if included:
+        raise FideliusException(
+            f"Encrypted file(s) not excluded by .gitignore: "
+            f"{', '.join(sorted(str(p) for p in included))}")
+
+
+def git_check_ignore(paths: typing.Set[pathlib.Path]) -> typing.Set[pathlib.Path]:
+    """Find which paths are not ignored using 'git check-ignore'."""
+    with timings.span('git check-ignore', paths=len(paths)):
+        result = subprocess.run(
+            ('git', 'check-ignore', '--stdin'),
+            stdout=subprocess.PIPE,
+            encoding='utf-8',
+            input='\n'.join(str(p) for p in paths))
+    excluded = set(result.stdout.splitlines())
+    return {p for p in paths if str(p) not in excluded}
+
+
+@attr.s(frozen=True, kw_only=True, slots=True)
 class Secret:
     encrypted: pathlib.Path = attr.ib()
     decrypted: pathlib.Path = attr.ib()
@@ -29,11 +85,11 @@ class Secret:
     def armour(self):
         return self.encrypted.suffix == '.asc'
 
-    def decrypt(self, gpg: GPG) -> None:
+    def decrypt(self, gpg: Backend) -> None:
         log.debug(f"Decrypting {self.encrypted} to {self.encrypted}")
         gpg.decrypt(self.encrypted, self.decrypted, self.armour)
 
-    def re_encrypt(self, gpg: GPG, **kwargs):
+    def re_encrypt(self, gpg: Backend, **kwargs):
         log.debug(f"Re-encrypting {self.encrypted} from {self.decrypted}")
         gpg.encrypt_file(
             output=self.encrypted,
@@ -41,62 +97,535 @@ class Secret:
             armour=self.armour,
             **kwargs)
 
-    def contents(self, gpg: GPG):
+    def contents(self, gpg: Backend):
         log.debug(f"Reading contents of {self.encrypted}")
         return gpg.contents(self.encrypted, self.armour)
 
+    def stream(self, gpg: Backend) -> typing.Iterator[bytes]:
+        log.debug(f"Streaming contents of {self.encrypted}")
+        return gpg.stream(self.encrypted, self.armour)
+
     def plaintext(self):
         log.debug(f"Reading contents of {self.decrypted}")
         return self.decrypted.read_text()
 
 
+@attr.s(frozen=True)
+class Outcome:
+    """The result of running an operation on a single secret."""
+
+    secret: Secret = attr.ib()
+    status: str = attr.ib()
+    error: typing.Optional[Exception] = attr.ib(default=None)
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
 @attr.s(frozen=True)
 class SecretKeeper:
-    secrets: typing.Dict[pathlib.Path, Secret] = attr.ib()
+    """
+    The secrets found in a directory, and the operations that can be run on them.
+
+    Secrets are held in a `SecretIndex`, which can be built from a dict of
+    secrets keyed by their encrypted path.
+    """
+
+    secrets: SecretIndex = attr.ib()
 
     directory: pathlib.Path = attr.ib(factory=pathlib.Path.cwd)
-    gpg: GPG = attr.ib(factory=GPG)
+    gpg: Backend = attr.ib(factory=GPG)
+    manifest: Manifest = attr.ib(default=attr.Factory(
+        lambda self: Manifest.load(self.directory), takes_self=True))
+    secret_cache: typing.Optional[SecretCache] = attr.ib(default=None)
 
-    def __getitem__(self, item: pathlib.Path):
-        if item.resolve() not in self.secrets.keys():
-            raise FideliusException(f"No secret named {item}")
+    def __attrs_post_init__(self):
+        if not isinstance(self.secrets, SecretIndex):
+            object.__setattr__(self, 'secrets', SecretIndex(self.directory, self.secrets))
 
-        return self.secrets[item.resolve()]
+    def __getitem__(self, item: pathlib.Path) -> Secret:
+        secret = self.get(item, None)
+        if secret is None:
+            raise FideliusException(f"No secret named {item}")
+        return secret
 
     def rel(self, path: pathlib.Path) -> str:
         return os.path.relpath(path.as_posix(), self.directory.as_posix())
 
-    def get(self, item: pathlib.Path, default: Secret) -> Secret:
-        return self.secrets.get(item.resolve(), default)
+    def get(self, item: pathlib.Path, default: typing.Optional[Secret]) -> typing.Optional[Secret]:
+        """Find a secret by path, only resolving symlinks if it isn't found."""
+        secret = self.secrets.get(item)
+        if secret is None:
+            secret = self.secrets.get(item.resolve(), default)
+        return secret
+
+    def select(
+            self,
+            paths: typing.Iterable[pathlib.Path],
+            shard: typing.Optional[Shard] = None,
+            weighted: bool = False) -> typing.List[Secret]:
+        """
+        Find secrets by path, directory or glob (e.g. `deploy/prod/**`).
 
-    def select(self, paths: typing.Iterable[pathlib.Path]) -> typing.List[Secret]:
-        if paths:
-            return [self[path] for path in paths]
+        Directories and globs match encrypted or decrypted paths. Secrets are
+        returned in the order they were asked for, without duplicates. If no
+        paths are given, every secret is returned.
+
+        If a `shard` is given, only the secrets in that shard are returned,
+        split by their relative path or (if `weighted`) by ciphertext size.
+        """
+        if not paths:
+            selected = list(self)
         else:
-            return [s for s in self]
+            found: typing.Dict[pathlib.Path, Secret] = {}
+            for path in paths:
+                if GLOB_CHARACTERS.search(str(path)):
+                    matches = self.secrets.glob(str(path))
+                else:
+                    secret = self.get(path, None)
+                    matches = [secret] if secret else self.secrets.prefix(path)
+                if not matches:
+                    raise FideliusException(f"No secret named {path}")
+                found.update((s.encrypted, s) for s in matches)
+            selected = list(found.values())
+
+        if shard is not None:
+            selected = shard.select(selected, self.secrets.name, weighted)
+            log.info(f"Selected {len(selected)} secrets in shard {shard}")
+        return selected
 
-    def __iter__(self):
-        return iter(sorted(self.secrets.values(), key=lambda s: s.encrypted))
+    def __iter__(self) -> typing.Iterator[Secret]:
+        return iter(self.secrets.values())
 
-    def run_gitignore_check(self):
+    def read(self, secret: Secret) -> bytes:
+        """Read the plaintext of a secret, using the cache if there is one."""
+        if self.secret_cache is not None:
+            return self.secret_cache.read(secret, self.gpg)
+        return b''.join(secret.stream(self.gpg))
+
+    def load(self, secret: Secret) -> typing.Any:
+        """Parse a JSON or YAML secret, using the cache if there is one."""
+        if self.secret_cache is not None:
+            return self.secret_cache.load(secret, self.gpg)
+        parse = parser(secret)
+        return parse(self.read(secret).decode('utf-8'))
+
+    def run_gitignore_check(self, verify: bool = False):
+        """Check that every decrypted path is ignored by git."""
         log.info("Checking all decrypted files are ignored by git")
-        decrypted = set(str(s.decrypted) for s in self.secrets.values())
-        result = subprocess.run(
-            ('git', 'check-ignore', '--stdin'),
-            stdout=subprocess.PIPE,
-            encoding='utf-8',
-            input='\n'.join(decrypted))
-        excluded = set(result.stdout.splitlines())
-        included = decrypted - excluded
-        if included:
-            raise FideliusException(
-                f"Encrypted file(s) not excluded by .gitignore: "
-                f"{', '.join(sorted(included))}")
+        check_ignored(
+            set(s.decrypted for s in self.secrets.values()),
+            find_work_tree(self.directory),
+            verify=verify)
+
+    @staticmethod
+    def git_check_ignore(paths: typing.Set[pathlib.Path]) -> typing.Set[pathlib.Path]:
+        """Find which paths are not ignored using 'git check-ignore'."""
+        return git_check_ignore(paths)
+
+    def stream(self, shard: typing.Optional[Shard] = None) -> typing.Iterator[Secret]:
+        """
+        Yield every secret (or every secret in a shard) as soon as it's found.
+
+        If nothing has needed every secret yet, secrets are yielded while the
+        search is still running and are not kept, so work can start straight
+        away and memory use doesn't grow with the number of secrets. Secrets
+        are yielded in order either way.
+        """
+        secrets = self.secrets.stream()
+        if shard is None:
+            return secrets
+        return (s for s in secrets if shard.contains(self.secrets.name(s.encrypted)))
 
-    def decrypt(self):
-        log.info(f"Decrypting {len(self.secrets)} secrets")
-        for secret in self:
+    def _decrypt(self, batch: typing.Sequence[Secret], force: bool) -> typing.List[Outcome]:
+        skipped = set()
+        if not force:
+            for secret in batch:
+                if self._current(secret):
+                    log.info(f"Skipping {self.rel(secret.encrypted)} as "
+                             f"{self.rel(secret.decrypted)} is up to date")
+                    skipped.add(secret)
+
+        pending = [s for s in batch if s not in skipped]
+        for secret in pending:
             log.info(f"Decrypting {self.rel(secret.encrypted)} "
                      f"to {self.rel(secret.decrypted)}")
-            secret.decrypt(self.gpg)
-        log.info(f"Decrypted {len(self.secrets)} secrets")
+        errors = {}
+        if pending:
+            errors = self.gpg.decrypt_many([(s.encrypted, s.decrypted) for s in pending])
+
+        outcomes = []
+        for secret in batch:
+            if secret in skipped:
+                outcomes.append(Outcome(secret, 'skipped'))
+                continue
+            error = errors[secret.encrypted]
+            if error is None:
+                try:
+                    self.manifest.record_file(secret.encrypted, secret.decrypted)
+                except OSError as e:
+                    error = e
+            if error is None:
+                outcomes.append(Outcome(secret, 'decrypted'))
+            else:
+                outcomes.append(Outcome(secret, 'failed', error))
+        return outcomes
+
+    def decrypt_each(
+            self,
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            jobs: typing.Optional[int] = None,
+            force: bool = False) -> typing.Iterator[Outcome]:
+        """
+        Decrypt secrets using up to `jobs` concurrent gpg processes.
+
+        Secrets are split into batches that are each decrypted by a single gpg
+        process. Secrets whose plaintext matches the ciphertext it was last
+        decrypted from are skipped without running gpg or rewriting the file,
+        unless `force` is set.
+
+        Yields an outcome for each secret in a stable order. A failure does
+        not stop the remaining secrets from being decrypted. Secrets can be a
+        generator, and are decrypted as it yields them.
+        """
+        secrets = self.stream() if secrets is None else secrets
+        jobs = jobs or default_jobs()
+        log.info("Decrypting secrets")
+        outcomes = (outcome for outcomes in concurrently(
+            lambda batch: self._decrypt(batch, force), batches(secrets, jobs), jobs)
+            for outcome in outcomes)
+        try:
+            yield from timings.timed('decrypt', outcomes, count='secrets', jobs=jobs)
+        finally:
+            self.manifest.save()
+
+    def _current(self, secret: Secret) -> bool:
+        """Check the plaintext on disk is what the secret decrypts to."""
+        if not secret.decrypted.exists():
+            return False
+        return bool(self.manifest.unchanged(secret.encrypted, secret.decrypted))
+
+    def _encrypt(
+            self,
+            secret: Secret,
+            recipients: typing.Iterable[str],
+            force: bool) -> Outcome:
+        if not secret.decrypted.exists():
+            return Outcome(secret, 'missing')
+
+        try:
+            if not force and self._unchanged(secret):
+                return Outcome(secret, 'skipped')
+            secret.re_encrypt(self.gpg, recipients=recipients)
+            self.manifest.record_file(secret.encrypted, secret.decrypted)
+        except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+            return Outcome(secret, 'failed', error)
+        return Outcome(secret, 'encrypted')
+
+    def _unchanged(self, secret: Secret) -> bool:
+        unchanged = self.manifest.unchanged(secret.encrypted, secret.decrypted)
+        if unchanged is not None:
+            return unchanged
+
+        log.debug(f"No manifest entry for {self.rel(secret.encrypted)}, decrypting it")
+        digest = self.manifest.stream_digest(secret.stream(self.gpg))
+        if self.manifest.plaintext_digest(secret.decrypted) != digest:
+            return False
+        self.manifest.record(secret.encrypted, digest)
+        return True
+
+    def encrypt_each(
+            self,
+            recipients: typing.Iterable[str],
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            force: bool = False,
+            jobs: typing.Optional[int] = None) -> typing.Iterator[Outcome]:
+        """
+        Encrypt secrets whose plaintext has changed, using up to `jobs` workers.
+
+        Each worker checks the plaintext against the manifest, decrypting the
+        secret to compare it when the manifest has no entry for the current
+        ciphertext, and re-encrypts it if they differ. Yields an outcome for each
+        secret in a stable order.
+        """
+        secrets = self.stream() if secrets is None else secrets
+        recipients = tuple(recipients)
+        log.info("Encrypting secrets")
+        outcomes = concurrently(
+            lambda secret: self._encrypt(secret, recipients, force), secrets, jobs)
+        try:
+            yield from timings.timed('encrypt', outcomes, count='secrets')
+        finally:
+            self.manifest.save()
+
+    def _rekey(
+            self,
+            secret: Secret,
+            recipients: typing.Sequence[str],
+            wanted: typing.Sequence[typing.FrozenSet[str]],
+            force: bool) -> Outcome:
+        try:
+            if not force and self._encrypted_for(secret, wanted):
+                return Outcome(secret, 'skipped')
+            self._reencrypt(secret, recipients)
+        except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+            return Outcome(secret, 'failed', error)
+        return Outcome(secret, 'rekeyed')
+
+    @staticmethod
+    def _encrypted_for(secret: Secret, wanted: typing.Sequence[typing.FrozenSet[str]]) -> bool:
+        """Check a secret is encrypted to one key of each recipient, and no other keys."""
+        current = key_ids(secret.encrypted)
+        return (all(keys & current for keys in wanted)
+                and current <= frozenset().union(*wanted))
+
+    def _reencrypt(self, secret: Secret, recipients: typing.Sequence[str]) -> None:
+        """
+        Encrypt a secret's plaintext for new recipients, replacing the ciphertext.
+
+        The plaintext is streamed from one gpg process to another without being
+        written to disk. The new ciphertext replaces the old one only once it
+        has been written completely. It is written outside any encrypted
+        directory and without '.encrypted' in its name, so that a file left by
+        an interrupted rekey is not found as a secret.
+        """
+        digest = self.manifest.hasher()
+
+        def plaintext() -> typing.Iterator[bytes]:
+            for chunk in secret.stream(self.gpg):
+                digest.update(chunk)
+                yield chunk
+
+        encrypted = secret.encrypted
+        fd, name = tempfile.mkstemp(prefix='.fidelius-rekey-', dir=self._staging(encrypted))
+        os.close(fd)
+        temporary = pathlib.Path(name)
+        try:
+            self.gpg.encrypt_stream(temporary, plaintext(), secret.armour, recipients)
+            shutil.copymode(str(encrypted), str(temporary))
+            os.replace(str(temporary), str(encrypted))
+        finally:
+            if temporary.exists():
+                temporary.unlink()
+        self.manifest.record(encrypted, digest.hexdigest())
+
+    def _staging(self, encrypted: pathlib.Path) -> pathlib.Path:
+        """The closest directory to an encrypted file that isn't searched for secrets."""
+        root = self.directory.resolve()
+        directory = encrypted.parent
+        for parent in encrypted.parents:
+            if parent == root:
+                break
+            if '.encrypted' in parent.name:
+                directory = parent.parent
+        return directory
+
+    def _encryption_keys(
+            self,
+            recipients: typing.Sequence[str]) -> typing.List[typing.FrozenSet[str]]:
+        """Find the usable encryption keys for each recipient."""
+        wanted = [self.gpg.encryption_keys(recipient) for recipient in recipients]
+        for recipient, keys in zip(recipients, wanted):
+            if not keys:
+                raise FideliusException(f"No usable encryption key for {recipient}")
+        return wanted
+
+    def rekey_each(
+            self,
+            recipients: typing.Iterable[str],
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            force: bool = False,
+            jobs: typing.Optional[int] = None) -> typing.Iterator[Outcome]:
+        """
+        Re-encrypt secrets for a new set of recipients, using up to `jobs` workers.
+
+        Secrets that are already encrypted for exactly these recipients are
+        skipped without being decrypted, unless `force` is set. Each secret
+        keeps its current armour. Yields an outcome for each secret in a
+        stable order.
+        """
+        secrets = list(self if secrets is None else secrets)
+        recipients = tuple(recipients)
+        wanted = self._encryption_keys(recipients)
+        log.info(f"Re-encrypting {len(secrets)} secrets for {len(recipients)} recipients")
+        outcomes = concurrently(
+            lambda secret: self._rekey(secret, recipients, wanted, force), secrets, jobs)
+        try:
+            yield from timings.timed('rekey', outcomes, secrets=len(secrets))
+        finally:
+            self.manifest.save()
+
+    @staticmethod
+    def _audit(
+            secret: Secret,
+            cache: AuditCache,
+            recipients: typing.Sequence[str],
+            wanted: typing.Sequence[typing.FrozenSet[str]]) -> Report:
+        inspection = cache.inspect(secret.encrypted)
+        key_ids = inspection.key_ids
+        if not recipients:
+            return Report(secret, key_ids, inspection.problem)
+
+        return Report(
+            secret,
+            key_ids,
+            inspection.problem,
+            missing=tuple(r for r, keys in zip(recipients, wanted) if not keys & key_ids),
+            unexpected=key_ids - frozenset().union(*wanted))
+
+    def audit_each(
+            self,
+            recipients: typing.Iterable[str] = (),
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            jobs: typing.Optional[int] = None) -> typing.Iterator[Report]:
+        """
+        Report the keys each secret is encrypted to, without decrypting it.
+
+        If recipients are given, each report also lists the recipients the
+        secret isn't encrypted for and any keys it shouldn't be encrypted to.
+        Only public keys are needed. Yields a report for each secret in a
+        stable order.
+        """
+        secrets = list(self if secrets is None else secrets)
+        recipients = tuple(recipients)
+        wanted = self._encryption_keys(recipients)
+        cache = AuditCache.load(self.directory)
+        log.info(f"Auditing {len(secrets)} secrets")
+        reports = concurrently(
+            lambda secret: self._audit(secret, cache, recipients, wanted), secrets, jobs)
+        try:
+            yield from timings.timed('audit', reports, secrets=len(secrets))
+        finally:
+            cache.save()
+
+    def _status(self, secret: Secret) -> Outcome:
+        if not secret.decrypted.exists():
+            return Outcome(secret, 'missing')
+
+        try:
+            plaintext = self.manifest.plaintext_digest(secret.decrypted)
+            entry = self.manifest.entry(secret.encrypted)
+            if entry is not None:
+                plaintext_current = hmac.compare_digest(entry.plaintext, plaintext)
+                if entry.ciphertext == ciphertext_digest(secret.encrypted):
+                    return Outcome(secret, 'in-sync' if plaintext_current else 'plaintext-modified')
+                if plaintext_current:
+                    return Outcome(secret, 'ciphertext-newer')
+
+            log.debug(f"Decrypting {self.rel(secret.encrypted)} to compare it")
+            digest = self.manifest.stream_digest(secret.stream(self.gpg))
+        except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+            return Outcome(secret, 'failed', error)
+
+        if hmac.compare_digest(digest, plaintext):
+            self.manifest.record(secret.encrypted, digest)
+            return Outcome(secret, 'in-sync')
+        if entry is not None:
+            return Outcome(secret, 'conflict')
+        if secret.decrypted.stat().st_mtime_ns > secret.encrypted.stat().st_mtime_ns:
+            return Outcome(secret, 'plaintext-modified')
+        return Outcome(secret, 'ciphertext-newer')
+
+    def status_each(
+            self,
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            jobs: typing.Optional[int] = None) -> typing.Iterator[Outcome]:
+        """
+        Compare each secret's plaintext with its ciphertext.
+
+        Each outcome's status is one of 'missing', 'in-sync',
+        'plaintext-modified' (edited since it was decrypted),
+        'ciphertext-newer' (the encrypted file has changed since), 'conflict'
+        (both have changed) or 'failed'. The manifest decides most secrets from
+        digests alone. Secrets it has no entry for, and secrets whose files
+        have both changed, are decrypted to compare them. Without a manifest
+        entry, modification times decide which side changed. Yields an outcome
+        for each secret in a stable order.
+        """
+        secrets = self.stream() if secrets is None else secrets
+        log.info("Checking the status of secrets")
+        outcomes = concurrently(self._status, secrets, jobs)
+        try:
+            yield from timings.timed('status', outcomes, count='secrets')
+        finally:
+            self.manifest.save()
+
+    async def decrypt_all(
+            self,
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            limit: int = 16,
+            force: bool = False) -> typing.List[Outcome]:
+        """
+        Decrypt secrets without blocking the event loop.
+
+        Runs up to `limit` operations at once and returns an outcome for each
+        secret in a stable order. Plaintext that is already up to date is
+        skipped unless `force` is set.
+        """
+        import asyncio
+        from .aio import asynchronous
+
+        backend = asynchronous(self.gpg)
+        semaphore = asyncio.Semaphore(limit)
+        loop = asyncio.get_running_loop()
+
+        async def decrypt(secret: Secret) -> Outcome:
+            async with semaphore:
+                if not force and await loop.run_in_executor(None, self._current, secret):
+                    return Outcome(secret, 'skipped')
+                try:
+                    await backend.decrypt(secret.encrypted, secret.decrypted, secret.armour)
+                    await loop.run_in_executor(
+                        None, self.manifest.record_file, secret.encrypted, secret.decrypted)
+                except (subprocess.CalledProcessError, FideliusException, OSError) as error:
+                    return Outcome(secret, 'failed', error)
+                return Outcome(secret, 'decrypted')
+
+        secrets = list(self if secrets is None else secrets)
+        try:
+            return list(await asyncio.gather(*(decrypt(s) for s in secrets)))
+        finally:
+            await loop.run_in_executor(None, self.manifest.save)
+
+    async def contents_all(
+            self,
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            limit: int = 16) -> typing.Dict[Secret, str]:
+        """
+        Read the decrypted contents of secrets without blocking the event loop.
+
+        Runs up to `limit` operations at once. Raises the first error after
+        all operations have finished.
+        """
+        import asyncio
+        from .aio import asynchronous
+
+        backend = asynchronous(self.gpg)
+        semaphore = asyncio.Semaphore(limit)
+
+        async def contents(secret: Secret) -> str:
+            async with semaphore:
+                return await backend.contents(secret.encrypted, secret.armour)
+
+        secrets = list(self if secrets is None else secrets)
+        results = await asyncio.gather(*(contents(s) for s in secrets), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return dict(zip(secrets, results))
+
+    def decrypt(
+            self,
+            secrets: typing.Optional[typing.Iterable[Secret]] = None,
+            jobs: typing.Optional[int] = None,
+            force: bool = False) -> typing.List[Outcome]:
+        outcomes = list(self.decrypt_each(secrets, jobs, force))
+        failed = [o.secret for o in outcomes if o.failed]
+        decrypted = [o.secret for o in outcomes if o.status == 'decrypted']
+        log.info(f"Decrypted {len(decrypted)} secrets")
+        if failed:
+            raise FideliusException(
+                f"Failed to decrypt {len(failed)} secret(s): "
+                f"{', '.join(self.rel(s.encrypted) for s in failed)}")
+        return outcomes
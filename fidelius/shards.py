@@ -0,0 +1,95 @@
+"""
+Split secrets between several machines that each handle some of them.
+
+Each secret is assigned to a shard by hashing its path relative to the
+repository, so every machine agrees on the split without coordinating, and
+adding or removing a secret doesn't move any others. Shards can instead be
+balanced by the size of each ciphertext, which evens out the work when sizes
+vary a lot, but every machine must then select from the same set of secrets.
+"""
+
+import hashlib
+import heapq
+import os
+import pathlib
+import typing
+
+import attr
+
+if typing.TYPE_CHECKING:
+    from .secrets import Secret
+
+
+def bucket(name: str, count: int) -> int:
+    """The (0-based) shard a name is hashed to."""
+    digest = hashlib.sha256(name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def size(secret: 'Secret') -> int:
+    try:
+        return os.stat(secret.encrypted).st_size
+    except OSError:
+        return 0
+
+
+@attr.s(frozen=True)
+class Shard:
+    """One of `count` parts of a set of secrets, numbered from 1."""
+
+    index: int = attr.ib()
+    count: int = attr.ib()
+
+    def __attrs_post_init__(self):
+        if self.count < 1:
+            raise ValueError(f"The number of shards must be at least 1, not {self.count}")
+        if not 1 <= self.index <= self.count:
+            raise ValueError(f"The shard must be between 1 and {self.count}, not {self.index}")
+
+    def __str__(self):
+        return f'{self.index}/{self.count}'
+
+    @classmethod
+    def parse(cls, value: str) -> 'Shard':
+        """Parse a shard written as `INDEX/COUNT`, like `2/4`."""
+        index, _, count = value.partition('/')
+        if not index.strip().isdigit() or not count.strip().isdigit():
+            raise ValueError(f"Shards should be written as INDEX/COUNT, not {value!r}")
+        return cls(int(index), int(count))
+
+    def select(
+            self,
+            secrets: typing.Sequence['Secret'],
+            name: typing.Callable[[pathlib.Path], str],
+            weighted: bool = False) -> typing.List['Secret']:
+        """
+        Select the secrets that belong to this shard, keeping their order.
+
+        `name` converts an encrypted path to the name that is hashed. With
+        `weighted` set, secrets are instead assigned (largest first) to the
+        shard with the least ciphertext so far.
+        """
+        if weighted:
+            wanted = self.balance(secrets, name)
+            return [s for s in secrets if s.encrypted in wanted]
+        return [s for s in secrets if self.contains(name(s.encrypted))]
+
+    def contains(self, name: str) -> bool:
+        """Check if a name is hashed to this shard."""
+        return bucket(name, self.count) == self.index - 1
+
+    def balance(
+            self,
+            secrets: typing.Sequence['Secret'],
+            name: typing.Callable[[pathlib.Path], str]) -> typing.Set[pathlib.Path]:
+        """The encrypted paths assigned to this shard when balancing by size."""
+        loads = [(0, shard) for shard in range(self.count)]
+        wanted = set()
+        for weight, _, secret in sorted(
+                ((size(s), name(s.encrypted), s) for s in secrets),
+                key=lambda item: (-item[0], item[1])):
+            load, shard = heapq.heappop(loads)
+            if shard == self.index - 1:
+                wanted.add(secret.encrypted)
+            heapq.heappush(loads, (load + weight, shard))
+        return wanted
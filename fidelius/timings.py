@@ -0,0 +1,176 @@
+"""
+Record how long each phase of fidelius's work takes.
+
+Code worth measuring is wrapped in `span()`, which records its duration and
+some attributes (counts, paths, gpg operations). Generators are wrapped in
+`timed()` instead, which doesn't count the time their caller spends on each
+item. Spans are only timed while a listener is registered with `listen()`,
+so instrumentation costs nothing for programs that don't use it.
+
+    recorder = Recorder()
+    listen(recorder)
+    secret_keeper.decrypt()
+    print(recorder.format())
+"""
+
+import collections
+import contextlib
+import threading
+import time
+import typing
+
+import attr
+
+T = typing.TypeVar('T')
+
+Attributes = typing.Dict[str, typing.Any]
+
+
+@attr.s(frozen=True)
+class Span:
+    """A named, timed piece of work. Times are from `time.perf_counter()`."""
+
+    name: str = attr.ib()
+    start: float = attr.ib()
+    duration: float = attr.ib()
+    thread: int = attr.ib()
+    attributes: Attributes = attr.ib(factory=dict)
+
+
+Listener = typing.Callable[[Span], None]
+
+_listeners: typing.List[Listener] = []
+
+
+def listen(listener: Listener) -> None:
+    """Call a function with every span recorded from now on."""
+    _listeners.append(listener)
+
+
+def ignore(listener: Listener) -> None:
+    """Stop calling a function registered with `listen()`."""
+    _listeners.remove(listener)
+
+
+def enabled() -> bool:
+    return bool(_listeners)
+
+
+def record(name: str, start: float, **attributes: typing.Any) -> None:
+    """Record a span that started at `start` and ends now."""
+    if not _listeners:
+        return
+    emit(Span(name, start, time.perf_counter() - start, threading.get_ident(), attributes))
+
+
+def emit(span: Span) -> None:
+    for listener in list(_listeners):
+        listener(span)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: typing.Any) -> typing.Iterator[Attributes]:
+    """
+    Time a block of code.
+
+    Yields the span's attributes, so that results only known at the end of
+    the block (like the number of files found) can be added to them.
+    """
+    if not _listeners:
+        yield attributes
+        return
+
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        record(name, start, **attributes)
+
+
+def timed(
+        name: str,
+        items: typing.Iterable[T],
+        count: typing.Optional[str] = None,
+        **attributes: typing.Any) -> typing.Iterator[T]:
+    """
+    Time how long it takes to produce some items, yielding them as they come.
+
+    Time the caller spends between items isn't counted, so the span's duration
+    can be shorter than the time between its start and end. With `count`, the
+    number of items is added to the attributes under that name.
+    """
+    if not _listeners:
+        yield from items
+        return
+
+    start = time.perf_counter()
+    duration, produced = 0.0, 0
+    iterator = iter(items)
+    try:
+        while True:
+            resumed = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                duration += time.perf_counter() - resumed
+            produced += 1
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()  # type: ignore
+        if count is not None:
+            attributes[count] = produced
+        emit(Span(name, start, duration, threading.get_ident(), attributes))
+
+
+@attr.s
+class Recorder:
+    """A listener that keeps every span, to summarise or write as a trace."""
+
+    spans: typing.List[Span] = attr.ib(factory=list)
+    origin: float = attr.ib(factory=time.perf_counter)
+
+    def __call__(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def summary(self) -> typing.List[typing.Tuple[str, int, float, float]]:
+        """The count, total and maximum duration of spans with each name."""
+        durations: typing.Dict[str, typing.List[float]] = collections.defaultdict(list)
+        for span in self.spans:
+            durations[span.name].append(span.duration)
+        return [(name, len(d), sum(d), max(d)) for name, d in durations.items()]
+
+    def format(self) -> str:
+        """Format the summary as a table, followed by the total elapsed time."""
+        lines = [f"{'phase':<24} {'count':>6} {'total':>10} {'max':>10}"]
+        for name, count, total, longest in sorted(self.summary(), key=lambda row: -row[2]):
+            lines.append(f"{name:<24} {count:>6} {total * 1000:>8.1f}ms {longest * 1000:>8.1f}ms")
+        lines.append(f"{'elapsed':<24} {'':>6} {self.elapsed() * 1000:>8.1f}ms")
+        return '\n'.join(lines)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def trace(self) -> typing.Dict[str, typing.Any]:
+        """
+        Convert spans to the Chrome trace event format.
+
+        The result can be loaded into chrome://tracing or https://ui.perfetto.dev
+        to see how work was spread across threads. Attributes that are not
+        JSON types (like paths) should be converted with `default=str`.
+        """
+        return {
+            'displayTimeUnit': 'ms',
+            'traceEvents': [{
+                'name': span.name,
+                'cat': 'fidelius',
+                'ph': 'X',
+                'ts': (span.start - self.origin) * 1e6,
+                'dur': span.duration * 1e6,
+                'pid': 1,
+                'tid': span.thread,
+                'args': span.attributes,
+            } for span in self.spans],
+        }
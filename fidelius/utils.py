@@ -1,22 +1,61 @@
+import collections
+import collections.abc
+import os
 import pathlib
 import typing
+import warnings
 
 import click
-import git
+
+T = typing.TypeVar('T')
+R = typing.TypeVar('R')
 
 
 def find_git_directory() -> typing.Optional[pathlib.Path]:
-    try:
-        repo = git.Repo(search_parent_directories=True)
-    except git.exc.InvalidGitRepositoryError:
-        return None
-    return pathlib.Path(repo.working_dir)
+    """Find the root of the git working tree containing the current directory."""
+    return find_work_tree(pathlib.Path.cwd())
+
+
+def find_work_tree(directory: pathlib.Path) -> typing.Optional[pathlib.Path]:
+    """Find the root of the git working tree containing a directory."""
+    directory = directory.resolve()
+    for candidate in (directory, *directory.parents):
+        if (candidate / '.git').exists():
+            return candidate
+    return None
+
+
+def git_directory(work_tree: pathlib.Path) -> pathlib.Path:
+    """
+    Find the git directory for a working tree.
+
+    Worktrees and submodules use a '.git' file pointing at the real directory.
+    """
+    dot_git = work_tree / '.git'
+    if dot_git.is_file():
+        gitdir = dot_git.read_text().strip()
+        if gitdir.startswith('gitdir:'):
+            return (work_tree / gitdir[len('gitdir:'):].strip()).resolve()
+    return dot_git
 
 
 def in_directory(
         file: pathlib.Path,
         directory: pathlib.Path) -> bool:
-    """Check if a path is a subpath of a directory."""
+    """Check if a path is a subpath of a directory. Deprecated."""
+    warnings.warn("in_directory() is deprecated", DeprecationWarning, stacklevel=2)
+    return _in_directory(file, directory)
+
+
+def in_directories(
+        path: pathlib.Path,
+        directories: typing.Sequence[pathlib.Path]) -> bool:
+    """Check if a path is a subpath of any of a list of directories. Deprecated."""
+    warnings.warn("in_directories() is deprecated", DeprecationWarning, stacklevel=2)
+    return any(_in_directory(path, directory) for directory in directories)
+
+
+def _in_directory(file: pathlib.Path, directory: pathlib.Path) -> bool:
     assert directory != file, f"Can't check {directory} is in itself"
     assert file.is_file(), f"Expected {file} to be a file"
     assert directory.is_dir(), f"Expected {directory} to be a directory"
@@ -29,11 +68,73 @@ def in_directory(
         return True
 
 
-def in_directories(
-        path: pathlib.Path,
-        directories: typing.Sequence[pathlib.Path]) -> bool:
-    """Check if a path is a subpath of any of a list of directories."""
-    return any(in_directory(path, directory) for directory in directories)
+def default_jobs() -> int:
+    """The default number of concurrent gpg processes to run."""
+    return os.cpu_count() or 1
+
+
+def batches(
+        items: typing.Iterable[T],
+        jobs: int,
+        size: int = 32) -> typing.Iterator[typing.Sequence[T]]:
+    """
+    Split items into ordered batches of at most `size` items.
+
+    Batches are made smaller when there are only a few items, so that work
+    can still be spread across `jobs` workers. When the number of items isn't
+    known in advance (like secrets that are still being found), batches
+    start with a single item and grow as more items arrive.
+    """
+    if not isinstance(items, collections.abc.Sequence):
+        return growing_batches(iter(items), jobs, size)
+
+    size = max(1, min(size, -(-len(items) // jobs)))
+    return (items[i:i + size] for i in range(0, len(items), size))
+
+
+def growing_batches(
+        items: typing.Iterator[T],
+        jobs: int,
+        size: int) -> typing.Iterator[typing.Sequence[T]]:
+    batch: typing.List[T] = []
+    count = 0
+    for item in items:
+        batch.append(item)
+        if len(batch) >= min(size, 1 + count // jobs):
+            yield batch
+            count += len(batch)
+            batch = []
+    if batch:
+        yield batch
+
+
+def concurrently(
+        function: typing.Callable[[T], R],
+        items: typing.Iterable[T],
+        jobs: typing.Optional[int] = None) -> typing.Iterator[R]:
+    """
+    Call a function for each item using a pool of worker threads.
+
+    Results are yielded in the same order as the items, regardless of the
+    order the calls complete in. Items are taken as workers become free, so
+    work starts before a generator of items is exhausted and only a few
+    results are held at once. The function should handle its own errors.
+    """
+    jobs = jobs or default_jobs()
+    if jobs == 1:
+        yield from map(function, items)
+        return
+
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending: typing.Deque[concurrent.futures.Future] = collections.deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            while pending and (pending[0].done() or len(pending) >= jobs * 2):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 class FideliusException(click.ClickException):
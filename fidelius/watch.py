@@ -0,0 +1,347 @@
+"""
+Keep plaintext and ciphertext in sync as files change.
+
+A monitor reports which files changed in the directory tree, using inotify on
+Linux and polling directory listings elsewhere. Bursts of changes are
+collected until the tree has been quiet for a short time, then each changed
+secret is decrypted (if its ciphertext changed) or encrypted (if its
+plaintext changed). The manifest records what every plaintext was decrypted
+from, so the files fidelius writes itself are recognised as unchanged and
+don't cause another round of work.
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import select
+import struct
+import time
+import typing
+
+import attr
+
+from . import timings
+from .incantations import EXCLUDE, Fidelius
+from .secrets import Outcome, Secret, SecretKeeper
+from .utils import FideliusException
+
+log = logging.getLogger(__name__)
+
+#: Changed files, or None if changes were lost and everything should be checked.
+Changes = typing.Optional[typing.Set[pathlib.Path]]
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+IN_EVENT = struct.Struct('iIII')
+
+
+class Monitor(abc.ABC):
+    """Reports files that change anywhere under the directories it watches."""
+
+    exclude: typing.AbstractSet[str]
+
+    @abc.abstractmethod
+    def add(self, directory: pathlib.Path) -> typing.Set[pathlib.Path]:
+        """Watch a directory tree, returning the files already in it."""
+
+    @abc.abstractmethod
+    def changes(self, timeout: typing.Optional[float]) -> Changes:
+        """Wait up to `timeout` seconds (or forever) for files to change."""
+
+    def close(self) -> None:
+        pass
+
+    def scan(self, directory: pathlib.Path) -> typing.Tuple[typing.List[pathlib.Path],
+                                                             typing.List[os.DirEntry]]:
+        """List the subdirectories (not excluded) and files in a directory."""
+        directories, files = [], []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in self.exclude:
+                            directories.append(directory / entry.name)
+                    else:
+                        files.append(entry)
+        except OSError as error:
+            log.debug(f"Can't list {directory}: {error}")
+        return directories, files
+
+
+@attr.s
+class Inotify(Monitor):
+    """Watch every directory in a tree with Linux's inotify API."""
+
+    exclude: typing.AbstractSet[str] = attr.ib(default=EXCLUDE)
+    libc: typing.Any = attr.ib(repr=False, default=None)
+    fd: int = attr.ib(default=-1)
+    directories: typing.Dict[int, pathlib.Path] = attr.ib(factory=dict, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.libc is None:
+            self.libc = load_libc()
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add(self, directory: pathlib.Path) -> typing.Set[pathlib.Path]:
+        # The watch is added before listing the directory, so files created
+        # in between are reported by both (and handled once).
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_MASK)
+        if wd < 0:
+            log.warning(f"Can't watch {directory}: {os.strerror(ctypes.get_errno())}")
+            return set()
+
+        self.directories[wd] = directory
+        subdirectories, entries = self.scan(directory)
+        files = {directory / entry.name for entry in entries}
+        for subdirectory in subdirectories:
+            files |= self.add(subdirectory)
+        return files
+
+    def changes(self, timeout: typing.Optional[float]) -> Changes:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: typing.Set[pathlib.Path] = set()
+        for wd, mask, name in self.read():
+            if mask & IN_Q_OVERFLOW:
+                log.warning("Too many changes at once, checking every secret")
+                return None
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            if wd not in self.directories or not name:
+                continue
+
+            path = self.directories[wd] / name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and name not in self.exclude:
+                    changed |= self.add(path)
+            else:
+                changed.add(path)
+        return changed
+
+    def read(self) -> typing.Iterator[typing.Tuple[int, int, str]]:
+        """Read every queued event, as (watch descriptor, mask, name) tuples."""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = IN_EVENT.unpack_from(data, offset)
+                offset += IN_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                yield wd, mask, name
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+@attr.s
+class Poller(Monitor):
+    """Watch a directory tree by listing every directory in it periodically."""
+
+    exclude: typing.AbstractSet[str] = attr.ib(default=EXCLUDE)
+    interval: float = attr.ib(default=1.0)
+    snapshots: typing.Dict[pathlib.Path, typing.Dict[str, tuple]] = attr.ib(
+        factory=dict, repr=False)
+
+    def add(self, directory: pathlib.Path) -> typing.Set[pathlib.Path]:
+        self.snapshots[directory] = {}
+        return self.poll(directory)
+
+    def poll(self, directory: pathlib.Path) -> typing.Set[pathlib.Path]:
+        """List a directory again, returning files that changed since the last listing."""
+        if not directory.is_dir():
+            return {directory / name for name in self.snapshots.pop(directory, {})}
+
+        subdirectories, entries = self.scan(directory)
+        snapshot = {}
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            snapshot[entry.name] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        previous = self.snapshots.get(directory, {})
+        self.snapshots[directory] = snapshot
+        changed = {directory / name for name in snapshot.keys() | previous.keys()
+                   if snapshot.get(name) != previous.get(name)}
+
+        for subdirectory in subdirectories:
+            if subdirectory not in self.snapshots:
+                changed |= self.add(subdirectory)
+        return changed
+
+    def changes(self, timeout: typing.Optional[float]) -> Changes:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            time.sleep(max(wait, 0))
+            changed: typing.Set[pathlib.Path] = set()
+            for directory in list(self.snapshots):
+                changed |= self.poll(directory)
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+def load_libc() -> typing.Any:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError("inotify is not available")
+    return libc
+
+
+def monitor(exclude: typing.AbstractSet[str] = EXCLUDE, poll: bool = False) -> Monitor:
+    """Use inotify if it's available, and poll directory listings otherwise."""
+    if not poll:
+        try:
+            return Inotify(exclude=exclude)
+        except (OSError, AttributeError) as error:
+            log.info(f"Polling for changes as inotify is not available: {error}")
+    return Poller(exclude=exclude)
+
+
+@attr.s
+class Watch:
+    """
+    Decrypt or encrypt each secret as its ciphertext or plaintext changes.
+
+    New encrypted files found in the watched tree become secrets without
+    searching the whole tree again, using the rules of `fidelius` (which
+    should be the one the secrets were found with). If both files of a
+    secret change at the same time, neither is overwritten and a warning is
+    logged.
+    """
+
+    secret_keeper: SecretKeeper = attr.ib()
+    recipients: typing.Sequence[str] = attr.ib(converter=tuple)
+    monitor: Monitor = attr.ib(factory=monitor)
+    fidelius: Fidelius = attr.ib(default=attr.Factory(
+        lambda self: Fidelius(self.secret_keeper.directory), takes_self=True))
+    delay: float = attr.ib(default=0.2)
+    jobs: typing.Optional[int] = attr.ib(default=None)
+    decrypted: typing.Dict[pathlib.Path, Secret] = attr.ib(factory=dict, repr=False)
+
+    def __attrs_post_init__(self):
+        self.decrypted.update((s.decrypted, s) for s in self.secret_keeper.secrets.values())
+
+    @property
+    def root(self) -> pathlib.Path:
+        return self.secret_keeper.directory.resolve()
+
+    def start(self) -> None:
+        self.monitor.add(self.root)
+
+    def collect(self, timeout: typing.Optional[float] = None) -> Changes:
+        """
+        Wait for files to change, then wait until they stop changing.
+
+        Changes are collected until none have been seen for `delay` seconds,
+        or for at most 50 times that long if files keep changing.
+        """
+        changed = self.monitor.changes(timeout)
+        deadline = time.monotonic() + self.delay * 50
+        while changed and time.monotonic() < deadline:
+            more = self.monitor.changes(self.delay)
+            if more is None:
+                return None
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def run(self) -> typing.Iterator[Outcome]:
+        """Sync secrets as they change, forever."""
+        self.start()
+        while True:
+            yield from self.sync(self.collect())
+
+    def sync(self, changed: Changes) -> typing.List[Outcome]:
+        """Decrypt or encrypt the secrets affected by some changed files."""
+        if changed is None:
+            changed = set(self.secret_keeper.secrets) | set(self.decrypted)
+
+        decrypt: typing.Set[Secret] = set()
+        encrypt: typing.Set[Secret] = set()
+        for path in changed:
+            if path in self.secret_keeper.secrets:
+                if path.exists():
+                    decrypt.add(self.secret_keeper.secrets[path])
+                else:
+                    self.forget(self.secret_keeper.secrets[path])
+            elif path in self.decrypted:
+                if path.exists():
+                    encrypt.add(self.decrypted[path])
+            else:
+                secret = self.discover(path)
+                if secret is not None:
+                    decrypt.add(secret)
+
+        for secret in sorted(decrypt & encrypt, key=lambda s: s.encrypted):
+            log.warning(
+                f"Not syncing {self.secret_keeper.rel(secret.encrypted)} as both the "
+                f"encrypted and decrypted files changed")
+
+        outcomes: typing.List[Outcome] = []
+        with timings.span('watch', changed=len(changed)):
+            if decrypt - encrypt:
+                outcomes += self.secret_keeper.decrypt_each(
+                    sorted(decrypt - encrypt, key=lambda s: s.encrypted), jobs=self.jobs)
+            if encrypt - decrypt:
+                outcomes += self.secret_keeper.encrypt_each(
+                    self.recipients, sorted(encrypt - decrypt, key=lambda s: s.encrypted),
+                    jobs=self.jobs)
+        return outcomes
+
+    def discover(self, path: pathlib.Path) -> typing.Optional[Secret]:
+        """Pair a new encrypted file with its decrypted path, if it is one."""
+        try:
+            parts = path.relative_to(self.root).parts
+        except ValueError:
+            return None
+        if path.name.startswith('.') or self.fidelius.exclude.intersection(parts[:-1]):
+            return None
+
+        pair = self.fidelius.pair(self.root, parts)
+        if pair is None or not path.is_file():
+            return None
+
+        try:
+            secret = Secret(encrypted=pair[0], decrypted=pair[1])
+            attr.evolve(self.secret_keeper, secrets={path: secret}).run_gitignore_check()
+        except FideliusException as error:
+            log.error(f"Not decrypting new secret {self.secret_keeper.rel(path)}: {error}")
+            return None
+
+        log.info(f"Found new secret {self.secret_keeper.rel(path)}")
+        self.secret_keeper.secrets[path] = secret
+        self.decrypted[secret.decrypted] = secret
+        return secret
+
+    def forget(self, secret: Secret) -> None:
+        log.info(f"Secret {self.secret_keeper.rel(secret.encrypted)} was removed")
+        self.secret_keeper.secrets.pop(secret.encrypted, None)
+        self.decrypted.pop(secret.decrypted, None)
+
+    def close(self) -> None:
+        self.monitor.close()
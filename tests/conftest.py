@@ -1,4 +1,7 @@
 import pathlib
+import shutil
+import subprocess
+import time
 import typing
 
 import attr
@@ -6,16 +9,87 @@ import click.testing
 import pytest
 
 import fidelius.cli
+from fidelius.gpg import GPG, Backend
+from fidelius.incantations import Fidelius
+from fidelius.secrets import SecretKeeper
 
 ROOT = pathlib.Path(__file__).parent
+FINGERPRINT = '3282A41824B5A9189CAD9DC16EFB03D46CEB08B8'
+RECIPIENT = 'fidelius@example.invalid'
+SECOND = 'second@example.invalid'
+
+
+def wait_for(condition: typing.Callable[[], bool], timeout: float = 10) -> bool:
+    """Wait for a condition to become true, returning False if it doesn't in time."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(scope='session')
+def gnupghome(tmp_path_factory) -> typing.Iterator[pathlib.Path]:
+    """A temporary keyring containing the example key."""
+    home = tmp_path_factory.mktemp('gnupg')
+    home.chmod(0o700)
+    gpg = ('gpg', '--batch', '--homedir', home.as_posix())
+    subprocess.run((*gpg, '--import', (ROOT / 'private.asc').as_posix()),
+                   check=True, stderr=subprocess.DEVNULL)
+    subprocess.run((*gpg, '--import-ownertrust'),
+                   check=True, stderr=subprocess.DEVNULL,
+                   input=f'{FINGERPRINT}:6:\n', encoding='utf-8')
+    yield home
+    subprocess.run(('gpgconf', '--homedir', home.as_posix(), '--kill', 'all'))
+
+
+@pytest.fixture(scope='session')
+def second(gnupghome: pathlib.Path) -> str:
+    """A second key in the temporary keyring, for changing recipients."""
+    subprocess.run(
+        ('gpg', '--batch', '--homedir', gnupghome.as_posix(),
+         '--pinentry-mode', 'loopback', '--passphrase', '',
+         '--quick-generate-key', f'Second <{SECOND}>', 'future-default', 'default', 'never'),
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return SECOND
+
+
+@pytest.fixture(params=['gpg', 'gpgme'])
+def backend(request) -> str:
+    if request.param == 'gpgme':
+        pytest.importorskip('gpg')
+    return request.param
+
+
+@pytest.fixture()
+def gpg(backend: str, gnupghome: pathlib.Path) -> Backend:
+    if backend == 'gpgme':
+        from fidelius.gpgme import GPGME
+        return GPGME(home=gnupghome)
+    return GPG(home=gnupghome)
+
+
+@pytest.fixture()
+def copied(tmp_path: pathlib.Path) -> pathlib.Path:
+    """A temporary directory containing a copy of the example secrets."""
+    shutil.copytree(ROOT / 'files.encrypted', tmp_path / 'files.encrypted')
+    return tmp_path
+
+
+@pytest.fixture()
+def sk(gpg: Backend, copied: pathlib.Path) -> SecretKeeper:
+    """A secret keeper for the copied example secrets."""
+    return Fidelius(copied).cast(gpg=gpg)
 
 
 @pytest.fixture()
-def invoke():
+def invoke(backend: str, gnupghome: pathlib.Path):
     def invoke_func(arguments: typing.Sequence[str]):
         assert all(isinstance(arg, str) for arg in arguments)
         runner = click.testing.CliRunner()
-        result = runner.invoke(fidelius.cli.main, ('-p', ROOT.as_posix(), *arguments))
+        options = ('-p', ROOT.as_posix(), '--backend', backend, '--homedir', gnupghome.as_posix())
+        result = runner.invoke(fidelius.cli.main, (*options, *arguments))
         if result.exit_code != 0:
             message = f"Command fidelius {' '.join(arguments)} failed"
             raise Exception(message) from result.exception
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import pytest
+
+from fidelius.aio import AsyncGPG, ExecutorBackend
+from fidelius.gpg import GPG, Backend
+
+from conftest import RECIPIENT
+
+
+def test_decrypt_all(sk):
+    outcomes = asyncio.run(sk.decrypt_all(limit=4))
+    assert [o.secret for o in outcomes] == list(sk)
+    assert {o.status for o in outcomes} == {'decrypted'}
+
+    outcomes = asyncio.run(sk.decrypt_all(limit=4))
+    assert {o.status for o in outcomes} == {'skipped'}
+
+
+def test_contents_all(sk):
+    sk.decrypt()
+
+    contents = asyncio.run(sk.contents_all(limit=4))
+    assert {s: s.plaintext() for s in sk} == contents
+
+
+@pytest.fixture(params=['async', 'executor'])
+def async_backend(request, gpg):
+    if request.param == 'async':
+        if not isinstance(gpg, GPG):
+            pytest.skip("AsyncGPG only wraps the gpg command")
+        return AsyncGPG(gpg)
+    return ExecutorBackend(gpg)
+
+
+@pytest.mark.parametrize('cls', [AsyncGPG, ExecutorBackend])
+def test_async_backend_methods(cls):
+    methods = {n for n, v in vars(Backend).items() if callable(v) and not n.startswith('_')}
+    assert methods - {'ensure_parent'} <= set(vars(cls))
+
+
+def test_async_backend(async_backend, tmp_path):
+    recipients = [RECIPIENT]
+    path = tmp_path / 'example.encrypted.txt.asc'
+    copy = tmp_path / 'copy.encrypted.txt.gpg'
+
+    async def run():
+        await async_backend.encrypt_stream(path, [b'one ', b'two'], True, recipients)
+        assert await async_backend.contents(path, True) == 'one two'
+        chunks = [chunk async for chunk in async_backend.stream(path, True)]
+        assert b''.join(chunks) == b'one two'
+
+        await async_backend.decrypt(path, tmp_path / 'one.txt', True)
+        await async_backend.encrypt_file(copy, tmp_path / 'one.txt', False, recipients)
+        await async_backend.encrypt_text(path, 'three', True, recipients)
+        results = await async_backend.decrypt_many([
+            (path, tmp_path / 'three.txt'), (copy, tmp_path / 'two.txt')])
+        assert results == {path: None, copy: None}
+        assert (tmp_path / 'three.txt').read_text() == 'three'
+        assert (tmp_path / 'two.txt').read_text() == 'one two'
+        assert await async_backend.encryption_keys(recipients[0])
+
+    asyncio.run(run())
+
+
+def test_async_gpg_cancelled(gnupghome, tmp_path, monkeypatch):
+    pid = tmp_path / 'pid'
+    (tmp_path / 'gpg').write_text(f'#!/bin/sh\necho $$ > {pid}\nexec sleep 30\n')
+    (tmp_path / 'gpg').chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}:{os.environ["PATH"]}')
+
+    async def run():
+        task = asyncio.ensure_future(AsyncGPG(GPG(home=gnupghome)).run(['--version'], False))
+        while not pid.exists() or not pid.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid.read_text()), 0)
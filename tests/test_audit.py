@@ -0,0 +1,57 @@
+import pytest
+
+from fidelius.incantations import Fidelius
+from fidelius.utils import FideliusException
+
+from conftest import RECIPIENT, ROOT
+
+KEY_ID = '5F0A4D12B3FC772F'
+
+
+def test_audit(gpg, copied):
+    reports = list(Fidelius(copied).cast(gpg=gpg).audit_each([RECIPIENT]))
+    assert len(reports) == 6
+    assert all(report.ok and report.key_ids == {KEY_ID} for report in reports)
+
+
+def test_audit_without_recipients(gpg, copied):
+    reports = list(Fidelius(copied).cast(gpg=gpg).audit_each())
+    assert all(report.ok for report in reports)
+
+
+def test_audit_mismatch(gpg, copied, second):
+    report = next(Fidelius(copied).cast(gpg=gpg).audit_each([second]))
+    assert report.missing == (second,)
+    assert report.unexpected == {KEY_ID}
+    assert not report.ok
+
+
+def test_audit_corrupt(gpg, copied):
+    broken = copied / 'files.encrypted' / 'broken.json.gpg'
+    broken.write_bytes((ROOT / 'files.encrypted' / 'dir-gpg-short.json.gpg').read_bytes()[:-10])
+
+    reports = {r.secret.encrypted.name: r for r in Fidelius(copied).cast(gpg=gpg).audit_each()}
+    assert reports['broken.json.gpg'].problem.startswith('Truncated')
+    assert reports['dir-gpg-short.json.gpg'].ok
+
+
+def test_audit_unknown_recipient(gpg, copied):
+    with pytest.raises(FideliusException, match='nobody@example.invalid'):
+        list(Fidelius(copied).cast(gpg=gpg).audit_each(['nobody@example.invalid']))
+
+
+def test_audit_cache(gpg, copied, monkeypatch):
+    (copied / '.git').mkdir()
+    list(Fidelius(copied).cast(gpg=gpg).audit_each())
+    assert (copied / '.git' / 'fidelius' / 'audit.json').exists()
+
+    def inspect(path):
+        raise AssertionError(f"{path} was inspected again")
+
+    monkeypatch.setattr('fidelius.packets.inspect', inspect)
+    assert all(r.ok for r in Fidelius(copied).cast(gpg=gpg).audit_each())
+
+
+def test_audit_command(invoke):
+    output = invoke(['audit', '-r', RECIPIENT])
+    assert output[0].endswith(f': {KEY_ID}')
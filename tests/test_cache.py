@@ -0,0 +1,60 @@
+import attr
+
+from fidelius.cache import SecretCache
+from fidelius.incantations import Fidelius
+
+
+def cast(gpg, directory, **kwargs):
+    return Fidelius(directory).cast(gpg=gpg, secret_cache=SecretCache(**kwargs))
+
+
+def test_cache_hit(gpg, copied, tmp_path):
+    sk = cast(gpg, copied)
+    secrets = list(sk)
+    contents = [sk.read(s) for s in secrets]
+
+    # A keyring without the private key would fail to decrypt anything.
+    keyless = attr.evolve(sk, gpg=attr.evolve(gpg, home=tmp_path))
+    assert [keyless.read(s) for s in secrets] == contents
+
+
+def test_cache_invalidated_by_changes(gpg, copied):
+    sk = cast(gpg, copied)
+    secret = next(iter(sk))
+    sk.read(secret)
+    gpg.encrypt_text(
+        path=secret.encrypted,
+        text='{"changed": true}',
+        armour=secret.armour,
+        recipients=['fidelius@example.invalid'])
+    assert sk.read(secret) == b'{"changed": true}'
+    assert len(sk.secret_cache.entries) == 1
+
+
+def test_cache_expires(gpg, copied):
+    now = [0.0]
+    sk = cast(gpg, copied, ttl=10, clock=lambda: now[0])
+    secret = next(iter(sk))
+    sk.read(secret)
+    entry, = sk.secret_cache.entries.values()
+    now[0] = 11.0
+    sk.read(secret)
+    assert set(entry.buffer) == {0}
+
+
+def test_cache_evicts_least_recently_used(gpg, copied):
+    sk = cast(gpg, copied, max_size=100)
+    first = sk[copied / 'files.encrypted/dir-asc-short.json.asc']
+    second = sk[copied / 'files.encrypted/dir-gpg-short.json.gpg']
+    sk.read(first)
+    entry, = sk.secret_cache.entries.values()
+    sk.read(second)
+    assert len(sk.secret_cache.entries) == 1
+    assert set(entry.buffer) == {0}
+
+
+def test_cache_load(gpg, copied):
+    sk = cast(gpg, copied)
+    secret = next(iter(sk))
+    assert isinstance(sk.load(secret), dict)
+    assert sk.load(secret) is sk.load(secret)
@@ -0,0 +1,19 @@
+import os
+
+
+def test_cat(invoke, secret):
+    invoke(['decrypt'])
+    assert invoke(['cat', secret.encrypted.as_posix()]) == secret.decrypted.read_text().splitlines()
+
+
+def test_stream_binary(gpg, tmp_path):
+    plaintext = tmp_path / 'keystore.bin'
+    plaintext.write_bytes(os.urandom(256 * 1024) + b'\xff\xfe\x00')
+    encrypted = tmp_path / 'keystore.encrypted.bin.gpg'
+    gpg.encrypt_file(
+        output=encrypted,
+        encrypt=plaintext,
+        armour=False,
+        recipients=['fidelius@example.invalid'])
+
+    assert b''.join(gpg.stream(encrypted, armour=False)) == plaintext.read_bytes()
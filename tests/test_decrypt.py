@@ -1,3 +1,46 @@
+import pytest
+
+from fidelius.incantations import Fidelius
+from fidelius.utils import FideliusException
+
+
 def test_decrypt(invoke, secret):
     invoke(['decrypt'])
     assert secret.decrypted.exists()
+
+
+def test_decrypt_jobs(invoke, secret):
+    invoke(['decrypt', '--jobs', '4'])
+    assert secret.decrypted.exists()
+
+
+def test_decrypt_failure_keeps_other_results(gpg, copied):
+    (copied / 'files.encrypted' / 'broken.json.asc').write_text('not a secret')
+
+    sk = Fidelius(copied).cast(gpg=gpg)
+    with pytest.raises(FideliusException, match='broken.json.asc'):
+        sk.decrypt(jobs=4)
+
+    assert (copied / 'files' / 'dir-asc-short.decrypted.json').exists()
+    assert (copied / 'files' / 'subdirectory' / 'subdir-gpg.decrypted.json').exists()
+    assert not (copied / 'files' / 'broken.decrypted.json').exists()
+
+
+def test_decrypt_skips_current_plaintext(invoke, secret):
+    assert f'Decrypted {secret.enc} to {secret.dec}' in invoke(['decrypt', '--force'])
+    mtime = secret.decrypted.stat().st_mtime_ns
+    assert f'Skipping {secret.enc} as {secret.dec} is up to date' in invoke(['decrypt'])
+    assert secret.decrypted.stat().st_mtime_ns == mtime
+
+
+def test_decrypt_replaces_modified_plaintext(sk, tmp_path):
+    sk.decrypt()
+
+    plaintext = tmp_path / 'files' / 'dir-asc-short.decrypted.json'
+    expected = plaintext.read_text()
+    plaintext.write_text('modified')
+
+    statuses = {o.secret.decrypted.name: o.status for o in sk.decrypt()}
+    assert statuses.pop('dir-asc-short.decrypted.json') == 'decrypted'
+    assert set(statuses.values()) == {'skipped'}
+    assert plaintext.read_text() == expected
@@ -0,0 +1,7 @@
+def test_encrypt_unchanged(invoke, secret):
+    invoke(['decrypt'])
+    before = secret.encrypted.read_bytes()
+    output = invoke(['encrypt', '--jobs', '4', '-r', 'fidelius@example.invalid'])
+    assert f'Skipping {secret.enc} as no changes have been made in {secret.dec}' in output
+    assert output[-1] == '0 encrypted, 8 skipped, 0 missing, 0 failed'
+    assert secret.encrypted.read_bytes() == before
@@ -0,0 +1,135 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from fidelius.execute import Vault, variable
+
+from conftest import ROOT, wait_for
+
+NAME = 'dir-asc-short.decrypted.json'
+
+
+@pytest.fixture(params=[False, True], ids=['tmpfs', 'memfd'])
+def memfd(request):
+    if request.param and not hasattr(os, 'memfd_create'):
+        pytest.skip("memfd_create() is not available")
+    return request.param
+
+
+def child(*lines):
+    return (sys.executable, '-c', '\n'.join(('import os, pathlib', *lines)))
+
+
+def test_variable():
+    assert variable('files/dir-asc-short.decrypted.json') == 'FIDELIUS_FILES_DIR_ASC_SHORT_JSON'
+    assert variable('config.decrypted.yaml') == 'FIDELIUS_CONFIG_YAML'
+
+
+def test_exec(sk, tmp_path, memfd):
+    output = tmp_path / 'output'
+    with Vault(sk, sk.select(()), memfd=memfd) as vault:
+        assert not any(o.failed for o in vault.open(jobs=4))
+        directory = vault.directory
+        assert vault.run(child(
+            "secrets = pathlib.Path(os.environ['FIDELIUS_SECRETS'])",
+            f"text = (secrets / 'files' / '{NAME}').read_text()",
+            "path = pathlib.Path(os.environ['FIDELIUS_FILES_DIR_ASC_SHORT_JSON'])",
+            "assert text == path.read_text()",
+            f"pathlib.Path({str(output)!r}).write_text(text)")) == 0
+
+    assert output.read_text() == (ROOT / 'files' / NAME).read_text()
+    assert not directory.exists()
+    assert not (tmp_path / 'files').exists()
+
+
+def test_exit_status(sk):
+    with Vault(sk, sk.select(())) as vault:
+        vault.open()
+        assert vault.run(child('raise SystemExit(3)')) == 3
+
+
+def test_links(sk, tmp_path, memfd):
+    plaintext = tmp_path / 'files' / NAME
+    output = tmp_path / 'output'
+    with Vault(sk, sk.select(()), memfd=memfd, links=True) as vault:
+        vault.open()
+        assert plaintext.is_symlink()
+        vault.run(child(
+            f"text = pathlib.Path({str(plaintext)!r}).read_text()",
+            f"pathlib.Path({str(output)!r}).write_text(text)"))
+
+    assert output.read_text() == (ROOT / 'files' / NAME).read_text()
+    assert not os.path.lexists(plaintext)
+
+
+def test_links_existing_plaintext(sk, tmp_path):
+    sk.decrypt()
+    with pytest.raises(Exception, match="existing plaintext"):
+        with Vault(sk, sk.select(()), links=True) as vault:
+            vault.open()
+    assert (tmp_path / 'files' / NAME).is_file()
+
+
+def test_cli(invoke, tmp_path):
+    output = tmp_path / 'output'
+    encrypted = ROOT / 'files.encrypted' / 'dir-asc-short.json.asc'
+    invoke(['exec', encrypted.as_posix(), '--', *child(
+        "path = os.environ['FIDELIUS_FILES_DIR_ASC_SHORT_JSON']",
+        f"pathlib.Path({str(output)!r}).write_text(path)")])
+
+    path = output.read_text()
+    assert path.endswith(f'files/{NAME}')
+    assert not os.path.exists(path)
+
+
+def test_cli_cleans_up_on_hangup(copied, tmp_path):
+    subprocess.run(('git', 'init', '-q', tmp_path.as_posix()), check=True)
+    (tmp_path / '.gitignore').write_text('/files/\n')
+    started, runtime, bin = tmp_path / 'started', tmp_path / 'runtime', tmp_path / 'bin'
+    runtime.mkdir()
+    bin.mkdir()
+    (bin / 'gpg').write_text(f'#!/bin/sh\ntouch {started}\nexec sleep 30\n')
+    (bin / 'gpg').chmod(0o755)
+
+    # A hangup is sent to the whole process group, including gpg.
+    process = subprocess.Popen(
+        (sys.executable, '-m', 'fidelius', '-p', tmp_path.as_posix(), 'exec', '--', 'true'),
+        env={**os.environ, 'PATH': f'{bin}:{os.environ["PATH"]}',
+             'PYTHONPATH': ROOT.parent.as_posix(), 'XDG_RUNTIME_DIR': runtime.as_posix()},
+        cwd=tmp_path,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True)
+    try:
+        assert wait_for(started.exists)
+        assert list(runtime.iterdir())
+        os.killpg(process.pid, signal.SIGHUP)
+        assert process.wait(timeout=10) == 128 + signal.SIGHUP
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+    assert not list(runtime.iterdir())
+
+
+def test_cli_corrupt_secret(copied, tmp_path, gnupghome):
+    subprocess.run(('git', 'init', '-q', tmp_path.as_posix()), check=True)
+    (tmp_path / '.gitignore').write_text('/files/\n')
+    (tmp_path / 'files.encrypted' / 'broken.json.asc').write_text('not a secret')
+    runtime = tmp_path / 'runtime'
+    runtime.mkdir()
+
+    result = subprocess.run(
+        (sys.executable, '-m', 'fidelius', '-p', tmp_path.as_posix(),
+         '--homedir', gnupghome.as_posix(), 'exec', '--', 'true'),
+        env={**os.environ, 'PYTHONPATH': ROOT.parent.as_posix(),
+             'XDG_RUNTIME_DIR': runtime.as_posix()},
+        cwd=tmp_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding='utf-8')
+    assert result.returncode == 1
+    assert 'Failed to decrypt files.encrypted/broken.json.asc' in result.stderr
+    assert 'Traceback' not in result.stderr
+    assert not list(runtime.iterdir())
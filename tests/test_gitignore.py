@@ -0,0 +1,119 @@
+import subprocess
+
+import pytest
+
+from fidelius import timings
+from fidelius.gitignore import GitIgnore
+from fidelius.incantations import Fidelius
+from fidelius.secrets import check_ignored
+from fidelius.utils import FideliusException
+
+GITIGNORE = """\
+# comment
+*.decrypted.*
+build/
+/top-only.txt
+logs/**
+!logs/keep.txt
+docs/**/secret.md
+a?c.txt
+[!d]y.txt
+\\#hash.txt
+trailing.txt   
+!important.decrypted.json
+nested/*.log
+"""
+
+PATHS = [
+    'x.decrypted.json', 'sub/x.decrypted.json', 'build/out.txt', 'src/build/out.txt',
+    'top-only.txt', 'sub/top-only.txt', 'logs/a.txt', 'logs/keep.txt', 'logs/deep/keep.txt',
+    'docs/secret.md', 'docs/a/b/secret.md', 'abc.txt', 'a/c.txt', 'ay.txt', 'dy.txt',
+    '#hash.txt', 'trailing.txt', 'important.decrypted.json', 'nested/a.log',
+    'nested/b/a.log', 'sub/local.txt', 'sub/more/local.txt', 'local.txt',
+    'sub/keep.decrypted.json', 'sub/anchored.txt', 'sub/more/anchored.txt',
+    'excluded.txt', 'plain.txt',
+]
+
+
+@pytest.fixture()
+def repository(tmp_path):
+    subprocess.run(('git', 'init', '-q', str(tmp_path)), check=True)
+    (tmp_path / '.gitignore').write_text(GITIGNORE)
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub/.gitignore').write_text('local.txt\n!keep.decrypted.json\n/anchored.txt\n')
+    (tmp_path / '.git/info').mkdir(exist_ok=True)
+    (tmp_path / '.git/info/exclude').write_text('excluded.txt\n')
+    return tmp_path
+
+
+def test_matches_git(repository):
+    result = subprocess.run(
+        ('git', 'check-ignore', '--no-index', '--stdin'),
+        cwd=repository,
+        stdout=subprocess.PIPE,
+        input='\n'.join(PATHS),
+        encoding='utf-8')
+    expected = set(result.stdout.splitlines())
+
+    gitignore = GitIgnore(repository)
+    assert {p for p in PATHS if gitignore.ignored(p)} == expected
+
+
+def test_included_is_cached(repository):
+    path = repository / 'plain.decrypted.txt'
+    gitignore = GitIgnore(repository)
+    assert gitignore.included([path]) == set()
+    gitignore.save()
+    assert (repository / '.git/fidelius/gitignore.json').exists()
+
+    (repository / '.gitignore').write_text('')
+    assert GitIgnore(repository).included([path]) == {path}
+
+
+def test_tracked_files_are_not_ignored(repository):
+    path = repository / 'files/a.decrypted.json'
+    path.parent.mkdir()
+    path.write_text('{}')
+    subprocess.run(('git', 'add', '-f', 'files/a.decrypted.json'), cwd=repository, check=True)
+
+    assert GitIgnore(repository).included([path]) == set()
+    with pytest.raises(FideliusException, match='a.decrypted.json'):
+        check_ignored({path}, repository)
+
+    subprocess.run(('git', 'rm', '-q', '--cached', 'files/a.decrypted.json'),
+                   cwd=repository, check=True)
+    check_ignored({path}, repository)
+
+
+def test_cache_is_kept_per_source(repository):
+    top, nested = repository / 'a.decrypted.json', repository / 'sub/a.decrypted.json'
+    gitignore = GitIgnore(repository)
+    gitignore.included([top])
+    gitignore.save()
+    gitignore = GitIgnore(repository)
+    gitignore.included([nested])
+    gitignore.save()
+    assert GitIgnore(repository).load()['results'].keys() == {'a.decrypted.json',
+                                                              'sub/a.decrypted.json'}
+
+    (repository / 'sub/.gitignore').write_text('# changed\n')
+    assert GitIgnore(repository).load()['results'].keys() == {'a.decrypted.json'}
+
+
+def test_index_is_listed_once(gpg, copied):
+    subprocess.run(('git', 'init', '-q', str(copied)), check=True)
+    (copied / '.gitignore').write_text('/files/\n')
+
+    def listings():
+        recorder = timings.Recorder()
+        timings.listen(recorder)
+        try:
+            list(Fidelius(copied).cast_lazily(gpg=gpg).stream())
+        finally:
+            timings.ignore(recorder)
+        return len([s for s in recorder.spans if s.name == 'git ls-files'])
+
+    assert listings() == 1
+    assert listings() == 0
+    subprocess.run(('git', 'add', '.gitignore'), cwd=copied, check=True)
+    assert listings() == 1
@@ -0,0 +1,40 @@
+from fidelius.gpg import GPG
+from fidelius.utils import FideliusException
+
+from conftest import ROOT
+
+
+def test_decrypt_many(gpg, tmp_path, caplog):
+    broken = tmp_path / 'broken.json.asc'
+    broken.write_text('not a secret')
+    pairs = [
+        (ROOT / 'files/file-asc.encrypted.json.asc', tmp_path / 'one/file-asc.json'),
+        (broken, tmp_path / 'broken.json'),
+        (ROOT / 'files/file-gpg.encrypted.json.gpg', tmp_path / 'two/file-gpg.json'),
+    ]
+
+    results = gpg.decrypt_many(pairs)
+
+    assert results[pairs[0][0]] is None
+    assert results[pairs[2][0]] is None
+    assert isinstance(results[broken], FideliusException)
+    assert (tmp_path / 'one/file-asc.json').read_text().startswith('{')
+    assert (tmp_path / 'two/file-gpg.json').exists()
+    assert not (tmp_path / 'broken.json').exists()
+    assert not list(tmp_path.glob('**/.fidelius-*'))
+    assert caplog.records
+    assert all(r.message.startswith(f'{broken}: ') for r in caplog.records)
+
+
+def test_file_statuses_keeps_messages_before_the_first_file():
+    preamble, statuses = GPG.file_statuses(
+        'gpg: can\'t connect to the agent\n'
+        '[GNUPG:] FILE_START 3 0/1.asc\n'
+        'gpg: decryption failed: No secret key\n'
+        '[GNUPG:] DECRYPTION_FAILED\n'
+        '[GNUPG:] FILE_DONE\n')
+    assert preamble == ["gpg: can't connect to the agent"]
+    assert statuses == {'0/1.asc': (False, ['gpg: decryption failed: No secret key'])}
+    error = GPG.file_error(ROOT / 'broken.asc', preamble + statuses['0/1.asc'][1])
+    assert "can't connect to the agent" in str(error)
+    assert 'No secret key' in str(error)
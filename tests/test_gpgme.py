@@ -0,0 +1,53 @@
+import types
+
+import pytest
+
+from fidelius.gpgme import recipient_keys
+from fidelius.utils import FideliusException
+
+from conftest import FINGERPRINT, RECIPIENT
+
+
+def key(fpr, *uids, **flags):
+    return types.SimpleNamespace(
+        fpr=fpr,
+        subkeys=[types.SimpleNamespace(fpr=fpr)],
+        uids=[types.SimpleNamespace(uid=f'Example <{email}>', email=email) for email in uids],
+        can_encrypt=flags.get('can_encrypt', True),
+        invalid=False,
+        disabled=False,
+        revoked=flags.get('revoked', False),
+        expired=False)
+
+
+KEYS = [
+    key(FINGERPRINT, RECIPIENT),
+    key('0' * 40, f'other.{RECIPIENT}'),
+    key('1' * 40, 'revoked@example.invalid', revoked=True),
+]
+
+
+def keylist(pattern):
+    """Find keys like gpg does, where any part of a user ID matches."""
+    pattern = pattern[2:] if pattern.startswith('0x') else pattern
+    return [k for k in KEYS if pattern.upper() in k.fpr or any(pattern in u.uid for u in k.uids)]
+
+
+@pytest.mark.parametrize('recipient', [
+    RECIPIENT, f'<{RECIPIENT}>', f'Example <{RECIPIENT}>', FINGERPRINT, f'0x{FINGERPRINT[-16:]}',
+])
+def test_recipient_keys(recipient):
+    assert recipient_keys(keylist, [recipient]) == [KEYS[0]]
+
+
+@pytest.mark.parametrize('recipient', [
+    'unknown@example.invalid', 'example.invalid', 'revoked@example.invalid',
+])
+def test_recipient_keys_unknown(recipient):
+    with pytest.raises(FideliusException, match=f"No usable encryption key for {recipient}"):
+        recipient_keys(keylist, [RECIPIENT, recipient])
+
+
+def test_recipient_keys_empty():
+    with pytest.raises(FideliusException, match="No recipients"):
+        recipient_keys(keylist, [])
@@ -0,0 +1,108 @@
+import pathlib
+
+import pytest
+
+from fidelius.incantations import Fidelius
+from fidelius.index import SecretIndex, translate
+from fidelius.secrets import Secret
+from fidelius.utils import FideliusException
+
+from conftest import ROOT
+
+
+@pytest.fixture()
+def sk():
+    return Fidelius(ROOT).cast()
+
+
+def names(secrets):
+    return [s.encrypted.relative_to(ROOT.resolve()).as_posix() for s in secrets]
+
+
+def test_translate():
+    assert translate('a/*.asc').fullmatch('a/b.asc')
+    assert not translate('a/*.asc').fullmatch('a/b/c.asc')
+    assert translate('a/**/*.asc').fullmatch('a/c.asc')
+    assert translate('a/**/*.asc').fullmatch('a/b/c/d.asc')
+    assert translate('a/**').fullmatch('a/b/c')
+    assert translate('a/[!b]?').fullmatch('a/cd')
+    assert not translate('a/[!b]?').fullmatch('a/bd')
+    assert translate('a+b(c)').fullmatch('a+b(c)')
+
+
+def test_order(sk):
+    assert [s.encrypted for s in sk] == sorted(s.encrypted for s in sk)
+
+
+def test_lookup_does_not_resolve(sk, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    encrypted = ROOT / 'files.encrypted/dir-asc-short.json.asc'
+    secret = sk[encrypted]
+
+    def resolve(self, strict=False):
+        raise AssertionError(f"{self} was resolved")
+
+    monkeypatch.setattr(pathlib.Path, 'resolve', resolve)
+    assert sk[encrypted] is secret
+    assert sk[pathlib.Path('files.encrypted/dir-asc-short.json.asc')] is secret
+    assert sk[pathlib.Path('files/../files.encrypted/dir-asc-short.json.asc')] is secret
+
+
+def test_lookup_through_symlink(sk, tmp_path):
+    (tmp_path / 'link').symlink_to(ROOT)
+    secret = sk[tmp_path / 'link/files.encrypted/dir-asc-short.json.asc']
+    assert secret.encrypted == ROOT.resolve() / 'files.encrypted/dir-asc-short.json.asc'
+
+
+def test_select_directory(sk, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    expected = ['files.encrypted/subdirectory/subdir-asc.json.asc',
+                'files.encrypted/subdirectory/subdir-gpg.json.gpg']
+    assert names(sk.select([pathlib.Path('files.encrypted/subdirectory')])) == expected
+    assert names(sk.select([pathlib.Path('files/subdirectory')])) == expected
+
+
+def test_select_glob(sk, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    assert names(sk.select([pathlib.Path('files.encrypted/**/*.asc')])) == [
+        'files.encrypted/dir-asc-long.encrypted.json.asc',
+        'files.encrypted/dir-asc-short.json.asc',
+        'files.encrypted/subdirectory/subdir-asc.json.asc',
+    ]
+    # Globs match decrypted paths too.
+    assert len(sk.select([pathlib.Path('files/*.json')])) == 6
+
+
+def test_select_without_duplicates(sk, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    selected = sk.select([pathlib.Path('files/subdirectory'), pathlib.Path('**/subdir-*')])
+    assert len(selected) == 2
+
+
+def test_select_nothing(sk):
+    with pytest.raises(FideliusException):
+        sk.select([ROOT / 'missing/**'])
+    with pytest.raises(FideliusException):
+        sk.select([ROOT / 'missing'])
+
+
+def test_index_changes(tmp_path):
+    def secret(name):
+        return Secret(encrypted=tmp_path / f'{name}.encrypted.txt.asc',
+                      decrypted=tmp_path / f'{name}.decrypted.txt')
+
+    index = SecretIndex(tmp_path, {s.encrypted: s for s in map(secret, ('c', 'a'))})
+    b = secret('b')
+    index[b.encrypted] = b
+    assert [s.decrypted.name for s in index.values()] == [
+        'a.decrypted.txt', 'b.decrypted.txt', 'c.decrypted.txt']
+    assert b.encrypted in index
+
+    del index[tmp_path / 'a.encrypted.txt.asc']
+    assert list(index) == [b.encrypted, tmp_path / 'c.encrypted.txt.asc']
+    assert index.prefix(tmp_path) == index.values()
+
+
+def test_cli_glob(invoke):
+    lines = invoke(['decrypt', '--force', (ROOT / 'files.encrypted/subdirectory/*').as_posix()])
+    assert len(lines) == 2
@@ -0,0 +1,30 @@
+import attr
+
+from fidelius.incantations import Fidelius
+
+
+def test_encrypt_skips_without_gpg(sk, gpg, tmp_path):
+    sk.decrypt()
+
+    # A keyring without the private key would fail to decrypt anything.
+    keyless = attr.evolve(sk, gpg=attr.evolve(gpg, home=tmp_path))
+    outcomes = list(keyless.encrypt_each(recipients=['fidelius@example.invalid']))
+    assert {o.status for o in outcomes} == {'skipped'}
+
+
+def test_missing_entry_falls_back_to_decrypting(sk):
+    sk.decrypt()
+    sk.manifest.entries.clear()
+
+    outcomes = list(sk.encrypt_each(recipients=['fidelius@example.invalid']))
+    assert {o.status for o in outcomes} == {'skipped'}
+    assert len(sk.manifest.entries) == len(outcomes)
+
+
+def test_manifest_is_saved(gpg, copied, tmp_path):
+    (tmp_path / '.git').mkdir()
+    Fidelius(tmp_path).cast(gpg=gpg).decrypt()
+
+    manifest = Fidelius(tmp_path).cast(gpg=gpg).manifest
+    assert manifest.path == tmp_path.resolve() / '.git' / 'fidelius' / 'manifest.json'
+    assert 'files.encrypted/dir-asc-short.json.asc' in manifest.entries
@@ -0,0 +1,71 @@
+import pytest
+
+from fidelius.packets import CRC24_POLY, CRC24_TABLE, crc24, inspect, key_ids
+
+from conftest import ROOT
+
+KEY_ID = '5F0A4D12B3FC772F'
+ASC = ROOT / 'files' / 'file-asc.encrypted.json.asc'
+GPG = ROOT / 'files' / 'file-gpg.encrypted.json.gpg'
+
+
+@pytest.mark.parametrize('path', [ASC, GPG])
+def test_key_ids(path):
+    assert key_ids(path) == {KEY_ID}
+
+
+@pytest.mark.parametrize('path', [ASC, GPG])
+def test_inspect(path):
+    inspection = inspect(path)
+    assert inspection.key_ids == {KEY_ID}
+    assert inspection.problem is None
+
+
+def test_truncated_binary(tmp_path):
+    path = tmp_path / 'truncated.gpg'
+    path.write_bytes(GPG.read_bytes()[:-10])
+    assert inspect(path).problem.startswith('Truncated')
+
+
+def test_truncated_armour(tmp_path):
+    path = tmp_path / 'truncated.asc'
+    path.write_bytes(ASC.read_bytes()[:-40])
+    assert inspect(path).problem.startswith('Truncated')
+
+
+def test_armour_checksum(tmp_path):
+    lines = ASC.read_text().splitlines()
+    index = max(i for i, line in enumerate(lines) if len(line) == 64)
+    line = lines[index]
+    lines[index] = line[:30] + ('A' if line[30] != 'A' else 'B') + line[31:]
+    path = tmp_path / 'corrupt.asc'
+    path.write_text('\n'.join(lines))
+    assert inspect(path).problem == 'Corrupt: ASCII armour checksum does not match'
+
+
+def test_trailing_data(tmp_path):
+    path = tmp_path / 'trailing.gpg'
+    path.write_bytes(GPG.read_bytes() * 2)
+    assert inspect(path).problem == 'Unexpected data after encrypted data'
+
+
+def test_not_openpgp(tmp_path):
+    path = tmp_path / 'plaintext.gpg'
+    path.write_text('{"plaintext": true}')
+    assert inspect(path).problem == 'Corrupt: Not an OpenPGP packet'
+
+
+def test_crc24_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= CRC24_POLY
+        table.append(crc & 0xFFFFFF)
+    assert CRC24_TABLE == tuple(table)
+
+
+def test_crc24():
+    assert crc24(b'123456789') == 0x21CF02
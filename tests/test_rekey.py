@@ -0,0 +1,80 @@
+import shutil
+
+from fidelius.incantations import Fidelius
+from fidelius.packets import key_ids
+
+from conftest import RECIPIENT, ROOT
+
+
+def test_rekey_unchanged_recipients(gpg, copied):
+    sk = Fidelius(copied).cast(gpg=gpg)
+    before = {s.encrypted: s.encrypted.read_bytes() for s in sk}
+
+    outcomes = list(sk.rekey_each([RECIPIENT]))
+
+    assert {o.status for o in outcomes} == {'skipped'}
+    assert before == {s.encrypted: s.encrypted.read_bytes() for s in sk}
+
+
+def test_rekey_new_recipients(gpg, copied, second):
+    sk = Fidelius(copied).cast(gpg=gpg)
+    contents = {s.encrypted: s.contents(gpg) for s in sk}
+    modes = {s.encrypted: s.encrypted.stat().st_mode for s in sk}
+
+    outcomes = list(sk.rekey_each([RECIPIENT, second], jobs=4))
+
+    assert {o.status for o in outcomes} == {'rekeyed'}
+    for secret in sk:
+        assert len(key_ids(secret.encrypted)) == 2
+        assert secret.contents(gpg) == contents[secret.encrypted]
+        assert secret.encrypted.stat().st_mode == modes[secret.encrypted]
+        assert secret.encrypted.read_bytes().startswith(b'-----BEGIN') == secret.armour
+    assert {o.status for o in sk.rekey_each([RECIPIENT, second])} == {'skipped'}
+    assert not list(copied.rglob('.fidelius-rekey-*'))
+
+
+def test_rekey_force(gpg, copied):
+    sk = Fidelius(copied).cast(gpg=gpg)
+    secret = next(iter(sk))
+    before = secret.encrypted.read_bytes()
+
+    outcomes = list(sk.rekey_each([RECIPIENT], [secret], force=True))
+
+    assert [o.status for o in outcomes] == ['rekeyed']
+    assert secret.encrypted.read_bytes() != before
+
+
+def test_rekey_failure_keeps_ciphertext(gpg, copied, second):
+    broken = copied / 'files.encrypted' / 'broken.json.asc'
+    shutil.copy(ROOT / 'files.encrypted' / 'dir-asc-short.json.asc', broken)
+    text = broken.read_text()
+    broken.write_text(text[:len(text) // 2] + text[-40:])
+    before = broken.read_bytes()
+
+    sk = Fidelius(copied).cast(gpg=gpg)
+    statuses = {o.secret.encrypted.name: o.status for o in sk.rekey_each([RECIPIENT, second])}
+
+    assert statuses.pop('broken.json.asc') == 'failed'
+    assert set(statuses.values()) == {'rekeyed'}
+    assert broken.read_bytes() == before
+    assert not list(copied.rglob('.fidelius-rekey-*'))
+
+
+def test_rekey_command(invoke):
+    output = invoke(['rekey', '-r', RECIPIENT])
+    assert output[-1] == '0 re-encrypted, 8 skipped, 0 failed'
+
+
+def test_rekey_temporary_file_is_not_a_secret(gpg, copied, second, monkeypatch):
+    sk = Fidelius(copied).cast(gpg=gpg)
+    encrypt_stream, found = type(gpg).encrypt_stream, []
+
+    def interrupted(self, path, *args):
+        encrypt_stream(self, path, *args)
+        # Search while the temporary file exists, as if rekey had been killed.
+        found.append(list(Fidelius(copied).search()))
+
+    monkeypatch.setattr(type(gpg), 'encrypt_stream', interrupted)
+    secret = sk[copied.resolve() / 'files.encrypted' / 'subdirectory' / 'subdir-asc.json.asc']
+    assert [o.status for o in sk.rekey_each([RECIPIENT, second], [secret])] == ['rekeyed']
+    assert found == [list(sk.secrets)]
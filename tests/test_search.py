@@ -0,0 +1,86 @@
+import os
+import subprocess
+
+import pytest
+
+from fidelius.dircache import DirectoryCache
+from fidelius.incantations import Fidelius
+from fidelius.utils import in_directories, in_directory
+
+from conftest import ROOT
+
+
+def test_search_excludes_directories(tmp_path):
+    for directory in ('.git', 'node_modules/package', 'secrets'):
+        (tmp_path / directory).mkdir(parents=True)
+        (tmp_path / directory / 'example.encrypted.json.asc').touch()
+
+    secrets = Fidelius(tmp_path).search()
+    assert list(secrets) == [tmp_path.resolve() / 'secrets/example.encrypted.json.asc']
+
+
+def test_search_nested_encrypted_directories(tmp_path):
+    (tmp_path / 'a.encrypted/b.encrypted').mkdir(parents=True)
+    (tmp_path / 'a.encrypted/one.json.asc').touch()
+    (tmp_path / 'a.encrypted/b.encrypted/two.json.asc').touch()
+
+    root = tmp_path.resolve()
+    secrets = Fidelius(tmp_path).search()
+    assert {e: s.decrypted for e, s in secrets.items()} == {
+        root / 'a.encrypted/one.json.asc': root / 'a/one.decrypted.json',
+        root / 'a.encrypted/b.encrypted/two.json.asc': root / 'a.encrypted/b/two.decrypted.json',
+    }
+
+
+def test_search_symlinked_files(tmp_path):
+    (tmp_path / 'store').mkdir()
+    (tmp_path / 'store/real.json.asc').touch()
+    (tmp_path / 'secrets').mkdir()
+    (tmp_path / 'secrets/link.encrypted.json.asc').symlink_to(tmp_path / 'store/real.json.asc')
+
+    root = tmp_path.resolve()
+    secrets = Fidelius(tmp_path).search()
+    assert {e: s.decrypted for e, s in secrets.items()} == {
+        root / 'store/real.json.asc': root / 'secrets/link.decrypted.json',
+    }
+
+
+def test_deprecated_helpers(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'a/b').touch()
+    with pytest.deprecated_call():
+        assert in_directory(tmp_path / 'a/b', tmp_path)
+    with pytest.deprecated_call():
+        assert not in_directories(tmp_path / 'a/b', [ROOT])
+
+
+def test_search_git_matches_filesystem():
+    assert Fidelius(ROOT, discovery='git').search() == Fidelius(ROOT).search()
+
+
+def test_search_git_skips_ignored_files(tmp_path):
+    subprocess.run(('git', 'init', '-q', str(tmp_path)), check=True)
+    (tmp_path / '.gitignore').write_text('build/\n')
+    for directory in ('build', 'secrets'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'example.encrypted.json.asc').touch()
+
+    secrets = Fidelius(tmp_path, discovery='auto').search()
+    assert list(secrets) == [tmp_path.resolve() / 'secrets/example.encrypted.json.asc']
+
+
+def test_search_cache(tmp_path):
+    (tmp_path / '.git').mkdir()
+    (tmp_path / 'secrets').mkdir()
+    (tmp_path / 'secrets' / 'one.encrypted.json.asc').touch()
+    for directory in (tmp_path, tmp_path / 'secrets'):
+        os.utime(directory, ns=(0, 0))
+
+    fidelius = Fidelius(tmp_path, cache=True)
+    assert len(fidelius.search()) == 1
+
+    cache = DirectoryCache.load(tmp_path, fidelius.exclude)
+    assert set(cache.previous) == {'.', 'secrets'}
+
+    (tmp_path / 'secrets' / 'two.encrypted.json.asc').touch()
+    assert len(fidelius.search()) == 2
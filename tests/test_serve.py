@@ -0,0 +1,87 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from fidelius.daemon import Client, Server, default_socket
+from fidelius.incantations import Fidelius
+from fidelius.utils import FideliusException
+
+
+@pytest.fixture()
+def client(sk, tmp_path):
+    with Server(tmp_path / 'fidelius.sock', sk) as server:
+        server.warm()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = Client(server.path)
+        yield client
+        client.close()
+        server.shutdown()
+        thread.join()
+
+
+def test_serve_list(client):
+    assert ('files.encrypted/dir-asc-short.json.asc', 'files/dir-asc-short.decrypted.json') \
+        in client.list()
+
+
+def test_serve_get(client, gpg, tmp_path):
+    assert client.get('files/dir-asc-short.decrypted.json').startswith(b'{')
+
+    gpg.encrypt_text(
+        path=tmp_path / 'files.encrypted/dir-asc-short.json.asc',
+        text='changed',
+        armour=True,
+        recipients=['fidelius@example.invalid'])
+    assert client.get('files.encrypted/dir-asc-short.json.asc') == b'changed'
+
+
+def test_serve_missing(client):
+    with pytest.raises(FideliusException, match='No secret named'):
+        client.get('missing.json')
+
+
+def test_serve_socket_permissions(client):
+    assert client.path.stat().st_mode & 0o777 == 0o600
+
+
+def test_serve_refuses_a_running_daemon(client, gpg, tmp_path):
+    with pytest.raises(FideliusException, match='already listening'):
+        Server(client.path, Fidelius(tmp_path).cast(gpg=gpg))
+    assert client.list()
+
+
+def test_serve_replaces_a_stale_socket(gpg, tmp_path):
+    path = tmp_path / 'fidelius.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(path.as_posix())
+    with Server(path, Fidelius(tmp_path).cast(gpg=gpg)):
+        assert path.exists()
+
+
+def test_serve_refuses_other_files(gpg, tmp_path):
+    path = tmp_path / 'fidelius.sock'
+    path.write_text('not a socket')
+    with pytest.raises(FideliusException, match='not a socket'):
+        Server(path, Fidelius(tmp_path).cast(gpg=gpg))
+    assert path.read_text() == 'not a socket'
+
+
+def test_default_socket_needs_a_private_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', tmp_path.as_posix())
+    assert default_socket(tmp_path).parent.stat().st_mode & 0o777 == 0o700
+
+    (tmp_path / f'fidelius-{os.getuid()}').chmod(0o755)
+    with pytest.raises(FideliusException, match='other users'):
+        default_socket(tmp_path)
+
+
+def test_serve_needs_a_private_directory(sk, tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    with pytest.raises(FideliusException, match='other users'):
+        Server(shared / 'fidelius.sock', sk)
+    assert not (shared / 'fidelius.sock').exists()
@@ -0,0 +1,56 @@
+import pytest
+
+from fidelius.incantations import Fidelius
+from fidelius.secrets import Secret, SecretKeeper
+from fidelius.shards import Shard, bucket
+
+from conftest import ROOT
+
+
+@pytest.fixture()
+def sk():
+    return Fidelius(ROOT).cast()
+
+
+def test_parse():
+    assert Shard.parse('2/4') == Shard(2, 4)
+    for value in ('0/4', '5/4', '1/0', '1', 'a/b', '-1/2'):
+        with pytest.raises(ValueError):
+            Shard.parse(value)
+
+
+@pytest.mark.parametrize('weighted', [False, True], ids=['hashed', 'weighted'])
+def test_shards_cover_every_secret_once(sk, weighted):
+    shards = [sk.select((), shard=Shard(i, 3), weighted=weighted) for i in (1, 2, 3)]
+    selected = [s for shard in shards for s in shard]
+    assert sorted(selected, key=lambda s: s.encrypted) == list(sk)
+    assert all(shard == sk.select((), shard=Shard(i, 3), weighted=weighted)
+               for i, shard in zip((1, 2, 3), shards))
+
+
+def test_hashed_shards_are_stable():
+    names = [f'secrets/{i}.encrypted.json.asc' for i in range(1000)]
+    before = {name: bucket(name, 4) for name in names}
+    assert {name: bucket(name, 4) for name in names[::2]} == {n: before[n] for n in names[::2]}
+    assert all(200 < list(before.values()).count(i) < 300 for i in range(4))
+
+
+def test_weighted_shards_are_balanced(tmp_path):
+    secrets = {}
+    for i in range(40):
+        encrypted = tmp_path / f'{i}.encrypted.bin.gpg'
+        encrypted.write_bytes(b'x' * (1000 if i < 4 else 10))
+        secrets[encrypted] = Secret(encrypted=encrypted, decrypted=tmp_path / f'{i}.decrypted.bin')
+    sk = SecretKeeper(secrets, directory=tmp_path)
+
+    shards = [sk.select((), shard=Shard(i, 4), weighted=True) for i in (1, 2, 3, 4)]
+    sizes = [sum(s.encrypted.stat().st_size for s in shard) for shard in shards]
+    assert sum(sizes) == 4 * 1000 + 36 * 10
+    assert max(sizes) - min(sizes) <= 10
+
+
+def test_cli(invoke):
+    everything = invoke(['ls'])
+    shards = [invoke(['ls', '--shard', f'{i}/2']) for i in (1, 2)]
+    assert sorted(shards[0] + shards[1]) == sorted(everything)
+    assert not set(shards[0]) & set(shards[1])
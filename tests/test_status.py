@@ -0,0 +1,66 @@
+import json
+import os
+
+from fidelius.incantations import Fidelius
+
+from conftest import RECIPIENT
+
+NAME = 'dir-asc-short.decrypted.json'
+
+
+def statuses(sk):
+    return {o.secret.decrypted.name: o.status for o in sk.status_each(jobs=4)}
+
+
+def test_missing(sk):
+    assert set(statuses(sk).values()) == {'missing'}
+
+
+def test_in_sync(sk, monkeypatch):
+    sk.decrypt()
+
+    def stream(self, gpg):
+        raise AssertionError(f"{self} was decrypted")
+
+    monkeypatch.setattr('fidelius.secrets.Secret.stream', stream)
+    assert set(statuses(sk).values()) == {'in-sync'}
+
+
+def test_plaintext_modified(sk, tmp_path):
+    sk.decrypt()
+    (tmp_path / 'files' / NAME).write_text('edited')
+    assert statuses(sk)[NAME] == 'plaintext-modified'
+
+
+def test_ciphertext_newer(gpg, sk, tmp_path):
+    sk.decrypt()
+    secret = next(s for s in sk if s.decrypted.name == NAME)
+    gpg.encrypt_text(secret.encrypted, 'pulled', True, [RECIPIENT])
+    assert statuses(sk)[NAME] == 'ciphertext-newer'
+
+
+def test_conflict(gpg, sk, tmp_path):
+    sk.decrypt()
+    secret = next(s for s in sk if s.decrypted.name == NAME)
+    gpg.encrypt_text(secret.encrypted, 'pulled', True, [RECIPIENT])
+    secret.decrypted.write_text('edited')
+    assert statuses(sk)[NAME] == 'conflict'
+
+
+def test_without_manifest(gpg, sk, tmp_path):
+    sk.decrypt()
+    secret = next(s for s in sk if s.decrypted.name == NAME)
+    secret.decrypted.write_text('edited')
+    os.utime(secret.encrypted, ns=(0, 0))
+
+    # The manifest isn't saved outside of a git repository.
+    fresh = Fidelius(tmp_path).cast(gpg=gpg)
+    result = statuses(fresh)
+    assert result.pop(NAME) == 'plaintext-modified'
+    assert set(result.values()) == {'in-sync'}
+
+
+def test_status_command(invoke):
+    output = json.loads('\n'.join(invoke(['status', '--json'])))
+    assert len(output) == 8
+    assert {entry['status'] for entry in output} <= {'missing', 'in-sync'}
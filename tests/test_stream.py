@@ -0,0 +1,123 @@
+import subprocess
+import threading
+
+import click.testing
+import pytest
+
+import fidelius.cli
+from fidelius.incantations import Fidelius
+from fidelius.utils import FideliusException, batches, concurrently
+
+from conftest import wait_for
+
+
+@pytest.fixture()
+def repository(copied, tmp_path):
+    subprocess.run(('git', 'init', '-q', tmp_path.as_posix()), check=True)
+    (tmp_path / '.gitignore').write_text('/files/\n')
+    return tmp_path
+
+
+def test_batches_grow():
+    sizes = [len(batch) for batch in batches(iter(range(100)), jobs=2, size=8)]
+    assert sizes[:4] == [1, 1, 2, 3]
+    assert max(sizes) == 8
+    assert sum(sizes) == 100
+
+
+def test_concurrently_starts_before_items_end():
+    started = threading.Event()
+
+    def items():
+        yield 'first'
+        # The first item is worked on before the rest have been produced.
+        assert started.wait(timeout=10)
+        yield 'second'
+
+    def work(item):
+        started.set()
+        return item.upper()
+
+    assert list(concurrently(work, items(), jobs=2)) == ['FIRST', 'SECOND']
+
+
+def test_discover_matches_search(repository):
+    fidelius = Fidelius(repository)
+    secrets = list(fidelius.discover())
+    assert [s.encrypted for s in secrets] == list(fidelius.search())
+
+
+def test_discover_checks_gitignore(repository):
+    (repository / 'other.encrypted.json.asc').touch()
+    found = []
+    with pytest.raises(FideliusException, match="other.decrypted.json"):
+        for secret in Fidelius(repository).discover():
+            found.append(secret)
+    assert all(s.decrypted.name != 'other.decrypted.json' for s in found)
+
+
+def test_stream_keeps_secrets_after_a_full_search(repository):
+    sk = Fidelius(repository).cast_lazily()
+    stream = sk.stream()
+    first = next(stream).encrypted
+    stream.close()
+    assert sk.secrets.source is not None
+
+    # Only a search that finishes is kept, and the next stream doesn't search again.
+    streamed = [s.encrypted for s in sk.stream()]
+    assert streamed[0] == first
+    assert sk.secrets.source is None
+    assert [s.encrypted for s in sk] == streamed
+    assert [s.encrypted for s in sk.stream()] == streamed
+
+
+def test_decrypt_while_searching(gpg, repository):
+    sk = Fidelius(repository).cast_lazily(gpg=gpg)
+    overlapped = []
+
+    def secrets():
+        stream = sk.stream()
+        first = next(stream)
+        yield first
+        overlapped.append(wait_for(first.decrypted.exists))
+        yield from stream
+
+    outcomes = list(sk.decrypt_each(secrets(), jobs=2))
+    assert overlapped == [True]
+    assert {o.status for o in outcomes} == {'decrypted'}
+    assert len(outcomes) == 6
+
+
+def test_cli_decrypt_checks_each_batch(backend, gnupghome, repository):
+    (repository / 'other.encrypted.json.asc').touch()
+    result = click.testing.CliRunner().invoke(fidelius.cli.main, (
+        '-p', repository.as_posix(), '--backend', backend, '--homedir', gnupghome.as_posix(),
+        'decrypt'))
+    assert result.exit_code != 0
+    assert 'other.decrypted.json' in result.output
+    assert not (repository / 'other.decrypted.json').exists()
+
+
+def test_cli_decrypt_while_searching(backend, gnupghome, repository, monkeypatch):
+    walk, overlapped = Fidelius.walk, []
+
+    def slow_walk(self):
+        pairs = walk(self)
+        first = next(pairs)
+        yield first
+        overlapped.append(wait_for(first[1].exists))
+        yield from pairs
+
+    monkeypatch.setattr(Fidelius, 'walk', slow_walk)
+    result = click.testing.CliRunner().invoke(fidelius.cli.main, (
+        '-p', repository.as_posix(), '--backend', backend, '--homedir', gnupghome.as_posix(),
+        'decrypt'))
+    assert result.exit_code == 0, result.output
+    assert overlapped == [True]
+    assert len(list((repository / 'files').rglob('*.json'))) == 6
+
+
+def test_cli_decrypt(invoke):
+    lines = invoke(['decrypt', '--force'])
+    assert len(lines) == 8
+    assert lines == sorted(lines, key=lambda line: line.split(' to ')[0].split('/'))
@@ -0,0 +1,87 @@
+import json
+import time
+
+from fidelius import timings
+from fidelius.gpg import GPG
+from fidelius.incantations import Fidelius
+
+from conftest import ROOT
+
+
+def test_listener(gpg):
+    recorder = timings.Recorder()
+    timings.listen(recorder)
+    try:
+        sk = Fidelius(ROOT).cast(gpg=gpg)
+        sk.run_gitignore_check()
+        sk.decrypt(force=True)
+    finally:
+        timings.ignore(recorder)
+
+    names = {span.name for span in recorder.spans}
+    assert {'search', 'gitignore', 'decrypt'} <= names
+    search = next(span for span in recorder.spans if span.name == 'search')
+    assert search.attributes['secrets'] == len(sk.secrets)
+
+
+def test_gpg_file_spans(gnupghome):
+    recorder = timings.Recorder()
+    timings.listen(recorder)
+    try:
+        Fidelius(ROOT).cast(gpg=GPG(home=gnupghome)).decrypt(force=True, jobs=1)
+    finally:
+        timings.ignore(recorder)
+
+    files = [span for span in recorder.spans if span.name == 'gpg.file']
+    assert len(files) == 8
+    assert all(span.duration > 0 for span in files)
+
+
+def test_timed_does_not_count_the_caller():
+    recorder = timings.Recorder()
+    timings.listen(recorder)
+    try:
+        for _ in timings.timed('items', range(3), count='items'):
+            time.sleep(0.1)
+    finally:
+        timings.ignore(recorder)
+
+    span, = recorder.spans
+    assert span.attributes == {'items': 3}
+    assert span.duration < 0.1
+
+
+def test_decrypt_does_not_count_the_caller(gpg):
+    sk = Fidelius(ROOT).cast(gpg=gpg)
+    recorder = timings.Recorder()
+    timings.listen(recorder)
+    try:
+        secrets = sk.select([ROOT / 'files/file-asc.encrypted.json.asc'])
+        for _ in sk.decrypt_each(secrets, force=True):
+            time.sleep(1)
+    finally:
+        timings.ignore(recorder)
+
+    decrypt, = [span for span in recorder.spans if span.name == 'decrypt']
+    assert decrypt.attributes['secrets'] == 1
+    assert decrypt.duration < 1
+
+
+def test_no_listener():
+    with timings.span('unused') as attributes:
+        attributes['count'] = 1
+    assert not timings.enabled()
+
+
+def test_timings_option(invoke):
+    output = invoke(['--timings', 'ls'])
+    assert any(line.startswith('search ') for line in output)
+    assert any(line.startswith('elapsed ') for line in output)
+
+
+def test_trace_option(invoke, tmp_path):
+    trace = tmp_path / 'trace.json'
+    invoke(['--trace', trace.as_posix(), 'decrypt'])
+    events = json.loads(trace.read_text())['traceEvents']
+    assert {'search', 'gitignore', 'decrypt'} <= {e['name'] for e in events}
+    assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
@@ -0,0 +1,16 @@
+import pkg_resources
+import pytest
+
+import fidelius
+
+
+def test_version(invoke):
+    assert invoke(['version']) == [f'fidelius {fidelius.__version__}']
+
+
+def test_version_matches_installed_package(invoke):
+    try:
+        installed = pkg_resources.get_distribution('fidelius').version
+    except pkg_resources.DistributionNotFound:
+        pytest.skip("fidelius is not installed")
+    assert invoke(['version']) == [f'fidelius {installed}']
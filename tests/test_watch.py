@@ -0,0 +1,101 @@
+import shutil
+import subprocess
+
+import pytest
+
+from fidelius.incantations import Fidelius
+from fidelius.watch import Inotify, Poller, Watch
+
+from conftest import RECIPIENT, ROOT
+
+
+@pytest.fixture(params=['inotify', 'poll'])
+def monitor(request):
+    if request.param == 'poll':
+        return Poller(interval=0.05)
+    try:
+        return Inotify()
+    except OSError:
+        pytest.skip("inotify is not available")
+
+
+@pytest.fixture()
+def watch(gpg, copied, tmp_path, monitor):
+    yield from watching(gpg, tmp_path, monitor, Fidelius(tmp_path))
+
+
+@pytest.fixture()
+def watch_excluding(gpg, copied, tmp_path, monitor):
+    yield from watching(gpg, tmp_path, monitor, Fidelius(tmp_path, exclude={'.git', 'vendor'}))
+
+
+def watching(gpg, tmp_path, monitor, fidelius):
+    subprocess.run(('git', 'init', '-q', tmp_path.as_posix()), check=True)
+    (tmp_path / '.gitignore').write_text('*.decrypted.*\n/files/\n/new/\n')
+
+    sk = fidelius.cast(gpg=gpg)
+    sk.decrypt()
+    watch = Watch(sk, [RECIPIENT], monitor=monitor, fidelius=fidelius, delay=0.1, jobs=2)
+    watch.start()
+    yield watch
+    watch.close()
+
+
+def sync(watch):
+    return {(o.secret.decrypted.name, o.status) for o in watch.sync(watch.collect(timeout=5))}
+
+
+def test_encrypt_changed_plaintext(gpg, watch, tmp_path):
+    plaintext = tmp_path / 'files' / 'dir-asc-short.decrypted.json'
+    plaintext.write_text('{"changed": true}\n')
+
+    assert sync(watch) == {('dir-asc-short.decrypted.json', 'encrypted')}
+    secret = watch.decrypted[plaintext]
+    assert secret.contents(gpg) == '{"changed": true}\n'
+
+    # The new ciphertext is recognised as matching the plaintext.
+    assert sync(watch) == {('dir-asc-short.decrypted.json', 'skipped')}
+
+
+def test_decrypt_changed_ciphertext(gpg, watch, tmp_path):
+    secret = watch.decrypted[tmp_path / 'files' / 'dir-gpg-short.decrypted.json']
+    gpg.encrypt_text(secret.encrypted, '{"pulled": true}\n', False, [RECIPIENT])
+
+    assert sync(watch) == {('dir-gpg-short.decrypted.json', 'decrypted')}
+    assert secret.decrypted.read_text() == '{"pulled": true}\n'
+
+
+def test_decrypt_new_secret(watch, tmp_path):
+    (tmp_path / 'new.encrypted').mkdir()
+    shutil.copy(ROOT / 'files.encrypted' / 'dir-asc-short.json.asc',
+                tmp_path / 'new.encrypted' / 'added.json.asc')
+
+    assert sync(watch) == {('added.decrypted.json', 'decrypted')}
+    assert (tmp_path / 'new' / 'added.decrypted.json').exists()
+
+
+def test_ignore_new_plain_file(watch, tmp_path):
+    (tmp_path / 'files.encrypted' / 'notes.txt').write_text('not a secret')
+    shutil.copy(ROOT / 'files.encrypted' / 'dir-asc-short.json.asc',
+                tmp_path / 'files.encrypted' / 'added.json.asc')
+
+    assert sync(watch) == {('added.decrypted.json', 'decrypted')}
+    assert tmp_path / 'files.encrypted' / 'notes.txt' not in watch.secret_keeper.secrets
+
+
+def test_new_secrets_use_the_same_rules(watch_excluding, tmp_path):
+    (tmp_path / 'vendor').mkdir()
+    shutil.copy(ROOT / 'files.encrypted' / 'dir-asc-short.json.asc',
+                tmp_path / 'vendor' / 'added.encrypted.json.asc')
+
+    assert sync(watch_excluding) == set()
+    assert not (tmp_path / 'vendor' / 'added.decrypted.json').exists()
+
+
+def test_conflict(gpg, watch, tmp_path):
+    secret = watch.decrypted[tmp_path / 'files' / 'dir-asc-long.decrypted.json']
+    secret.decrypted.write_text('edited')
+    gpg.encrypt_text(secret.encrypted, 'pulled', True, [RECIPIENT])
+
+    assert sync(watch) == set()
+    assert secret.decrypted.read_text() == 'edited'